@@ -0,0 +1,516 @@
+import hashlib
+import json
+import os
+import queue
+import signal
+import socket
+import stat
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+import _thread
+
+import colorama
+from colorama import Fore, Style
+
+from gits import lean_cache
+from gits.config import CONFIG_PATH, MAIN_PATH, show_number_config
+from conf import config
+
+# gis agent：常驻本机的后台进程，持有已认证的 SSH 连接、服务器包列表和 dep_tree 缓存。
+# 客户端通过 Unix 域套接字把命令行、工作目录、环境变量和自己的 stdin/stdout/stderr 文件描述符交给它，
+# 命令在 agent 进程内执行，输出直接写到调用者的终端或管道，效果与本地执行相同。
+# 套接字放在只有当前用户可访问（0700）的目录中，连接双方还会核对对方的 uid。
+AGENT_DIR_NAME = "gis"
+AGENT_LOG_NAME = "agent.log"
+AGENT_IDLE_TIMEOUT = 1800
+# 内存中的服务器包列表超过该时间后，下一个请求重新加载（增量刷新）
+AGENT_CACHE_TTL = 120
+AGENT_START_TIMEOUT = 10
+# 设置该环境变量时不经过 agent，直接在当前进程执行
+NO_AGENT_ENV = "GIS_NO_AGENT"
+# agent 执行命令时设置，子进程中再次调用的 gis 凭此识别为嵌套请求，不等待外层请求结束
+TOKEN_ENV = "GIS_AGENT_TOKEN"
+MESSAGE_LIMIT = 1024 * 1024
+
+# 经过 agent 执行的命令：都是访问 lean 服务器或由 lean 流程以子进程方式调用的命令
+AGENT_COMMANDS = ('status', 'check', 'import', 'lean')
+# 只在 lean 流程以子进程方式调用（带 GIS_AGENT_TOKEN）时转发的命令；用户直接执行时在当前进程执行
+NESTED_COMMANDS = ('export', 'add', 'new-obj', 'delete')
+
+
+def is_supported():
+    """需要 Unix 域套接字和 SCM_RIGHTS 传递文件描述符，Windows 上不可用"""
+    return hasattr(socket, 'AF_UNIX') and hasattr(socket, 'send_fds')
+
+
+def agent_dir():
+    """
+    套接字所在的目录：XDG_RUNTIME_DIR/gis，没有时为临时目录下的 gis-<uid>。
+    目录必须是当前用户拥有、其他用户不可访问的真实目录（不是符号链接），否则抛出 PermissionError。
+    """
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir and os.path.isdir(runtime_dir):
+        path = os.path.join(runtime_dir, AGENT_DIR_NAME)
+    else:
+        path = os.path.join(tempfile.gettempdir(), f"{AGENT_DIR_NAME}-{os.getuid()}")
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid():
+        raise PermissionError(f"{path} is not a directory owned by the current user")
+    if stat.S_IMODE(st.st_mode) & 0o077:
+        os.chmod(path, 0o700)
+    return path
+
+
+def socket_path():
+    # 每个 gis 安装（配置文件）一个 agent；目录名很短，不会超过 sockaddr_un 的路径长度限制
+    key = hashlib.sha256(CONFIG_PATH.encode('utf-8')).hexdigest()[:12]
+    return os.path.join(agent_dir(), f"agent-{key}.sock")
+
+
+def _peer_uid(sock):
+    """连接另一端进程的 uid；平台不支持 SO_PEERCRED 时返回 None，此时只能依靠 0700 目录保证对方属于当前用户"""
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return None
+    creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+    return struct.unpack('3i', creds)[1]
+
+
+def _config_mtime():
+    try:
+        return os.path.getmtime(CONFIG_PATH)
+    except OSError:
+        return None
+
+
+def _send_message(sock, message, fds=None):
+    data = json.dumps(message).encode('utf-8') + b'\n'
+    if fds:
+        # 请求中带有调用者的环境变量，一次 sendmsg 不一定能发完
+        sent = socket.send_fds(sock, [data], fds)
+        if sent < len(data):
+            sock.sendall(data[sent:])
+    else:
+        sock.sendall(data)
+
+
+def _read_message(sock, buffer=b''):
+    while b'\n' not in buffer:
+        chunk = sock.recv(65536)
+        if not chunk:
+            return None
+        buffer += chunk
+        if len(buffer) > MESSAGE_LIMIT:
+            return None
+    return json.loads(buffer.split(b'\n', 1)[0].decode('utf-8'))
+
+
+def _connect(timeout=None):
+    """连接 agent；套接字或监听进程不属于当前用户时抛出 PermissionError，不会向其发送任何数据"""
+    path = socket_path()
+    st = os.lstat(path)
+    if not stat.S_ISSOCK(st.st_mode) or st.st_uid != os.getuid():
+        raise PermissionError(f"{path} is not a socket owned by the current user")
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.settimeout(None)
+        uid = _peer_uid(sock)
+        if uid is not None and uid != os.getuid():
+            raise PermissionError(f"the process listening on {path} does not belong to the current user")
+        return sock
+    except OSError:
+        sock.close()
+        raise
+
+
+def _control(command, timeout=5):
+    """发送 ping / stop 等控制消息，agent 没有运行时返回 None"""
+    if not is_supported():
+        return None
+    try:
+        with _connect(timeout) as sock:
+            sock.settimeout(timeout)
+            _send_message(sock, {'control': command})
+            return _read_message(sock)
+    except (OSError, ValueError):
+        return None
+
+
+def should_forward(args):
+    """lean 相关的命令才交给 agent；update 只转发纯 lean 更新（--dep 需要操作 git 仓库，收益很小）"""
+    if args.command == 'update':
+        return bool(args.lean) and not args.dep
+    if args.command == 'status':
+        return bool(args.lean)
+    if args.command == 'lean':
+        # gis lean serve 是长期运行的服务，不能占住 agent
+        return args.argument != 'serve'
+    if args.command in NESTED_COMMANDS:
+        return bool(os.environ.get(TOKEN_ENV))
+    return args.command in AGENT_COMMANDS
+
+
+def forward(args, argv):
+    """
+    agent 在运行时把命令交给它执行，返回退出码；返回 None 表示应在当前进程执行
+    （agent 未运行、平台不支持、设置了 GIS_NO_AGENT，agent 正在执行其他请求，或因版本、配置变化拒绝了请求）。
+    """
+    if not is_supported() or os.environ.get(NO_AGENT_ENV) or not should_forward(args):
+        return None
+    try:
+        sock = _connect(timeout=2)
+    except PermissionError as e:
+        print(Fore.YELLOW + f"Warning: Not using gis agent: {e}" + Style.RESET_ALL, file=sys.stderr)
+        return None
+    except OSError:
+        return None
+    with sock:
+        request = {'argv': list(argv), 'cwd': os.getcwd(), 'env': dict(os.environ),
+                   'token': os.environ.get(TOKEN_ENV), 'version': config.VERSION}
+        try:
+            _send_message(sock, request, [0, 1, 2])
+            reply = _read_message(sock)
+        except KeyboardInterrupt:
+            # 关闭连接后 agent 中断正在执行的命令
+            return 130
+        except (OSError, ValueError):
+            return None
+    if reply is None or reply.get('fallback'):
+        return None
+    return reply.get('exit', 1)
+
+
+class AgentServer:
+    """
+    gis agent 的服务端。顶层请求在主线程中逐个执行（命令会修改工作目录和标准输入输出），
+    已有请求在执行时让新的顶层请求回退到调用者自己的进程执行，而不是无提示地排队等待；
+    调用者断开连接时用 KeyboardInterrupt 中断主线程中的命令，恢复文件描述符等状态期间不会被中断。
+    命令执行期间以子进程方式再次调用的 gis（gis import / check / export / add）携带 GIS_AGENT_TOKEN，
+    在连接线程中直接执行，此时外层请求正阻塞在 subprocess.run 中；外层请求等嵌套请求结束后才恢复状态。
+    """
+
+    def __init__(self, dispatch, idle_timeout=AGENT_IDLE_TIMEOUT, cache_ttl=AGENT_CACHE_TTL):
+        self.dispatch = dispatch
+        self.idle_timeout = idle_timeout
+        self.cache_ttl = cache_ttl
+        self.started = time.time()
+        self.requests = 0
+        self._config_mtime = _config_mtime()
+        self._queue = queue.Queue()
+        self._stopping = threading.Event()
+        self._state_lock = threading.Lock()
+        self._nested_done = threading.Condition(self._state_lock)
+        self._active_tokens = set()
+        self._running = None
+        # 已接受（排队或正在执行）的顶层请求数和正在执行的嵌套请求数
+        self._pending = 0
+        self._nested = 0
+        # 只有顶层请求的命令正在执行时，调用者断开才会中断主线程
+        self._interruptible = False
+        self._last_activity = time.monotonic()
+
+    def _status(self):
+        from gits import lean
+        status = {'pid': os.getpid(), 'uptime': int(time.time() - self.started), 'requests': self.requests,
+                  'idle_timeout': self.idle_timeout, 'cache_ttl': self.cache_ttl}
+        status.update(lean.session_summary())
+        return status
+
+    def _stale_reason(self, request):
+        if request.get('version') != config.VERSION:
+            return f"client version {request.get('version')} differs from agent version {config.VERSION}"
+        if _config_mtime() != self._config_mtime:
+            return "the configuration changed"
+        return None
+
+    def _on_interrupt(self, signum, frame):
+        """主线程的 SIGINT 处理函数：每个顶层请求至多中断一次，状态恢复期间到达的中断被忽略"""
+        if self._interruptible:
+            self._interruptible = False
+            raise KeyboardInterrupt
+
+    def _run_request(self, request, fds, nested=False):
+        """
+        把调用者的文件描述符换到 0/1/2、切换到调用者的工作目录和环境变量后执行命令，返回退出码。
+        嵌套请求执行时外层请求还没有结束，不能清空外层正在使用的请求级缓存。
+        0/1/2、工作目录和环境变量是整个进程共享的：顶层请求先停止接受中断，
+        再等待仍在执行的嵌套请求（外层被中断时它们可能还没结束）恢复完，最后恢复自己的状态。
+        """
+        from gits import lean
+        saved_fds = [os.dup(fd) for fd in (0, 1, 2)]
+        saved_cwd = os.getcwd()
+        saved_env = dict(os.environ)
+        token = uuid.uuid4().hex
+        code = 0
+        if nested:
+            with self._state_lock:
+                self._nested += 1
+        sys.stdout.flush()
+        sys.stderr.flush()
+        try:
+            for target, fd in zip((0, 1, 2), fds):
+                os.dup2(fd, target)
+            # 重新判断输出是否为终端，决定是否保留颜色，与本地执行一致
+            colorama.deinit()
+            colorama.init()
+            os.chdir(request['cwd'])
+            # 子进程（git、cmake、嵌套的 gis）使用调用者的 PATH 和 GIS_* 等环境变量
+            if request.get('env') is not None:
+                os.environ.clear()
+                os.environ.update(request['env'])
+            with self._state_lock:
+                self._active_tokens.add(token)
+            os.environ[TOKEN_ENV] = token
+            if not nested:
+                lean.reset_request_caches(self.cache_ttl)
+                self._interruptible = True
+            self.dispatch(request['argv'])
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        except KeyboardInterrupt:
+            code = 130
+        except Exception:
+            traceback.print_exc()
+            code = 1
+        finally:
+            if not nested:
+                self._interruptible = False
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+            except (OSError, ValueError):
+                pass
+            with self._state_lock:
+                self._active_tokens.discard(token)
+                if not nested:
+                    self._nested_done.wait_for(lambda: not self._nested)
+            os.environ.clear()
+            os.environ.update(saved_env)
+            for target, fd in zip((0, 1, 2), saved_fds):
+                os.dup2(fd, target)
+                os.close(fd)
+            for fd in fds:
+                os.close(fd)
+            try:
+                os.chdir(saved_cwd)
+            except OSError:
+                os.chdir(MAIN_PATH)
+            colorama.deinit()
+            with self._state_lock:
+                if nested:
+                    self._nested -= 1
+                    self._nested_done.notify_all()
+                self.requests += 1
+            self._last_activity = time.monotonic()
+        return code
+
+    def _reply(self, conn, message):
+        try:
+            _send_message(conn, message)
+        except OSError:
+            pass
+        finally:
+            conn.close()
+
+    def _handle_connection(self, conn):
+        try:
+            uid = _peer_uid(conn)
+        except OSError:
+            uid = None
+        if uid is not None and uid != os.getuid():
+            conn.close()
+            return
+        try:
+            data, fds, _, _ = socket.recv_fds(conn, 65536, 3)
+            request = _read_message(conn, data) if data else None
+        except (OSError, ValueError):
+            conn.close()
+            return
+        if request is None:
+            for fd in fds: os.close(fd)
+            conn.close()
+            return
+
+        control = request.get('control')
+        if control:
+            for fd in fds: os.close(fd)
+            if control == 'stop':
+                self._stopping.set()
+                self._reply(conn, {'stopped': True})
+            else:
+                self._reply(conn, self._status())
+            return
+
+        reason = self._stale_reason(request)
+        if reason or len(fds) != 3:
+            for fd in fds: os.close(fd)
+            self._reply(conn, {'fallback': True, 'reason': reason})
+            if reason:
+                # 配置或版本已变化，退出后由下一次 gis agent start 以新配置启动
+                self._stopping.set()
+            return
+
+        with self._state_lock:
+            nested = request.get('token') in self._active_tokens
+            busy = not nested and self._pending > 0
+            if not nested and not busy:
+                self._pending += 1
+        if nested:
+            self._reply(conn, {'exit': self._run_request(request, fds, nested=True)})
+        elif busy:
+            for fd in fds: os.close(fd)
+            self._reply(conn, {'fallback': True, 'reason': "another request is running"})
+        else:
+            self._queue.put((conn, request, fds))
+
+    def _accept_loop(self, server):
+        server.settimeout(1.0)
+        while not self._stopping.is_set():
+            try:
+                conn, _ = server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            conn.settimeout(None)
+            threading.Thread(target=self._handle_connection, args=(conn,), daemon=True).start()
+
+    def _watch_caller(self, conn, request_id):
+        """调用者断开（Ctrl+C）时中断主线程中正在执行的命令"""
+        try:
+            while conn.recv(4096):
+                pass
+        except OSError:
+            pass
+        with self._state_lock:
+            if self._running == request_id:
+                _thread.interrupt_main()
+
+    def serve(self, server):
+        signal.signal(signal.SIGINT, self._on_interrupt)
+        threading.Thread(target=self._accept_loop, args=(server,), daemon=True).start()
+        while not self._stopping.is_set():
+            try:
+                try:
+                    conn, request, fds = self._queue.get(timeout=1.0)
+                except queue.Empty:
+                    if self.idle_timeout and time.monotonic() - self._last_activity > self.idle_timeout:
+                        break
+                    continue
+                request_id = uuid.uuid4().hex
+                with self._state_lock:
+                    self._running = request_id
+                threading.Thread(target=self._watch_caller, args=(conn, request_id), daemon=True).start()
+                code = self._run_request(request, fds)
+                with self._state_lock:
+                    self._running = None
+                    self._pending -= 1
+                self._reply(conn, {'exit': code})
+            except KeyboardInterrupt:
+                # 命令刚结束时才到达的中断，忽略
+                continue
+
+
+def serve(dispatch):
+    """gis agent run：在前台运行 agent，dispatch(argv) 执行一条 gis 命令行"""
+    if not is_supported():
+        print(Fore.RED + "gis agent needs Unix domain sockets with descriptor passing, "
+                         "which this platform does not provide." + Style.RESET_ALL)
+        return False
+    if _control('ping'):
+        print("gis agent is already running.")
+        return False
+
+    try:
+        path = socket_path()
+    except OSError as e:
+        print(Fore.RED + f"Error: {e}" + Style.RESET_ALL)
+        return False
+    if os.path.lexists(path):
+        os.remove(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o077)
+    try:
+        server.bind(path)
+    finally:
+        os.umask(old_umask)
+    server.listen(16)
+
+    agent = AgentServer(dispatch, show_number_config("lean_agent_idle_timeout", AGENT_IDLE_TIMEOUT, minimum=0),
+                        show_number_config("lean_agent_cache_ttl", AGENT_CACHE_TTL, minimum=0))
+    colorama.deinit()
+    print(f"gis agent {os.getpid()} listening on {path}", flush=True)
+    try:
+        agent.serve(server)
+    finally:
+        server.close()
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        print(f"gis agent {os.getpid()} stopped after {agent.requests} requests", flush=True)
+    return True
+
+
+def start_agent():
+    """在后台启动 agent 并等待它开始监听"""
+    if not is_supported():
+        print(Fore.YELLOW + "gis agent is not supported on this platform." + Style.RESET_ALL)
+        return False
+    status = _control('ping')
+    if status:
+        print(f"gis agent is already running (pid {status['pid']}).")
+        return True
+
+    if getattr(sys, 'frozen', False):
+        command = [sys.executable, 'agent', 'run']
+    else:
+        command = [sys.executable, os.path.join(MAIN_PATH, 'main.py'), 'agent', 'run']
+    env = {key: value for key, value in os.environ.items() if key != TOKEN_ENV}
+    with open(lean_cache.cache_path(AGENT_LOG_NAME), 'ab') as log:
+        subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=log, stderr=log, cwd=MAIN_PATH, env=env,
+                         start_new_session=True)
+
+    deadline = time.monotonic() + AGENT_START_TIMEOUT
+    while time.monotonic() < deadline:
+        status = _control('ping')
+        if status:
+            print(f"gis agent started (pid {status['pid']}), idle timeout {status['idle_timeout']}s.")
+            return True
+        time.sleep(0.1)
+    print(Fore.RED + f"gis agent did not start, see {lean_cache.cache_path(AGENT_LOG_NAME)}" + Style.RESET_ALL)
+    return False
+
+
+def stop_agent():
+    if _control('stop') is None:
+        print("gis agent is not running.")
+        return False
+    print("gis agent stopped.")
+    return True
+
+
+def print_agent_status():
+    status = _control('ping')
+    if status is None:
+        print("gis agent is not running.")
+        return False
+    print(f"gis agent: pid {status['pid']}, up {status['uptime']}s, {status['requests']} requests served")
+    print(f"Lean server: {status['connection']}" +
+          (f", remote path {status['remote_path']}" if status.get('remote_path') else ""))
+    if status.get('server_cache_age') is not None:
+        print(f"Server listing: {status['server_scopes']} cached scopes, {status['server_cache_age']}s old "
+              f"(reloaded after {status['cache_ttl']}s)")
+    print(f"Idle timeout: {status['idle_timeout']}s")
+    return True
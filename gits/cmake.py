@@ -394,15 +394,11 @@ def import_dep_lean(args):
         else:
             # 本地不存在，进入情况 3 和 4 的判断
             print(f"The 'lean' package '{args.argument}' is not available locally. Checking the remote server...")
+            found_server = False
             try:
-                # 创建 SSH 客户端并连接
-                ssh = paramiko.SSHClient()
-                ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())  # 自动接受未知主机密钥
-                ssh.connect(gits.lean.lean_remote_ip, username=gits.lean.lean_remote_user,
-                            password=gits.lean.lean_remote_pwd)
-                # 创建 SFTP 会话
-
-                with ssh.open_sftp() as sftp:
+                # 复用 lean 的服务器会话（SFTP 或本地挂载的 lean_remote_path）
+                sftp = gits.lean.get_sftp_session()
+                if sftp:
                     server_package = []
                     lean_remote_path = gits.lean.match_lean_remote()
                     server_packages = gits.lean.get_server_packages(sftp, lean_remote_path)
@@ -410,15 +406,12 @@ def import_dep_lean(args):
                         package = key[:-4]
                         server_package.append(package)
                     # print(server_package)
-                    found_server = False
                     if args.argument in server_package:
                         found_server = True
             except paramiko.AuthenticationException:
                 print("Authentication failed. Please check the username and password.")
             except Exception as e:
                 print(f" {e}")
-            finally:
-                ssh.close()  # 确保 SSH 连接关闭
             if found_server:
                 print(f"The remote server has located the package '{args.argument}' and is ready for synchronization.")
                 # 触发下载
@@ -4,6 +4,7 @@ import pyfiglet
 import sys
 from art import text2art
 import gits
+import gits.agent
 from gits.lean import update_lean, update_lean_specific, status_lean_local, status_lean_remote, new_obj_name
 from utils import write_to_path
 from gits.config import MAIN_PATH, execute_configs, show_config
@@ -54,6 +55,10 @@ def cmds(args, remaining):
         add_dep_obj(args)
     elif args.command == 'delete':
         delete_obj(args)
+    elif args.command == 'lean':
+        lean_tools(args, remaining)
+    elif args.command == 'agent':
+        agent_tools(args)
     else:
         trans_command(args, remaining)
 
@@ -285,7 +290,7 @@ def status(args):
         status_dep(os.getcwd())
     elif args.lean:
         if args.remote:
-            status_lean_remote()
+            status_lean_remote(args)
         else:
             status_lean_local(args, os.getcwd())
     if not args.dep and not args.lean:
@@ -327,6 +332,31 @@ def delete_obj(args):
     gits.cmake.delete_obj(args)
 
 
+def lean_tools(args, remaining):
+    if args.argument == 'index':
+        gits.lean.index_lean_server(args)
+    elif args.argument == 'search':
+        gits.lean.search_lean_packages(args, remaining)
+    elif args.argument == 'serve':
+        gits.lean.serve_lean_peer(args, remaining)
+    else:
+        print(Fore.YELLOW + "Usage: gis lean index [-s <os_dir>]" + Style.RESET_ALL)
+        print(Fore.YELLOW + "       gis lean search [name ...] [--contains] [--compiler X] [--channel stable|common] "
+                            "[--range SPEC]" + Style.RESET_ALL)
+        print(Fore.YELLOW + "       gis lean serve [port]" + Style.RESET_ALL)
+
+
+def agent_tools(args):
+    if args.argument == 'start':
+        gits.agent.start_agent()
+    elif args.argument == 'stop':
+        gits.agent.stop_agent()
+    elif args.argument == 'status':
+        gits.agent.print_agent_status()
+    else:
+        print(Fore.YELLOW + "Usage: gis agent start|stop|status" + Style.RESET_ALL)
+
+
 def version():
     ascii_art1 = text2art("GIS", font='standard')
     ascii_art2 = text2art(" POWERED BY SIA8-SOFT", font='standard')
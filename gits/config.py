@@ -3,6 +3,8 @@ import sys
 import json
 import argparse
 
+from colorama import Fore, Style
+
 if getattr(sys, 'frozen', False):
     # 打包模式：sys.executable 是可执行文件
     # base_dir 应该是可执行文件所在的目录
@@ -93,4 +95,27 @@ def show_config(conf=None):
 
     print("Base URL:", base_url)
     for key, value in lean_config.items():
-        print(f"{key}={value}")
\ No newline at end of file
+        print(f"{key}={value}")
+
+# 已经提示过格式错误的配置项，每次运行只提示一次
+_WARNED_CONFIGS = set()
+
+
+def show_number_config(conf, default, convert=int, minimum=None):
+    """
+    读取数值型的 lean 配置项：未设置时返回 default；无法转换时提示一次并返回 default；
+    指定 minimum 时结果不小于它
+    """
+    value = show_config(conf)
+    if value is None or value == "":
+        value = default
+    else:
+        try:
+            value = convert(value)
+        except (TypeError, ValueError):
+            if conf not in _WARNED_CONFIGS:
+                _WARNED_CONFIGS.add(conf)
+                print(Fore.YELLOW + f"Warning: Invalid value {value!r} for {conf}, using the default {default}."
+                      + Style.RESET_ALL)
+            value = default
+    return value if minimum is None else max(minimum, value)
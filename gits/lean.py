@@ -1,24 +1,35 @@
 import ast
 import glob
+import hashlib
+import http.client
 import json
 import platform
 import re
+import shlex
 import shutil
+import socket
 import stat
 import subprocess
 import tarfile
+import threading
+import time
 import zipfile
 import os
 import sys
 import paramiko
 import rarfile
 from packaging.version import parse as parse_version, InvalidVersion
+from packaging.specifiers import SpecifierSet, InvalidSpecifier
 
 from py7zr import py7zr
 from tqdm import tqdm
 from colorama import Fore, Style, init
 from datetime import datetime
-from gits.config import show_config
+from concurrent.futures import Future, ThreadPoolExecutor
+from gits.config import show_config, show_number_config
+from gits import lean_cache, lean_catalog, lean_chunks, lean_concurrency, lean_index, lean_peer, lean_transport
+from gits.lean_index import LeanPackage
+from utils.sftp import SFTP_REQUEST_SIZE, SFTP_WINDOW, iter_remote_read, pipelined_get, throttle_progress
 
 # --- 【配置】平台与编码 ---
 SYSTEM_NAME = platform.system()
@@ -57,32 +68,180 @@ _GLOBAL_SSH = None
 _GLOBAL_SFTP = None
 _CACHED_REMOTE_PATH = None
 
-_CACHE_SERVER_PACKAGES = None
+_CACHE_SERVER_PACKAGES = {}
+_CACHE_SERVER_INDEX = {}
+# {lean_remote_path: [编译器目录]}，判断包是否存在于其他编译器时使用
+_CACHE_SERVER_COMPILERS = {}
 _CACHE_MANIFEST_DEPS = {}
 _CACHE_LOCAL_PACKAGES = None
+# 服务器包列表加载到内存的时间，gis agent 常驻时据此判断是否需要重新加载
+_CACHE_SERVER_TIME = 0.0
+# 最近一次并行下载的并发控制器，运行总结中输出最终的并发数
+_DOWNLOAD_CONCURRENCY = None
+
+
+def _select_direct_transport():
+    """
+    lean_transport 为 auto（默认）且 lean_remote_path 在本机可访问（NFS/SMB 挂载、CI 机器），
+    或显式配置为 local 时，直接读取文件系统；配置为 http 时通过 lean_http_url 访问静态文件服务器。
+    返回 None 表示使用 SFTP，配置无效时返回 False。
+    """
+    mode = str(show_config("lean_transport") or lean_transport.TRANSPORT_AUTO).lower()
+    if mode == lean_transport.TRANSPORT_SFTP:
+        return None
+    if mode == lean_transport.TRANSPORT_HTTP:
+        base_url = show_config("lean_http_url")
+        try:
+            transport = lean_transport.HttpTransport(
+                base_url or "", l_r_p or "/",
+                show_number_config("lean_http_chunks", lean_transport.HTTP_CHUNK_JOBS, minimum=1))
+        except ValueError as e:
+            print(Fore.RED + f"lean_transport is 'http' but {e}" + Style.RESET_ALL)
+            return False
+        print(f"Using lean HTTP server: {transport.base_url}")
+        return transport
+    if l_r_p and os.path.isdir(l_r_p):
+        print(f"Using lean server directory on the local filesystem: {l_r_p}")
+        return lean_transport.LocalTransport()
+    if mode == lean_transport.TRANSPORT_LOCAL:
+        print(Fore.RED + f"lean_transport is 'local' but {l_r_p} is not accessible." + Style.RESET_ALL)
+        return False
+    return None
+
+
+# SSH 连接保活与断线重连
+SSH_KEEPALIVE_SECONDS = 15
+SSH_CONNECT_TIMEOUT = 30
+# SFTP 通道读超时：网络断开但 TCP 连接还没有报错时，读取最多阻塞这么久
+SFTP_CHANNEL_TIMEOUT = 60
+SSH_PROBE_TIMEOUT = 10
+RECONNECT_ATTEMPTS = 5
+RECONNECT_BACKOFF = 1.0
+RECONNECT_BACKOFF_MAX = 30.0
+CONNECTION_ERRORS = (EOFError, ConnectionError, socket.timeout, paramiko.SSHException)
+
+_SESSION_LOCK = threading.Lock()
+_PROBE_LOCK = threading.Lock()
+# 每次重连加 1，下载线程据此判断自己的 SFTP 通道是否属于旧连接
+_SESSION_GENERATION = 0
+
+
+def _connect_lean_server():
+    """建立 SSH 连接并打开 SFTP 会话：开启 keepalive（配置项 lean_ssh_keepalive，0 表示关闭），设置连接和读超时"""
+    ssh = paramiko.SSHClient()
+    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    ssh.connect(lean_remote_ip, username=lean_remote_user, password=lean_remote_pwd,
+                timeout=SSH_CONNECT_TIMEOUT, banner_timeout=SSH_CONNECT_TIMEOUT, auth_timeout=SSH_CONNECT_TIMEOUT)
+    transport = ssh.get_transport()
+    transport.set_keepalive(show_number_config("lean_ssh_keepalive", SSH_KEEPALIVE_SECONDS, minimum=0))
+    # 打开新通道默认最多等一小时，连接已经失效时应当尽快失败
+    transport.channel_timeout = SSH_CONNECT_TIMEOUT
+    sftp = ssh.open_sftp()
+    sftp.get_channel().settimeout(SFTP_CHANNEL_TIMEOUT)
+    return ssh, sftp
+
+
+def _session_active():
+    try:
+        return _GLOBAL_SSH.get_transport().is_active()
+    except Exception:
+        return False
+
+
+def probe_sftp_session(timeout=SSH_PROBE_TIMEOUT):
+    """
+    发送一个需要应答的 keepalive 全局请求，timeout 秒内收到应答（服务器拒绝也算）才认为连接可用。
+    VPN 断开时 TCP 连接可能长时间保持 is_active()，只有实际往返一次才能发现。
+    """
+    if not _session_active():
+        return False
+    transport = _GLOBAL_SSH.get_transport()
+    answered = threading.Event()
+
+    def probe():
+        try:
+            transport.global_request('keepalive@openssh.com', wait=True)
+        except Exception:
+            pass
+        finally:
+            answered.set()
+
+    # paramiko 同一时刻只能等待一个全局请求的应答
+    with _PROBE_LOCK:
+        threading.Thread(target=probe, daemon=True).start()
+        return answered.wait(timeout) and transport.is_active()
+
+
+def _close_ssh_session():
+    global _GLOBAL_SSH, _GLOBAL_SFTP
+    for client in (_GLOBAL_SFTP, _GLOBAL_SSH):
+        try:
+            if client: client.close()
+        except Exception:
+            pass
+    _GLOBAL_SSH, _GLOBAL_SFTP = None, None
+
+
+def reconnect_sftp_session(generation=None):
+    """
+    lean 服务器连接断开后重连，失败时按指数退避重试（配置项 lean_reconnect_attempts，默认 5 次）。
+    generation 是调用方发现断线时的 _SESSION_GENERATION：多个下载线程同时发现断线时只有第一个真正重连，
+    其他线程直接拿到新的会话。返回新的 SFTP 会话，全部失败时返回 None。
+    """
+    global _GLOBAL_SSH, _GLOBAL_SFTP, _SESSION_GENERATION
+    with _SESSION_LOCK:
+        if generation is not None and generation != _SESSION_GENERATION and _session_active():
+            return _GLOBAL_SFTP
+        _close_ssh_session()
+        attempts = show_number_config("lean_reconnect_attempts", RECONNECT_ATTEMPTS, minimum=1)
+        delay = RECONNECT_BACKOFF
+        for attempt in range(1, attempts + 1):
+            _print_line(f"Reconnecting to lean server (attempt {attempt}/{attempts})...")
+            try:
+                _GLOBAL_SSH, _GLOBAL_SFTP = _connect_lean_server()
+                _SESSION_GENERATION += 1
+                _print_line("Reconnected to lean server.")
+                return _GLOBAL_SFTP
+            except paramiko.AuthenticationException as e:
+                _print_line(Fore.RED + f"Reconnect failed: {e}" + Style.RESET_ALL)
+                return None
+            except Exception as e:
+                _print_line(Fore.YELLOW + f"Reconnect failed: {e}" + Style.RESET_ALL)
+            if attempt < attempts:
+                time.sleep(delay)
+                delay = min(delay * 2, RECONNECT_BACKOFF_MAX)
+        _print_line(Fore.RED + f"Could not reconnect to lean server after {attempts} attempts." + Style.RESET_ALL)
+        return None
 
 
 def get_sftp_session():
-    """获取全局唯一的 SFTP 会话"""
+    """
+    获取全局唯一的 lean 服务器会话：SFTP 客户端、lean_remote_path 挂载在本地时的 LocalTransport，
+    或配置为 http 时的 HttpTransport。它们提供相同的 stat / open / listdir_attr / get 接口。
+    已建立的 SSH 连接断开时自动带退避重连。
+    """
     global _GLOBAL_SSH, _GLOBAL_SFTP
 
+    if lean_transport.is_direct_transport(_GLOBAL_SFTP):
+        return _GLOBAL_SFTP
+
+    if _GLOBAL_SSH is None and _GLOBAL_SFTP is None:
+        direct_transport = _select_direct_transport()
+        if direct_transport is False:
+            return None
+        if direct_transport:
+            _GLOBAL_SFTP = direct_transport
+            return direct_transport
+
     if _GLOBAL_SSH and _GLOBAL_SFTP:
-        try:
-            if _GLOBAL_SSH.get_transport().is_active():
-                return _GLOBAL_SFTP
-        except:
-            pass
+        if _session_active():
+            return _GLOBAL_SFTP
+        return reconnect_sftp_session(_SESSION_GENERATION)
 
     print("Connecting to lean server...")
     try:
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(lean_remote_ip, username=lean_remote_user, password=lean_remote_pwd)
-        sftp = ssh.open_sftp()
-
-        _GLOBAL_SSH = ssh
-        _GLOBAL_SFTP = sftp
-        return sftp
+        _GLOBAL_SSH, _GLOBAL_SFTP = _connect_lean_server()
+        return _GLOBAL_SFTP
     except Exception as e:
         print(Fore.RED + f"Connection failed: {e}" + Style.RESET_ALL)
         return None
@@ -338,27 +497,64 @@ def find_best_os_dir(available_dirs):
 
     return None, "Match failed."
 
+REMOTE_MATCH_TTL = 600
+
+
+def _remote_match_key():
+    os_name, os_version = get_local_os_info()
+    return f"{lean_remote_ip}|{check_lean_remote_path(l_r_p)}|{os_name}|{os_version}"
+
+
 def match_lean_remote():
+    """
+    选择与本机系统匹配的远程 OS 目录。
+    1. conf/config.json 中的 lean_remote_os_dir 可直接指定目录（例如固定的 CI 镜像），不访问网络；
+    2. 结果按本机 /etc/os-release 的 ID/版本持久化，有效期内直接使用；过期后只 stat 一次
+       lean_remote_path，目录列表的 mtime 没变就继续沿用，变了才重新匹配。
+    """
     global _CACHED_REMOTE_PATH
     if _CACHED_REMOTE_PATH: return _CACHED_REMOTE_PATH
 
+    base_remote_path = check_lean_remote_path(l_r_p)
+    pinned_os_dir = show_config("lean_remote_os_dir")
+    if pinned_os_dir:
+        _CACHED_REMOTE_PATH = base_remote_path + pinned_os_dir.strip('/')
+        return _CACHED_REMOTE_PATH
+
+    match_cache_path = lean_cache.cache_path("remote_match.json")
+    match_cache = lean_cache.load_json(match_cache_path, {})
+    match_key = _remote_match_key()
+    cached = match_cache.get(match_key)
+    ttl = show_number_config("lean_match_ttl", REMOTE_MATCH_TTL, float)
+
+    if cached and time.time() - cached.get('checked', 0) < ttl:
+        _CACHED_REMOTE_PATH = base_remote_path + cached['dir']
+        return _CACHED_REMOTE_PATH
+
     sftp = get_sftp_session()
     if not sftp: return None
 
     final_path = None
     try:
-        base_remote_path = check_lean_remote_path(l_r_p)
-        all_items = sftp.listdir_attr(base_remote_path)
-        dir_list = [attr.filename for attr in all_items if stat.S_ISDIR(attr.st_mode)]
-        best_dir_name, message = find_best_os_dir(dir_list)
-
-        if best_dir_name:
-            final_path = base_remote_path + best_dir_name
-            try:
-                sftp.stat(final_path)
-                _CACHED_REMOTE_PATH = final_path
-            except:
-                final_path = None
+        listing_mtime = sftp.stat(base_remote_path).st_mtime
+        if cached and listing_mtime is not None and cached.get('listing_mtime') == listing_mtime:
+            final_path = base_remote_path + cached['dir']
+            best_dir_name = cached['dir']
+        else:
+            all_items = sftp.listdir_attr(base_remote_path)
+            dir_list = [attr.filename for attr in all_items if stat.S_ISDIR(attr.st_mode)]
+            best_dir_name, message = find_best_os_dir(dir_list)
+            if best_dir_name:
+                final_path = base_remote_path + best_dir_name
+                try:
+                    sftp.stat(final_path)
+                except:
+                    final_path = None
+
+        if final_path:
+            _CACHED_REMOTE_PATH = final_path
+            match_cache[match_key] = {'dir': best_dir_name, 'listing_mtime': listing_mtime, 'checked': time.time()}
+            lean_cache.save_json(match_cache_path, match_cache)
     except Exception as e:
         print(f"Remote match error: {e}")
 
@@ -484,12 +680,12 @@ def find_real_package_key(pkg_name, pkg_version_str, local_lookup, local_package
         return None
     candidates = local_lookup[pkg_name]
     if not pkg_version_str:
-        return max(candidates, key=lambda k: local_packages[k]['version'])
+        return max(candidates, key=lambda k: local_packages[k].version)
 
     try:
         req_ver_obj = parse_version(pkg_version_str)
         for key in candidates:
-            if local_packages[key]['version'] == req_ver_obj:
+            if local_packages[key].version == req_ver_obj:
                 return key
     except InvalidVersion:
         pass
@@ -529,96 +725,728 @@ def get_local_packages(force_refresh=False):
                 else:
                     continue
 
-                version_obj = parse_version(version_str)
-                update_time = datetime.fromtimestamp(os.path.getmtime(full_path))
+                if not lean_index.is_valid_version(version_str): continue
                 unique_key = f"{pkg_name}@{version_str}@{compiler_tag}"
+                packages[unique_key] = LeanPackage(pkg_name, version_str, compiler_tag, full_path,
+                                                   os.path.getmtime(full_path))
 
-                version_info = {
-                    'name': pkg_name,
-                    'version': version_obj,
-                    'version_str': version_str,
-                    'compiler': compiler_tag,
-                    'full_path': full_path,
-                    'time': update_time
-                }
-                packages[unique_key] = version_info
-
-            except (InvalidVersion, ValueError):
+            except (OSError, ValueError):
                 pass
 
     _CACHE_LOCAL_PACKAGES = packages
     return packages
 
 
-def get_server_packages(sftp, lean_remote_path, packages_dict=None):
-    global _CACHE_SERVER_PACKAGES
+SERVER_INDEX_FORMAT = 2
+SERVER_SCAN_JOBS = 4
+PACKAGE_FIND_FILTER = '-type f \\( -name "*.zip" -o -name "*.tar" \\)'
+PACKAGE_FIND_PRINTF = '-printf "F|%p|%T@|%s\\n"'
+
+
+def _parse_server_package(full_path, timestamp, size=0, sha256=None):
+    """把服务器上的归档路径解析成 (包名, 版本信息)，不符合 <compiler>/<pkg>/<channel>/<file> 结构时返回 None"""
+    try:
+        parts = full_path.split('/')
+        if len(parts) < 4: return None
+
+        channel = parts[-2]
+        package_name = parts[-3]
+        compiler_name = parts[-4]
+        if channel not in ('stable', 'common'): return None
+
+        filename = parts[-1]
+        filename_no_ext = os.path.splitext(filename)[0]
+        if filename_no_ext.endswith('.tar'):
+            filename_no_ext = os.path.splitext(filename_no_ext)[0]
+
+        if '@' in filename_no_ext:
+            _, version_str = filename_no_ext.split('@', 1)
+        else:
+            _, version_str = filename_no_ext.rsplit('-', 1)
+
+        if not lean_index.is_valid_version(version_str): return None
+        version_info = LeanPackage(package_name, version_str, compiler_name, full_path, timestamp,
+                                   location=channel, size=size, sha256=sha256)
+        return package_name, version_info
+    except (ValueError, IndexError):
+        return None
+
+
+REMOTE_READ_CHUNK = 64 * 1024
+
+
+def _iter_remote_lines(cmd, chunk_size=REMOTE_READ_CHUNK):
+    """
+    在 lean 服务器上执行命令，按固定大小分块读取输出并逐行产出。
+    不缓存完整输出，解析与传输同时进行，几十万行的列表也只占用一个分块的内存。
+    """
+    stdin, stdout, stderr = _GLOBAL_SSH.exec_command(cmd)
+    channel = stdout.channel
+    pending = b''
+    while True:
+        chunk = channel.recv(chunk_size)
+        if not chunk: break
+        pending += chunk
+        last_newline = pending.rfind(b'\n')
+        if last_newline < 0: continue
+        complete, pending = pending[:last_newline], pending[last_newline + 1:]
+        for line in complete.split(b'\n'):
+            yield line.decode(errors='ignore')
+    if pending:
+        yield pending.decode(errors='ignore')
+
+
+def _iter_find_records(lines):
+    """把 find 输出行解析为记录：('T', 服务器时间) / ('F', 路径, mtime, size) / ('D', 路径)"""
+    for line in lines:
+        line = line.strip()
+        if line.startswith('T|'):
+            try:
+                yield 'T', int(line[2:])
+            except ValueError:
+                continue
+        elif line.startswith('F|'):
+            try:
+                full_path, timestamp_str, size_str = line[2:].rsplit('|', 2)
+                yield 'F', full_path, float(timestamp_str), int(size_str)
+            except ValueError:
+                continue
+        elif line.startswith('D|'):
+            yield 'D', line[2:].rstrip('/')
+
+
+def _parse_find_records(lines, files, dirs=None):
+    """边读边把 find 记录写入 files / dirs，返回服务器时间戳"""
+    server_now = None
+    for record in _iter_find_records(lines):
+        if record[0] == 'F':
+            files[record[1]] = [record[2], record[3]]
+        elif record[0] == 'D':
+            if dirs is not None:
+                dirs.append(record[1])
+        else:
+            server_now = record[1]
+    return server_now
+
+
+def _full_scan_server_files(lean_remote_path):
+    files = {}
+    cmd = (f'echo "T|$(date +%s)"; '
+           f'find {shlex.quote(lean_remote_path)} {PACKAGE_FIND_FILTER} {PACKAGE_FIND_PRINTF}')
+    server_now = _parse_find_records(_iter_remote_lines(cmd), files)
+    if server_now is None:
+        raise RuntimeError("unexpected output from remote find")
+    return server_now, files
+
+
+def _incremental_scan_server_files(lean_remote_path, stamp, files):
+    """
+    只扫描 stamp 之后变化的内容：
+    1. mtime 更新的归档直接覆盖；
+    2. mtime 更新的目录说明有文件被增删/改名，重新列出该目录，删除消失的条目，新出现的子目录整棵扫描。
+    """
+    root = shlex.quote(lean_remote_path)
+    newer = f"-newermt @{int(stamp)}"
+    cmd = (f'echo "T|$(date +%s)"; '
+           f'find {root} \\( -type d {newer} -printf "D|%p\\n" \\) -o '
+           f'\\( {PACKAGE_FIND_FILTER} {newer} {PACKAGE_FIND_PRINTF} \\)')
+    changed_files = {}
+    changed_dirs = []
+    server_now = _parse_find_records(_iter_remote_lines(cmd), changed_files, changed_dirs)
+    if server_now is None:
+        raise RuntimeError("unexpected output from remote find")
+    files.update(changed_files)
+
+    batch_size = 50
+    for i in range(0, len(changed_dirs), batch_size):
+        batch = changed_dirs[i:i + batch_size]
+        quoted = ' '.join(shlex.quote(d) for d in batch)
+        cmd = (f'find {quoted} -mindepth 1 -maxdepth 1 \\( -type d -printf "D|%p\\n" \\) -o '
+               f'\\( {PACKAGE_FIND_FILTER} {PACKAGE_FIND_PRINTF} \\)')
+        listed_files = {}
+        listed_dirs = []
+        _parse_find_records(_iter_remote_lines(cmd), listed_files, listed_dirs)
+        listed_dir_set = set(listed_dirs)
+
+        new_subdirs = []
+        for changed_dir in batch:
+            prefix = changed_dir + '/'
+            known_subdirs = set()
+            for path in [p for p in files if p.startswith(prefix)]:
+                rest = path[len(prefix):]
+                if '/' in rest:
+                    sub_dir = prefix + rest.split('/', 1)[0]
+                    if sub_dir in listed_dir_set:
+                        known_subdirs.add(sub_dir)
+                    else:
+                        del files[path]
+                elif path not in listed_files:
+                    del files[path]
+            new_subdirs.extend(d for d in listed_dirs if d.startswith(prefix) and d not in known_subdirs)
+        files.update(listed_files)
+
+        if new_subdirs:
+            quoted = ' '.join(shlex.quote(d) for d in new_subdirs)
+            _parse_find_records(_iter_remote_lines(f'find {quoted} {PACKAGE_FIND_FILTER} {PACKAGE_FIND_PRINTF}'),
+                                files)
+
+    return server_now, files
+
+
+def _load_published_json(sftp, remote_path, loader):
+    """
+    读取服务器发布的 JSON 文件（包目录、依赖闭包等）：只 stat 一次，大小和修改时间未变时直接用本地副本。
+    文件不存在或格式不兼容时返回 None。
+    """
+    if not sftp: return None
+    if lean_transport.is_http_transport(sftp):
+        return _load_published_json_http(sftp, remote_path, loader)
+    try:
+        attr = sftp.stat(remote_path)
+    except IOError:
+        return None
+
+    local_copy_path = lean_cache.cache_path("published", f"{lean_cache.cache_key(remote_path)}.json")
+    remote_stat = [attr.st_size, attr.st_mtime]
+    cached = lean_cache.load_json(local_copy_path)
+    if cached and cached.get('remote_stat') == remote_stat:
+        return cached.get('content')
+
+    try:
+        with sftp.open(remote_path, 'rb') as f:
+            content = loader(f.read())
+    except IOError as e:
+        print(Fore.YELLOW + f"Warning: Unable to read {remote_path}: {e}" + Style.RESET_ALL)
+        return None
+    if not content:
+        print(Fore.YELLOW + f"Warning: Unsupported format in {remote_path}, ignoring it." + Style.RESET_ALL)
+        return None
+    lean_cache.save_json(local_copy_path, {'remote_stat': remote_stat, 'content': content})
+    return content
+
+
+def _load_published_json_http(transport, remote_path, loader):
+    """HTTP 后端：用上次响应的 ETag / Last-Modified 发条件 GET，服务器返回 304 时直接用本地副本"""
+    local_copy_path = lean_cache.cache_path("published", f"{lean_cache.cache_key(remote_path)}.json")
+    cached = lean_cache.load_json(local_copy_path)
+    validators = cached.get('validators') if cached and cached.get('content') else None
+    try:
+        data, validators = transport.fetch_if_modified(remote_path, validators)
+    except FileNotFoundError:
+        return None
+    except (IOError, OSError) as e:
+        if cached and cached.get('content'):
+            print(Fore.YELLOW + f"Warning: Unable to read {remote_path} ({e}), using the cached copy." + Style.RESET_ALL)
+            return cached['content']
+        print(Fore.YELLOW + f"Warning: Unable to read {remote_path}: {e}" + Style.RESET_ALL)
+        return None
+    if data is None:
+        return cached['content']
+
+    content = loader(data)
+    if not content:
+        print(Fore.YELLOW + f"Warning: Unsupported format in {remote_path}, ignoring it." + Style.RESET_ALL)
+        return None
+    lean_cache.save_json(local_copy_path, {'validators': validators, 'content': content})
+    return content
+
+
+def _load_catalog_files(sftp, lean_remote_path):
+    """优先使用服务器发布的 gis-catalog.json；服务器没有目录文件时返回 None，由调用方回退到 find 扫描"""
+    catalog = _load_published_json(sftp, f"{lean_remote_path}/{lean_catalog.CATALOG_FILENAME}",
+                                   lean_catalog.load_catalog)
+    if not catalog: return None
+    return lean_catalog.catalog_files(lean_remote_path, catalog)
+
+
+def _warn_if_catalog_stale(sftp, lean_remote_path):
+    """
+    编译器目录的修改时间晚于 gis-catalog.json 时，说明之后有包目录被添加或删除，目录文件可能缺少新包。
+    只能发现编译器目录下的变化（已有包的新版本不会改变编译器目录的修改时间）；HTTP 后端的目录列表没有修改时间
+    """
+    if lean_transport.is_http_transport(sftp):
+        return
+    try:
+        attrs = sftp.listdir_attr(lean_remote_path)
+    except IOError:
+        return
+    catalog_mtime = next((a.st_mtime for a in attrs if a.filename == lean_catalog.CATALOG_FILENAME), None)
+    if catalog_mtime is None:
+        return
+    newer = sorted(a.filename for a in attrs
+                   if stat.S_ISDIR(a.st_mode) and a.st_mtime and a.st_mtime > catalog_mtime)
+    if newer:
+        print(Fore.YELLOW + f"Warning: {', '.join(newer)} changed after {lean_catalog.CATALOG_FILENAME} was "
+                            f"generated; new packages may be missing. Run 'gis lean index' on the server, "
+                            f"or pass --rescan to scan the server directly." + Style.RESET_ALL)
+
+
+def _scan_server_shard(lean_remote_path, compiler_dir, shard, force_rescan=False, transport=None):
+    """扫描一个 <compiler>/ 分片：有缓存时增量刷新，否则完整扫描；本地文件系统直接遍历目录"""
+    shard_path = f"{lean_remote_path}/{compiler_dir}"
+    if lean_transport.is_local_transport(transport):
+        server_now, files = transport.scan_files(shard_path)
+        return {'stamp': server_now - 2, 'files': files}
+    if shard and not force_rescan:
+        try:
+            server_now, files = _incremental_scan_server_files(shard_path, shard['stamp'], dict(shard['files']))
+            return {'stamp': server_now - 2, 'files': files}
+        except Exception as e:
+            print(Fore.YELLOW + f"Incremental refresh of {compiler_dir} failed ({e}), running a full rescan..." + Style.RESET_ALL)
+    server_now, files = _full_scan_server_files(shard_path)
+    # 留出时间余量，扫描期间修改的文件在下次增量刷新时会再次被扫描到
+    return {'stamp': server_now - 2, 'files': files}
+
+
+def _load_server_files(sftp, lean_remote_path, force_rescan=False, compilers=None):
+    """
+    读取本地持久化的服务器包索引并按需刷新；返回 {远程路径: [mtime, size]}。
+    索引按 <compiler>/ 目录分片，各分片在共享 SSH 连接的多个 exec 通道上并发扫描；
+    指定 compilers 时只刷新并返回这些编译器的分片。
+    """
+    index_path = lean_cache.cache_path("server_index", f"{lean_cache.cache_key(lean_remote_path)}.json")
+    cached = lean_cache.load_json(index_path)
+    if cached and (cached.get('format') != SERVER_INDEX_FORMAT or cached.get('remote_path') != lean_remote_path):
+        cached = None
+    shards = cached['shards'] if cached else {}
+    wanted = {c.upper() for c in compilers} if compilers else None
+
+    def merge_shards(names):
+        files = {}
+        for name in names:
+            if wanted is None or name.upper() in wanted:
+                files.update(shards.get(name, {}).get('files', {}))
+        return files
+
+    if lean_transport.is_http_transport(sftp):
+        # 静态文件服务器无法扫描目录，包列表只能来自 gis-catalog.json
+        print(Fore.RED + f"No {lean_catalog.CATALOG_FILENAME} found under {lean_remote_path} on the lean HTTP server, "
+              "run 'gis lean index' on the server first." + Style.RESET_ALL)
+        return {}
+    if not _GLOBAL_SSH and not lean_transport.is_direct_transport(sftp):
+        get_sftp_session()
+    if not _GLOBAL_SSH and not lean_transport.is_direct_transport(sftp):
+        if shards:
+            print(Fore.YELLOW + "SSH session lost, using the cached server package index." + Style.RESET_ALL)
+            return merge_shards(list(shards))
+        print(Fore.RED + "SSH session lost, cannot scan packages." + Style.RESET_ALL)
+        return {}
+
+    try:
+        compiler_dirs = [attr.filename for attr in sftp.listdir_attr(lean_remote_path)
+                         if stat.S_ISDIR(attr.st_mode) and not attr.filename.startswith('.')
+                         and attr.filename != 'dep_tree']
+    except Exception as e:
+        print(f"Error listing {lean_remote_path}: {e}")
+        return merge_shards(list(shards))
+
+    for name in list(shards):
+        if name not in compiler_dirs:
+            del shards[name]
+    targets = [name for name in compiler_dirs if wanted is None or name.upper() in wanted]
+
+    if force_rescan or any(name not in shards for name in targets):
+        print("Scanning lean server packages...")
+    jobs = show_number_config("lean_scan_jobs", SERVER_SCAN_JOBS, minimum=1)
+    with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(targets)))) as executor:
+        futures = {name: executor.submit(_scan_server_shard, lean_remote_path, name, shards.get(name), force_rescan,
+                                         sftp)
+                   for name in targets}
+        for name, future in futures.items():
+            try:
+                shards[name] = future.result()
+            except Exception as e:
+                print(f"Error executing find command in {name}: {e}")
+
+    lean_cache.save_json(index_path, {
+        'format': SERVER_INDEX_FORMAT,
+        'remote_path': lean_remote_path,
+        'shards': shards
+    })
+    return merge_shards(targets)
+
+
+def _filter_server_packages(packages_dict, scope):
+    filtered = {}
+    for name, versions in packages_dict.items():
+        scoped_versions = [v for v in versions if v.compiler.upper() in scope]
+        if scoped_versions:
+            filtered[name] = scoped_versions
+    return filtered
+
+
+def get_server_packages(sftp, lean_remote_path, packages_dict=None, force_rescan=False, compilers=None):
+    """
+    返回 {包名: [版本信息]}。compilers 为 None 时包含全部编译器；
+    指定 compilers 时（服务器没有包目录文件的情况下）只扫描这些编译器目录。
+    """
+    global _CACHE_SERVER_TIME
+    scope = tuple(sorted(c.upper() for c in compilers)) if compilers else None
     if packages_dict is None:
-        if _CACHE_SERVER_PACKAGES is not None:
-            return _CACHE_SERVER_PACKAGES
+        if scope in _CACHE_SERVER_PACKAGES:
+            return _CACHE_SERVER_PACKAGES[scope]
+        if scope is not None and None in _CACHE_SERVER_PACKAGES:
+            _CACHE_SERVER_PACKAGES[scope] = _filter_server_packages(_CACHE_SERVER_PACKAGES[None], scope)
+            return _CACHE_SERVER_PACKAGES[scope]
         packages_dict = {}
         is_root_call = True
     else:
         is_root_call = False
 
+    # HTTP 后端的目录文件本身就通过条件请求保持最新，--rescan 时也使用它
+    use_catalog = not force_rescan or lean_transport.is_http_transport(sftp)
+    files = _load_catalog_files(sftp, lean_remote_path) if use_catalog else None
+    if files is not None and is_root_call:
+        _warn_if_catalog_stale(sftp, lean_remote_path)
+    # 包目录文件一次就包含了所有编译器
+    is_full_listing = files is not None or scope is None
+    if files is None:
+        files = _load_server_files(sftp, lean_remote_path, force_rescan, compilers)
+    for full_path, entry in files.items():
+        parsed = _parse_server_package(full_path, entry[0], entry[1], entry[2] if len(entry) > 2 else None)
+        if parsed:
+            package_name, version_info = parsed
+            packages_dict.setdefault(package_name, []).append(version_info)
+
+    if is_root_call:
+        if not _CACHE_SERVER_PACKAGES:
+            _CACHE_SERVER_TIME = time.monotonic()
+        if is_full_listing:
+            _CACHE_SERVER_PACKAGES[None] = packages_dict
+        if scope is not None:
+            if is_full_listing:
+                packages_dict = _filter_server_packages(packages_dict, scope)
+            _CACHE_SERVER_PACKAGES[scope] = packages_dict
+
+    return packages_dict
+
+
+def get_server_index(sftp, lean_remote_path, force_rescan=False, compilers=None):
+    """get_server_packages 结果的排序索引，按编译器范围缓存"""
+    scope = tuple(sorted(c.upper() for c in compilers)) if compilers else None
+    if scope not in _CACHE_SERVER_INDEX:
+        packages_dict = get_server_packages(sftp, lean_remote_path, force_rescan=force_rescan, compilers=compilers)
+        _CACHE_SERVER_INDEX[scope] = lean_index.PackageIndex(packages_dict)
+    return _CACHE_SERVER_INDEX[scope]
+
+
+def reset_request_caches(server_ttl=None):
+    """
+    常驻进程（gis agent）在每个请求开始前调用：本地包列表和 manifest 解析结果可能已被其他进程改变，总是清空；
+    服务器包列表和索引加载超过 server_ttl 秒后才清空，为 None 时保留。
+    """
+    global _CACHE_LOCAL_PACKAGES, _CACHED_REMOTE_PATH
+    _CACHE_LOCAL_PACKAGES = None
+    _CACHE_MANIFEST_DEPS.clear()
+    _PEER_INDEXES.clear()
+    _PEER_STATS.update(packages=0, bytes=0)
+    _CHUNK_STATS.update(packages=0, reused=0, fetched=0)
+    if server_ttl is not None and time.monotonic() - _CACHE_SERVER_TIME > server_ttl:
+        _CACHE_SERVER_PACKAGES.clear()
+        _CACHE_SERVER_INDEX.clear()
+        _CACHE_SERVER_COMPILERS.clear()
+        _CACHED_REMOTE_PATH = None
+
+
+def session_summary():
+    """gis agent status 使用：当前连接和内存缓存的概况"""
+    if lean_transport.is_direct_transport(_GLOBAL_SFTP):
+        connection = type(_GLOBAL_SFTP).__name__
+    else:
+        connection = "connected" if _session_active() else "not connected"
+    return {'connection': connection, 'remote_path': _CACHED_REMOTE_PATH,
+            'server_scopes': len(_CACHE_SERVER_PACKAGES),
+            'server_cache_age': int(time.monotonic() - _CACHE_SERVER_TIME) if _CACHE_SERVER_PACKAGES else None}
+
+
+def _server_compilers_with_package(sftp, lean_remote_path, pkg_name, exclude=None):
+    """
+    服务器上有该包的编译器目录（不含 exclude）。已加载全部编译器的包列表（例如来自包目录文件）时直接查找；
+    否则列出一次编译器目录，再逐个 stat <compiler>/<包名>，不需要扫描其他编译器的全部归档。
+    """
+    exclude = exclude.upper() if exclude else None
+    if None in _CACHE_SERVER_PACKAGES:
+        return sorted({v.compiler for v in _CACHE_SERVER_PACKAGES[None].get(pkg_name, ())
+                       if v.compiler.upper() != exclude})
+    if lean_remote_path not in _CACHE_SERVER_COMPILERS:
+        try:
+            _CACHE_SERVER_COMPILERS[lean_remote_path] = [
+                attr.filename for attr in sftp.listdir_attr(lean_remote_path)
+                if stat.S_ISDIR(attr.st_mode) and not attr.filename.startswith('.') and attr.filename != 'dep_tree']
+        except (IOError, OSError):
+            return []
+    found = []
+    for compiler_dir in _CACHE_SERVER_COMPILERS[lean_remote_path]:
+        if compiler_dir.upper() == exclude: continue
+        try:
+            sftp.stat(f"{lean_remote_path}/{compiler_dir}/{pkg_name}")
+        except (IOError, OSError):
+            continue
+        found.append(compiler_dir)
+    return found
+
+
+def _other_compilers_index(sftp, lean_remote_path, pkg_name, target_compiler, force_rescan=False):
+    """只包含有该包的其他编译器的索引，没有其他编译器时返回 None"""
+    compilers = _server_compilers_with_package(sftp, lean_remote_path, pkg_name, exclude=target_compiler)
+    if not compilers:
+        return None
+    return get_server_index(sftp, lean_remote_path, force_rescan, compilers=compilers)
+
+
+def server_has_package(sftp, lean_remote_path, pkg_name, target_compiler):
+    """包是否在服务器上（任意编译器）有可用的归档；版本解析失败后用来区分包不存在和版本不存在"""
+    if pkg_name in get_server_index(sftp, lean_remote_path, compilers=[target_compiler]):
+        return True
+    other_index = _other_compilers_index(sftp, lean_remote_path, pkg_name, target_compiler)
+    return other_index is not None and pkg_name in other_index
+
+
+def resolve_server_package(sftp, lean_remote_path, pkg_name, req_version_str, target_compiler, force_rescan=False):
+    """
+    compare_packages 和 update_lean_specific 共用的版本解析：
+    指定版本时精确匹配，否则取最新 stable（没有则取最新 common）；
+    先只在目标编译器中查找，找不到时只加载有该包的其他编译器并给出提示。
+    版本号格式错误时抛出 InvalidVersion，找不到时返回 None。
+    """
+    req_version_obj = parse_version(req_version_str) if req_version_str is not None else None
+    scoped_index = get_server_index(sftp, lean_remote_path, force_rescan, compilers=[target_compiler])
+
+    if req_version_obj is not None:
+        match = scoped_index.find_exact(pkg_name, req_version_obj, target_compiler)
+        if match: return match
+        other_index = _other_compilers_index(sftp, lean_remote_path, pkg_name, target_compiler, force_rescan)
+        match = other_index.find_exact(pkg_name, req_version_obj) if other_index is not None else None
+        if match:
+            print(
+                Fore.YELLOW + f"Warning: Found '{pkg_name}=={req_version_str}' in '{match.compiler}' (Target is {target_compiler}). Using it." + Style.RESET_ALL)
+        return match
+
+    match = scoped_index.find_latest(pkg_name, target_compiler)
+    if match: return match
+    other_index = _other_compilers_index(sftp, lean_remote_path, pkg_name, target_compiler, force_rescan)
+    if other_index is None or pkg_name not in other_index: return None
+    print(
+        Fore.YELLOW + f"Warning: No version found for '{pkg_name}' in {target_compiler}. Searching all compilers..." + Style.RESET_ALL)
+    return other_index.find_latest(pkg_name)
+
+
+def _remote_sha256(paths):
+    """在服务器上批量计算 sha256，返回 {远程路径: 摘要}"""
+    checksums = {}
+    batch_size = 50
+    for i in range(0, len(paths), batch_size):
+        batch = paths[i:i + batch_size]
+        cmd = 'sha256sum -- ' + ' '.join(shlex.quote(p) for p in batch)
+        for line in _iter_remote_lines(cmd):
+            parts = line.strip().split(None, 1)
+            if len(parts) == 2 and len(parts[0]) == 64:
+                checksums[parts[1].lstrip('*')] = parts[0]
+    return checksums
+
+
+def _server_sha256(sftp, paths):
+    if lean_transport.is_local_transport(sftp):
+        checksums = {path: lean_cache.file_sha256(path) for path in paths}
+        return {path: digest for path, digest in checksums.items() if digest}
+    return _remote_sha256(paths)
+
+
+def _write_remote_file(sftp, remote_path, data):
+    """先写临时文件再改名，客户端不会读到写了一半的文件"""
+    tmp_path = f"{remote_path}.tmp"
+    with sftp.open(tmp_path, 'wb') as f:
+        f.write(data)
     try:
-        global _GLOBAL_SSH
-        if not _GLOBAL_SSH:
-            get_sftp_session()
+        sftp.posix_rename(tmp_path, remote_path)
+    except IOError:
+        try:
+            sftp.remove(remote_path)
+        except IOError:
+            pass
+        sftp.rename(tmp_path, remote_path)
 
-        if _GLOBAL_SSH:
-            cmd = f'find {lean_remote_path} -type f \\( -name "*.zip" -o -name "*.tar" \\) -printf "%p|%T@\\n"'
-            stdin, stdout, stderr = _GLOBAL_SSH.exec_command(cmd)
-            file_list = stdout.read().decode().splitlines()
 
-            for line in file_list:
-                line = line.strip()
-                if not line or '|' not in line: continue
+def _index_dep_tree(sftp, lean_remote_path):
+    """读取 dep_tree 下全部 .dep 文件，生成每个 pkg@ver 的传递闭包文件"""
+    dep_tree_path = f"{lean_remote_path}/dep_tree"
+    try:
+        dep_names = [attr.filename for attr in sftp.listdir_attr(dep_tree_path) if attr.filename.endswith('.dep')]
+    except IOError:
+        return
 
-                full_path, timestamp_str = line.split('|')
+    contents = _fetch_dep_files(sftp, dep_tree_path, dep_names)
+    dep_files = {dep_name[:-len('.dep')]: _parse_dep_lines(data.splitlines()) for dep_name, data in contents.items()}
 
-                try:
-                    parts = full_path.split('/')
-                    if len(parts) < 4: continue
-
-                    channel = parts[-2]
-                    package_name = parts[-3]
-                    compiler_name = parts[-4]
-
-                    if channel in ('stable', 'common'):
-                        filename = parts[-1]
-                        filename_no_ext = os.path.splitext(filename)[0]
-                        if filename_no_ext.endswith('.tar'):
-                            filename_no_ext = os.path.splitext(filename_no_ext)[0]
-
-                        if '@' in filename_no_ext:
-                            _, version_str = filename_no_ext.split('@', 1)
-                        else:
-                            _, version_str = filename_no_ext.rsplit('-', 1)
-
-                        version_obj = parse_version(version_str)
-                        file_time = datetime.fromtimestamp(float(timestamp_str))
-
-                        version_info = {
-                            'version': version_obj,
-                            'version_str': version_str,
-                            'location': channel,
-                            'compiler': compiler_name,
-                            'full_path': full_path,
-                            'time': file_time
-                        }
-                        packages_dict.setdefault(package_name, []).append(version_info)
-                except (ValueError, InvalidVersion, IndexError):
-                    continue
-        else:
-            print(Fore.RED + "SSH session lost, cannot scan packages." + Style.RESET_ALL)
+    closure_path = f"{dep_tree_path}/{lean_catalog.CLOSURE_FILENAME}"
+    _write_remote_file(sftp, closure_path, lean_catalog.dump_catalog(lean_catalog.build_dep_closure(dep_files)))
+    print(Fore.GREEN + f"Dependency closures written: {closure_path} ({len(dep_files)} dep files)" + Style.RESET_ALL)
 
-    except Exception as e:
-        print(f"Error executing find command: {e}")
 
-    if is_root_call:
-        _CACHE_SERVER_PACKAGES = packages_dict
+def _index_archive_chunks(sftp, lean_remote_path, files):
+    """
+    维护者：为不小于 CHUNK_MIN_ARCHIVE 的归档生成 <归档>.chunks.json，客户端据此只下载新版本中变化的块。
+    已有块列表的大小和修改时间与归档一致时沿用。需要读取整个归档，由配置项 lean_chunk_index 开启。
+    """
+    written = 0
+    for full_path, entry in sorted(files.items()):
+        mtime, size = entry[0], entry[1]
+        kind = lean_chunks.chunk_kind(full_path)
+        if size < lean_chunks.CHUNK_MIN_ARCHIVE or not kind: continue
+        if not lean_catalog.split_package_path(lean_remote_path, full_path): continue
+        index_path = f"{full_path}{lean_chunks.CHUNK_INDEX_SUFFIX}"
+        try:
+            with sftp.open(index_path, 'rb') as f:
+                old_index = lean_chunks.load_chunk_index(f.read())
+        except IOError:
+            old_index = None
+        if old_index and old_index['size'] == size and int(old_index.get('mtime') or 0) == int(mtime):
+            continue
+        print(f"Chunking {full_path} ({format_size(size)})...")
+        index = lean_chunks.build_chunk_index(_iter_download_blocks(sftp, full_path, 0, size), kind, size, mtime)
+        _write_remote_file(sftp, index_path, lean_chunks.dump_chunk_index(index))
+        written += 1
+    if written:
+        print(Fore.GREEN + f"Chunk lists written for {written} archives" + Style.RESET_ALL)
 
-    return packages_dict
+
+def index_lean_server(args):
+    """维护者命令：为服务器上每个 OS 目录生成 gis-catalog.json 和 dep_tree 闭包文件（需要写权限）"""
+    sftp = get_sftp_session()
+    if not sftp: return False
+    if lean_transport.is_http_transport(sftp):
+        print(Fore.RED + "The lean HTTP transport is read-only, run 'gis lean index' over SFTP or on the server." + Style.RESET_ALL)
+        return False
+
+    base_remote_path = check_lean_remote_path(l_r_p)
+    if args.specific:
+        os_dirs = [args.specific]
+    else:
+        try:
+            os_dirs = [attr.filename for attr in sftp.listdir_attr(base_remote_path)
+                       if stat.S_ISDIR(attr.st_mode) and not attr.filename.startswith('.')]
+        except IOError as e:
+            print(Fore.RED + f"Error: Unable to list {base_remote_path}: {e}" + Style.RESET_ALL)
+            return False
+
+    all_ok = True
+    for os_dir in os_dirs:
+        lean_remote_path = base_remote_path + os_dir
+        print("-" * 35)
+        print(f"Indexing {lean_remote_path} ...")
+        try:
+            if lean_transport.is_local_transport(sftp):
+                _, files = sftp.scan_files(lean_remote_path)
+            else:
+                _, files = _full_scan_server_files(lean_remote_path)
+
+            # 大小和修改时间都没变的归档沿用旧目录里的摘要，避免重复计算
+            catalog_path = f"{lean_remote_path}/{lean_catalog.CATALOG_FILENAME}"
+            old_files = {}
+            try:
+                with sftp.open(catalog_path, 'rb') as f:
+                    old_catalog = lean_catalog.load_catalog(f.read())
+                if old_catalog:
+                    old_files = lean_catalog.catalog_files(lean_remote_path, old_catalog)
+            except IOError:
+                pass
+
+            checksums = {}
+            need_hash = []
+            for full_path, (mtime, size) in files.items():
+                old = old_files.get(full_path)
+                if old and old[0] == mtime and old[1] == size and old[2]:
+                    checksums[full_path] = old[2]
+                elif lean_catalog.split_package_path(lean_remote_path, full_path):
+                    need_hash.append(full_path)
+            if need_hash:
+                print(f"Computing checksums for {len(need_hash)} archives...")
+                checksums.update(_server_sha256(sftp, need_hash))
+
+            support_paths = {f"{lean_remote_path}/{name}": name for name in lean_catalog.SUPPORT_FILES}
+            support_checksums = {support_paths[path]: digest
+                                 for path, digest in _server_sha256(sftp, list(support_paths)).items()}
+
+            catalog = lean_catalog.build_catalog(lean_remote_path, files, checksums, support_checksums)
+            _write_remote_file(sftp, catalog_path, lean_catalog.dump_catalog(catalog))
+            print(Fore.GREEN + f"Catalog written: {catalog_path} ({len(catalog['packages'])} packages)" + Style.RESET_ALL)
+
+            _index_dep_tree(sftp, lean_remote_path)
+            if show_config("lean_chunk_index"):
+                _index_archive_chunks(sftp, lean_remote_path, files)
+        except Exception as e:
+            print(Fore.RED + f"Failed to index {lean_remote_path}: {e}" + Style.RESET_ALL)
+            all_ok = False
+
+    return all_ok
+
+
+def format_size(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+SEARCH_INDEX_TTL = 600
+
+
+def _load_search_index(force_refresh=False):
+    """
+    读取本地的搜索索引；索引在有效期内时不访问网络（OS 目录匹配结果也来自本地缓存），
+    过期或指定 --rescan 时通过 get_server_packages 增量刷新后重建。
+    """
+    lean_remote_path = match_lean_remote()
+    if lean_remote_path is None:
+        print(Fore.RED + "Error: Could not determine remote path." + Style.RESET_ALL)
+        return None
+
+    index_path = lean_cache.cache_path("search", f"{lean_cache.cache_key(lean_remote_path)}.json")
+    cached = lean_cache.load_json(index_path)
+    ttl = show_number_config("lean_search_ttl", SEARCH_INDEX_TTL, float)
+    if cached and not force_refresh and time.time() - cached.get('built', 0) < ttl:
+        return lean_index.SearchIndex(cached['rows'])
+
+    sftp = get_sftp_session()
+    if not sftp:
+        if cached:
+            print(Fore.YELLOW + "Using the cached search index, it may be outdated." + Style.RESET_ALL)
+            return lean_index.SearchIndex(cached['rows'])
+        return None
+
+    server_packages = get_server_packages(sftp, lean_remote_path, force_rescan=force_refresh)
+    rows = [[name, info.version_str, info.compiler, info.location, info.size, info.mtime]
+            for name, versions in server_packages.items() for info in versions]
+    lean_cache.save_json(index_path, {'built': time.time(), 'rows': rows})
+    return lean_index.SearchIndex(rows)
+
+
+def search_lean_packages(args, terms):
+    """gis lean search [关键字 ...] [--contains] [--compiler X] [--channel stable|common] [--range SPEC]"""
+    specifier = None
+    if getattr(args, 'version_range', None):
+        try:
+            specifier = SpecifierSet(args.version_range)
+        except InvalidSpecifier:
+            print(Fore.RED + f"Error: Invalid version range '{args.version_range}'" + Style.RESET_ALL)
+            return
+
+    search_index = _load_search_index(getattr(args, 'rescan', False))
+    if search_index is None: return
+
+    results = search_index.search(terms, substring=getattr(args, 'contains', False),
+                                  compiler=getattr(args, 'compiler', None),
+                                  channel=getattr(args, 'channel', None), specifier=specifier)
+    if not results:
+        print("No matching packages.")
+        return
+
+    print(f"{'Package':<25} {'Version':<15} {'Compiler':<12} {'Location':<10} {'Size':>10}  {'Date'}")
+    print("-" * 95)
+    for name, version_str, compiler, channel, size, mtime in results:
+        date_str = datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M')
+        print(f"{name:<25} {version_str:<15} {compiler:<12} {channel:<10} {format_size(size):>10}  {date_str}")
+    print(f"{len(results)} packages found.")
 
 
 def get_lean_mainfest_packages(args, manifest_directory, root_only=False, sftp=None, lean_remote_path=None):
@@ -684,103 +1512,294 @@ def get_lean_mainfest_packages(args, manifest_directory, root_only=False, sftp=N
     remote_copy_cmds = {}
 
     if sftp and lean_remote_path:
-        stack = [item.copy() for item in requirements_list]
-        checked_keys = set()
         dep_tree_base = f"{lean_remote_path}/dep_tree"
+        mirror_dir = _sync_dep_tree_mirror(sftp, lean_remote_path)
+        if mirror_dir:
+            dep_closure = _read_local_dep_closure(mirror_dir)
+            if dep_closure and _dep_closure_is_stale(sftp, lean_remote_path, mirror_dir):
+                print(Fore.YELLOW + f"Warning: {lean_catalog.CLOSURE_FILENAME} is older than some .dep files, "
+                                    f"resolving dependencies from the .dep files. "
+                                    f"Run 'gis lean index' on the server to update it." + Style.RESET_ALL)
+                dep_closure = None
+            fetch_dep_files = lambda dep_names: _read_local_dep_files(mirror_dir, dep_names)
+        else:
+            dep_closure = _load_published_json(sftp, f"{dep_tree_base}/{lean_catalog.CLOSURE_FILENAME}",
+                                               lean_catalog.load_dep_closure)
+            fetch_dep_files = lambda dep_names: _fetch_dep_files(sftp, dep_tree_base, dep_names)
 
-        while stack:
-            current_item = stack.pop()
-            current_pkg = current_item['name']
-            current_ver = current_item['version']
-
-            current_key = f"{current_pkg}@{current_ver}" if current_ver else current_pkg
-            if current_key in checked_keys: continue
-            checked_keys.add(current_key)
+        if dep_closure:
+            _apply_dep_closure(dep_closure, requirements_list, remote_copy_cmds)
+        else:
+            _walk_dep_tree(fetch_dep_files, dep_tree_base, requirements_list, remote_copy_cmds)
 
-            candidates = []
-            if current_ver:
-                candidates.append(f"{dep_tree_base}/{current_pkg}@{current_ver}.dep")
-            candidates.append(f"{dep_tree_base}/{current_pkg}.dep")
+    _CACHE_MANIFEST_DEPS[cache_key] = (requirements_list, remote_copy_cmds)
+    return requirements_list, remote_copy_cmds
 
-            file_handle = None
-            found_dep_path = None
-            for remote_dep_file in candidates:
-                try:
-                    file_handle = sftp.open(remote_dep_file)
-                    found_dep_path = remote_dep_file
-                    break
-                except IOError:
-                    continue
 
-            if not file_handle: continue
+def _parse_dep_lines(lines):
+    """解析 .dep 文件内容：返回依赖 [(name, version)] 和拷贝命令 [(name, version, cmd)]"""
+    requires = []
+    cmds = []
+    remote_context_tuple = None
 
+    for line in lines:
+        if isinstance(line, bytes):
             try:
-                with file_handle as f:
-                    remote_context_tuple = None
-
-                    for line in f:
-                        if isinstance(line, bytes):
-                            try:
-                                line = line.decode('utf-8-sig')
-                            except:
-                                line = line.decode('utf-8')
-                        if '#' in line: line = line.split('#', 1)[0]
-                        if not line: continue
-                        line = line.strip().replace("IGNORE_IN_DEPENDENCY", "").strip()
-                        if not line or line.startswith('#') or line.startswith('[') or \
-                                line.startswith(('http://', 'https://')) or line.endswith('.git'):
-                            continue
+                line = line.decode('utf-8-sig')
+            except:
+                line = line.decode('utf-8')
+        if '#' in line: line = line.split('#', 1)[0]
+        if not line: continue
+        line = line.strip().replace("IGNORE_IN_DEPENDENCY", "").strip()
+        if not line or line.startswith('#') or line.startswith('[') or \
+                line.startswith(('http://', 'https://')) or line.endswith('.git'):
+            continue
 
-                        if line.lower().startswith(('copy ', 'move ')):
-                            if remote_context_tuple:
-                                remote_copy_cmds.setdefault(remote_context_tuple, []).append(line)
-                            continue
+        if line.lower().startswith(('copy ', 'move ')):
+            if remote_context_tuple:
+                cmds.append((remote_context_tuple[0], remote_context_tuple[1], line))
+            continue
 
-                        pkg_part = ""
-                        cmd_part = None
-                        if ':' in line:
-                            parts = line.split(':', 1)
-                            pkg_part = parts[0].strip()
-                            cmd_part = parts[1].strip()
-                        else:
-                            pkg_part = line
-
-                        if '==' in pkg_part:
-                            parts = pkg_part.split('==', 1)
-                            dep_name, dep_version = parts[0].strip(), parts[1].strip()
-                        else:
-                            dep_name, dep_version = pkg_part, None
-                        if not dep_name: continue
-
-                        item = {'name': dep_name, 'version': dep_version}
-                        if item not in requirements_list:
-                            requirements_list.append(item)
-
-                        remote_context_tuple = (dep_name, dep_version)
-
-                        if cmd_part and cmd_part.lower().startswith(('copy', 'move')):
-                            remote_copy_cmds.setdefault(remote_context_tuple, []).append(cmd_part)
-
-                        dep_key = f"{dep_name}@{dep_version}" if dep_version else dep_name
-                        if dep_key not in checked_keys:
-                            stack.append(item)
-            except Exception as e:
-                print(f"Warning: Error parsing dep file {found_dep_path}: {e}")
+        pkg_part = ""
+        cmd_part = None
+        if ':' in line:
+            parts = line.split(':', 1)
+            pkg_part = parts[0].strip()
+            cmd_part = parts[1].strip()
+        else:
+            pkg_part = line
 
-    _CACHE_MANIFEST_DEPS[cache_key] = (requirements_list, remote_copy_cmds)
-    return requirements_list, remote_copy_cmds
+        if '==' in pkg_part:
+            parts = pkg_part.split('==', 1)
+            dep_name, dep_version = parts[0].strip(), parts[1].strip()
+        else:
+            dep_name, dep_version = pkg_part, None
+        if not dep_name: continue
+
+        remote_context_tuple = (dep_name, dep_version)
+        requires.append(remote_context_tuple)
+
+        if cmd_part and cmd_part.lower().startswith(('copy', 'move')):
+            cmds.append((dep_name, dep_version, cmd_part))
+
+    return requires, cmds
+
+
+def _merge_dep_file(requires, cmds, requirements_list, remote_copy_cmds):
+    """把一个 .dep 文件的解析结果合并进需求列表和拷贝命令，返回新加入的依赖"""
+    for dep_name, dep_version, cmd in cmds:
+        remote_copy_cmds.setdefault((dep_name, dep_version), []).append(cmd)
+
+    added = []
+    for dep_name, dep_version in requires:
+        item = {'name': dep_name, 'version': dep_version}
+        if item not in requirements_list:
+            requirements_list.append(item)
+        added.append(item)
+    return added
+
+
+def _apply_dep_closure(dep_closure, requirements_list, remote_copy_cmds):
+    """使用服务器预先计算的闭包：每个根依赖直接得到它可达的全部 .dep 文件，不再逐个读取"""
+    dep_files = dep_closure.get('files', {})
+    closures = dep_closure.get('closures', {})
+    applied = set()
+
+    for root_item in list(requirements_list):
+        file_key = lean_catalog.resolve_dep_key(dep_files, root_item['name'], root_item['version'])
+        if not file_key: continue
+        for key in closures.get(file_key, [file_key]):
+            if key in applied or key not in dep_files: continue
+            applied.add(key)
+            _merge_dep_file(dep_files[key]['requires'], dep_files[key]['cmds'], requirements_list, remote_copy_cmds)
+
+
+DEP_FILE_MARKER = "@@GIS-DEP-FILE@@"
+DEP_END_MARKER = "@@GIS-DEP-END@@"
+
+
+def _dep_candidates(item):
+    """与查找顺序一致：先 pkg@ver.dep，再 pkg.dep"""
+    candidates = []
+    if item['version']:
+        candidates.append(f"{item['name']}@{item['version']}.dep")
+    candidates.append(f"{item['name']}.dep")
+    return candidates
+
+
+def _fetch_dep_files_exec(dep_tree_base, dep_names):
+    """一次 exec_command 把存在的 .dep 文件带分隔符全部输出；输出不完整时返回 None"""
+    quoted = ' '.join(shlex.quote(n) for n in dep_names)
+    cmd = (f'cd {shlex.quote(dep_tree_base)} 2>/dev/null && '
+           f'for f in {quoted}; do if [ -f "$f" ]; then printf "\\n{DEP_FILE_MARKER} %s\\n" "$f"; cat -- "$f"; fi; done; '
+           f'echo "{DEP_END_MARKER}"')
+    stdin, stdout, stderr = _GLOBAL_SSH.exec_command(cmd)
+    output = stdout.read()
+    end_pos = output.rfind(DEP_END_MARKER.encode())
+    if end_pos < 0: return None
+
+    contents = {}
+    marker = f"\n{DEP_FILE_MARKER} ".encode()
+    for block in output[:end_pos].split(marker)[1:]:
+        name, _, data = block.partition(b'\n')
+        contents[name.decode('utf-8', errors='ignore')] = data
+    return contents
+
+
+def _fetch_dep_files_sftp(sftp, dep_tree_base, dep_names):
+    """exec 不可用时的回退：在同一个 SFTP 会话上并发打开所有候选文件"""
+    def read_one(dep_name):
+        try:
+            with sftp.open(f"{dep_tree_base}/{dep_name}", 'rb') as f:
+                return dep_name, f.read()
+        except IOError:
+            return dep_name, None
+
+    with ThreadPoolExecutor(max_workers=min(8, len(dep_names))) as executor:
+        return {name: data for name, data in executor.map(read_one, dep_names) if data is not None}
+
+
+def _fetch_dep_files(sftp, dep_tree_base, dep_names):
+    """批量读取一层依赖的 .dep 文件，返回 {文件名: 内容}"""
+    if not dep_names: return {}
+    if not _GLOBAL_SSH:
+        get_sftp_session()
+    if _GLOBAL_SSH:
+        try:
+            contents = _fetch_dep_files_exec(dep_tree_base, dep_names)
+            if contents is not None:
+                return contents
+        except Exception:
+            pass
+    return _fetch_dep_files_sftp(sftp, dep_tree_base, dep_names)
+
+
+def _sync_dep_tree_mirror(sftp, lean_remote_path):
+    """
+    在 lean_local_path 下维护服务器 dep_tree 的镜像：一次 listdir_attr 比较每个文件的 mtime 和大小，
+    只重新下载变化的文件。返回镜像目录，服务器不可列目录时返回 None。
+    """
+    dep_tree_base = f"{lean_remote_path}/dep_tree"
+    if lean_transport.is_local_transport(sftp):
+        # 文件系统可直接访问时不需要镜像
+        return dep_tree_base if os.path.isdir(dep_tree_base) else None
+    if lean_transport.is_http_transport(sftp):
+        # 静态服务器的目录列表没有大小和修改时间，依赖解析使用发布的 gis-closure.json 或逐个下载 .dep
+        return None
+    try:
+        attrs = sftp.listdir_attr(dep_tree_base)
+    except IOError:
+        return None
+
+    key = lean_cache.cache_key(lean_remote_path)
+    mirror_dir = os.path.join(os.path.dirname(lean_cache.cache_path("dep_tree", key)), key)
+    os.makedirs(mirror_dir, exist_ok=True)
+    manifest_path = lean_cache.cache_path("dep_tree", f"{key}.json")
+    manifest = lean_cache.load_json(manifest_path, {})
+
+    remote_files = {attr.filename: [attr.st_mtime, attr.st_size] for attr in attrs
+                    if stat.S_ISREG(attr.st_mode) and not attr.filename.startswith('.')}
+
+    for dep_name in set(manifest) - set(remote_files):
+        try:
+            os.remove(os.path.join(mirror_dir, dep_name))
+        except OSError:
+            pass
+
+    changed = [n for n, remote_stat in remote_files.items()
+               if manifest.get(n) != remote_stat or not os.path.isfile(os.path.join(mirror_dir, n))]
+    if changed:
+        contents = _fetch_dep_files(sftp, dep_tree_base, changed)
+        for dep_name in changed:
+            if dep_name not in contents:
+                # 本次没取到，不记录状态，下次重新下载
+                remote_files.pop(dep_name)
+                continue
+            with open(os.path.join(mirror_dir, dep_name), 'wb') as f:
+                f.write(contents[dep_name])
+
+    lean_cache.save_json(manifest_path, remote_files)
+    return mirror_dir
+
+
+def _read_local_dep_files(mirror_dir, dep_names):
+    contents = {}
+    for dep_name in dep_names:
+        try:
+            with open(os.path.join(mirror_dir, dep_name), 'rb') as f:
+                contents[dep_name] = f.read()
+        except OSError:
+            continue
+    return contents
+
+
+def _read_local_dep_closure(mirror_dir):
+    contents = _read_local_dep_files(mirror_dir, [lean_catalog.CLOSURE_FILENAME])
+    if lean_catalog.CLOSURE_FILENAME not in contents:
+        return None
+    return lean_catalog.load_dep_closure(contents[lean_catalog.CLOSURE_FILENAME])
+
+
+def _dep_closure_is_stale(sftp, lean_remote_path, mirror_dir):
+    """有 .dep 的修改时间晚于 gis-closure.json（修改了 .dep 之后没有重新运行 gis lean index）时闭包不可信"""
+    if lean_transport.is_local_transport(sftp):
+        mtimes = {entry.name: entry.stat().st_mtime for entry in os.scandir(mirror_dir) if entry.is_file()}
+    else:
+        # 镜像记录的是服务器上的修改时间
+        key = lean_cache.cache_key(lean_remote_path)
+        manifest = lean_cache.load_json(lean_cache.cache_path("dep_tree", f"{key}.json"), {})
+        mtimes = {name: remote_stat[0] for name, remote_stat in manifest.items()}
+    closure_mtime = mtimes.get(lean_catalog.CLOSURE_FILENAME)
+    if closure_mtime is None:
+        return False
+    return any(mtime > closure_mtime for name, mtime in mtimes.items() if name.endswith('.dep'))
 
 
-def execute_remote_copy(repo_path, remote_copy_cmds):
+def _walk_dep_tree(fetch_dep_files, dep_tree_base, requirements_list, remote_copy_cmds):
+    """按层（BFS）批量读取 .dep：每一层只需一次读取，耗时取决于依赖深度而不是包的数量"""
+    checked_keys = set()
+    frontier = [item.copy() for item in requirements_list]
+
+    while frontier:
+        level = []
+        for item in frontier:
+            current_key = f"{item['name']}@{item['version']}" if item['version'] else item['name']
+            if current_key in checked_keys: continue
+            checked_keys.add(current_key)
+            level.append(item)
+
+        dep_names = []
+        for item in level:
+            for dep_name in _dep_candidates(item):
+                if dep_name not in dep_names:
+                    dep_names.append(dep_name)
+        contents = fetch_dep_files(dep_names)
+
+        frontier = []
+        for item in level:
+            found_dep_name = next((n for n in _dep_candidates(item) if n in contents), None)
+            if not found_dep_name: continue
+            try:
+                requires, cmds = _parse_dep_lines(contents[found_dep_name].splitlines())
+                for dep_item in _merge_dep_file(requires, cmds, requirements_list, remote_copy_cmds):
+                    dep_key = f"{dep_item['name']}@{dep_item['version']}" if dep_item['version'] else dep_item['name']
+                    if dep_key not in checked_keys:
+                        frontier.append(dep_item)
+            except Exception as e:
+                print(f"Warning: Error parsing dep file {dep_tree_base}/{found_dep_name}: {e}")
+
+
+def execute_remote_copy(repo_path, remote_copy_cmds, done_keys=()):
     if not remote_copy_cmds: return
 
     local_packages = get_local_packages()
     local_lookup = {}
     for unique_key, info in local_packages.items():
-        if info.get('name'):
-            local_lookup.setdefault(info['name'], []).append(unique_key)
+        if info.name:
+            local_lookup.setdefault(info.name, []).append(unique_key)
 
     for (pkg_name, pkg_version), cmds in remote_copy_cmds.items():
+        if (pkg_name, pkg_version) in done_keys: continue
         real_unique_key = find_real_package_key(pkg_name, pkg_version, local_lookup, local_packages)
 
         if not real_unique_key:
@@ -789,7 +1808,7 @@ def execute_remote_copy(repo_path, remote_copy_cmds):
                 Fore.YELLOW + f"Warning: Cannot execute remote copy for '{pkg_name}{ver_msg}', package not found locally." + Style.RESET_ALL)
             continue
 
-        base_source_dir = local_packages[real_unique_key]['full_path']
+        base_source_dir = local_packages[real_unique_key].full_path
 
         for operation in cmds:
             try:
@@ -801,7 +1820,7 @@ def execute_remote_copy(repo_path, remote_copy_cmds):
                     full_source = os.path.join(base_source_dir, source)
                     items = glob.glob(full_source)
                     if items:
-                        print(f"Executing {pkg_name}: {command} {source} -> {dest}")
+                        _print_line(f"Executing {pkg_name}: {command} {source} -> {dest}")
                         for item in items:
                             if command == "copy":
                                 if os.path.isfile(item):
@@ -812,7 +1831,7 @@ def execute_remote_copy(repo_path, remote_copy_cmds):
                             elif command == "move":
                                 shutil.move(item, abs_dest)
             except Exception as e:
-                print(f"Error executing remote copy: {e}")
+                _print_line(f"Error executing remote copy: {e}")
 
 
 def get_lean_mainfest_depurl(args, manifest_directory, root_only=False):
@@ -861,19 +1880,30 @@ def get_lean_mainfest_depurl(args, manifest_directory, root_only=False):
     return list(set(manifests_url))
 
 
+def get_target_compiler(args):
+    if getattr(args, 'compiler', None):
+        return args.compiler.upper()
+    target_file = args.target_manifests[0] if args.target_manifests else args.manifest_filename
+    return get_project_compiler(os.getcwd(), target_file)
+
+
+def _server_package_is_newer(target_info, target_key, local_info, package_digests):
+    """安装时记录的归档摘要与服务器发布的一致时，修改时间变化（例如重新上传同一文件）不算更新"""
+    if target_info.sha256 and package_digests.get(target_key, {}).get('sha256') == target_info.sha256:
+        return False
+    return target_info.mtime > local_info.mtime
+
+
 def compare_packages(args, sftp, lean_remote_path):
     global unresolved_packages, missing_packages, missing_packages_, need_update_packages, need_update_packages_
-    if getattr(args, 'compiler', None):
-        target_compiler = args.compiler.upper()
-    else:
-        target_file = args.target_manifests[0] if args.target_manifests else args.manifest_filename
-        target_compiler = get_project_compiler(os.getcwd(), target_file)
+    target_compiler = get_target_compiler(args)
 
     print(f"Target Compiler: {Fore.CYAN}{target_compiler}{Style.RESET_ALL}")
 
     requirements, _ = get_lean_mainfest_packages(args, os.getcwd(), sftp=sftp, lean_remote_path=lean_remote_path)
     local_packages_map = get_local_packages()
-    server_packages_map = get_server_packages(sftp, lean_remote_path)
+    package_digests = load_package_digests()
+    force_rescan = getattr(args, 'rescan', False)
 
     unresolved_packages, missing_packages, missing_packages_ = [], [], []
     need_update_packages, need_update_packages_ = [], []
@@ -882,173 +1912,591 @@ def compare_packages(args, sftp, lean_remote_path):
         pkg_name, req_version_str = req['name'], req['version']
         target_version_info = None
 
-        if pkg_name not in server_packages_map:
-            unresolved_packages.append(pkg_name)
+        try:
+            target_version_info = resolve_server_package(sftp, lean_remote_path, pkg_name, req_version_str,
+                                                         target_compiler, force_rescan)
+        except InvalidVersion:
+            print(Fore.RED + f"Error: Invalid version format '{req_version_str}'" + Style.RESET_ALL)
+
+        if not target_version_info:
+            if not server_has_package(sftp, lean_remote_path, pkg_name, target_compiler):
+                unresolved_packages.append(pkg_name)
+            else:
+                req_str = f"=={req_version_str}" if req_version_str else ""
+                unresolved_packages.append(f"{pkg_name}{req_str}")
             continue
 
-        all_versions = server_packages_map[pkg_name]
+        target_version_str = target_version_info.version_str
+        full_remote_path = target_version_info.full_path
+        found_compiler = target_version_info.compiler
 
-        if req_version_str is not None:
-            try:
-                req_version_obj = parse_version(req_version_str)
-                match = next(
-                    (v for v in all_versions if v['version'] == req_version_obj and v['compiler'] == target_compiler),
-                    None)
+        target_key = f"{pkg_name}@{target_version_str}@{found_compiler}"
 
-                if match:
-                    target_version_info = match
-                else:
-                    match_any_compiler = next((v for v in all_versions if v['version'] == req_version_obj), None)
-                    if match_any_compiler:
-                        print(
-                            Fore.YELLOW + f"Warning: Found '{pkg_name}=={req_version_str}' in '{match_any_compiler['compiler']}' (Target is {target_compiler}). Using it." + Style.RESET_ALL)
-                        target_version_info = match_any_compiler
+        if target_key not in local_packages_map:
+            missing_packages.append(target_key)
+            missing_packages_.append(full_remote_path)
+        else:
+            local_info = local_packages_map[target_key]
+            if _server_package_is_newer(target_version_info, target_key, local_info, package_digests):
+                print(f"{target_key} needs update.")
+                need_update_packages.append(target_key)
+                need_update_packages_.append(full_remote_path)
 
-            except InvalidVersion:
-                print(Fore.RED + f"Error: Invalid version format '{req_version_str}'" + Style.RESET_ALL)
-                pass
 
-        else:
-            target_compiler_versions = [v for v in all_versions if v['compiler'] == target_compiler]
+def progress_bar(current, total):
+    if total > 0:
+        percent = (current / total) * 100
+        bar_length = 50
+        block = int(bar_length * current // total)
+        progress = "#" * block + "-" * (bar_length - block)
+        print(f"\r[{progress}] {percent:.2f}%", end='')
 
-            def find_best_in_list(ver_list):
-                stable = [v for v in ver_list if v['location'] == 'stable']
-                common = [v for v in ver_list if v['location'] == 'common']
-                if stable: return max(stable, key=lambda v: v['version'])
-                if common: return max(common, key=lambda v: v['version'])
-                return None
 
-            if target_compiler_versions:
-                target_version_info = find_best_in_list(target_compiler_versions)
+def extract_file(file_path, extract_to, show_progress=True, remove_archive=True):
+    if file_path.endswith('.zip'):
+        with zipfile.ZipFile(file_path, 'r') as zip_ref:
+            total_files = len(zip_ref.namelist())
+            with tqdm(total=total_files, desc="Unzipping", unit="file", disable=not show_progress) as pbar:
+                for file_info in zip_ref.infolist():
+                    zip_ref.extract(file_info, extract_to)
+                    pbar.update(1)
+    elif file_path.endswith('.rar'):
+        with rarfile.RarFile(file_path, 'r') as rar_ref:
+            total_files = len(rar_ref.namelist())
+            with tqdm(total=total_files, desc="Unzipping", unit="file", disable=not show_progress) as pbar:
+                for file_info in rar_ref.infolist():
+                    rar_ref.extract(file_info, extract_to)
+                    pbar.update(1)
+    elif file_path.endswith('.tar') or file_path.endswith('.tar.gz') or file_path.endswith('.tgz'):
+        with tarfile.open(file_path, 'r:*') as tar_ref:
+            total_files = len(tar_ref.getmembers())
+            with tqdm(total=total_files, desc="Unzipping", unit="file", disable=not show_progress) as pbar:
+                for member in tar_ref.getmembers():
+                    tar_ref.extract(member, extract_to)
+                    pbar.update(1)
+    elif file_path.endswith('.7z'):
+        with py7zr.SevenZipFile(file_path, mode='r') as archive:
+            total_files = len(archive.getnames())
+            with tqdm(total=total_files, desc="Unzipping", unit="file", disable=not show_progress) as pbar:
+                archive.extractall(path=extract_to)
+                pbar.update(total_files)
+    else:
+        return
+    if not remove_archive:
+        return
+    try:
+        os.remove(file_path)
+    except Exception as e:
+        print(f"Error deleting archive: {e}")
+
+
+_DOWNLOAD_LOG_LOCK = threading.Lock()
+_PRINT_LOCK = threading.Lock()
+
+
+def _print_line(message):
+    """多个下载线程同时输出时保证每条消息占完整的一行"""
+    with _PRINT_LOCK:
+        sys.stdout.write(f"{message}\n")
+        sys.stdout.flush()
+
+
+def _record_download_time(final_dir_name, local_zip_path):
+    try:
+        download_time = datetime.fromtimestamp(os.path.getmtime(local_zip_path)).isoformat()
+        log_path = os.path.join(lean_local_path, "download.log")
+        logs = {}
+        if os.path.exists(log_path):
+            with open(log_path, 'r') as f:
+                content = f.read()
+                if content: logs = ast.literal_eval(content)
+        logs[final_dir_name] = download_time
+        with open(log_path, 'w') as f:
+            f.write(str(logs))
+    except Exception:
+        pass
+
+
+def _package_target_names(full_remote_path):
+    package_filename = os.path.basename(full_remote_path)
+    filename_no_ext = os.path.splitext(package_filename)[0]
+    if filename_no_ext.endswith('.tar'):
+        filename_no_ext = os.path.splitext(filename_no_ext)[0]
+    base_package_name = filename_no_ext
+
+    # 【正则修改】支持 GCC12.3.0
+    compiler_tag = "Unknown"
+    match = re.search(r'/(VS\d+|GCC[\d\.]+|CLANG[\d\.]+|GCC)/', full_remote_path, re.IGNORECASE)
+    if match:
+        compiler_tag = match.group(1).upper()
+
+    return package_filename, compiler_tag, f"{base_package_name}@{compiler_tag}"
+
+
+DOWNLOAD_READ_SIZE = 256 * 1024
+
+
+def get_sftp_read_tuning():
+    """流水线读取的请求大小和窗口，可通过配置项 lean_sftp_request_size / lean_sftp_window 调整"""
+    return (show_number_config("lean_sftp_request_size", SFTP_REQUEST_SIZE, minimum=1024),
+            show_number_config("lean_sftp_window", SFTP_WINDOW, minimum=1))
+
+
+def _iter_download_blocks(sftp, remote_path, offset, length):
+    """按顺序产出归档 [offset, offset + length) 的数据：HTTP 后端用 Range 分块并发下载，SFTP 使用流水线读取"""
+    if hasattr(sftp, 'iter_range'):
+        yield from sftp.iter_range(remote_path, offset, length)
+        return
+    request_size, window = get_sftp_read_tuning()
+    with sftp.open(remote_path, 'rb') as remote_file:
+        yield from iter_remote_read(remote_file, offset, length, request_size, window)
+
+
+def _resumable_get(sftp, remote_path, local_path, attr, expected_sha256=None, callback=None, iter_blocks=None):
+    """
+    下载到 <local_path>.part：已有的 .part 属于同一个远程文件（大小、修改时间一致）时从其末尾继续，
+    sha256 在数据到达时逐块计算（续传时先补算已有部分），不需要下载后再读一遍文件；
+    按服务器大小和 expected_sha256 校验通过后再改名为 local_path，损坏的归档不会进入解压。
+    iter_blocks(offset, length) 替代直接从 sftp 读取（例如由本地块拼出归档）。
+    返回 (续传的起始字节数, sha256)。
+    """
+    part_path = f"{local_path}.part"
+    meta_path = f"{part_path}.json"
+    remote_stat = [attr.st_size, attr.st_mtime]
+    total_size = attr.st_size
+
+    offset = 0
+    if os.path.exists(part_path) and lean_cache.load_json(meta_path) == remote_stat:
+        offset = os.path.getsize(part_path)
+    if offset > total_size:
+        offset = 0
+    if not offset:
+        lean_cache.save_json(meta_path, remote_stat)
+
+    digest = hashlib.sha256()
+    if offset:
+        with open(part_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(DOWNLOAD_READ_SIZE), b''):
+                digest.update(chunk)
+
+    progress = throttle_progress(callback) if callback else None
+    with open(part_path, 'ab' if offset else 'wb') as local_file:
+        transferred = offset
+        blocks = iter_blocks(offset, total_size - offset) if iter_blocks else \
+            _iter_download_blocks(sftp, remote_path, offset, total_size - offset)
+        for data in blocks:
+            local_file.write(data)
+            digest.update(data)
+            transferred += len(data)
+            if progress:
+                progress(transferred, total_size)
+
+    if transferred != total_size:
+        raise IOError(f"size mismatch, got {transferred} of {total_size} bytes")
+    sha256 = digest.hexdigest()
+    if expected_sha256 and sha256 != expected_sha256.lower():
+        # 内容损坏时不能再续传，丢弃 .part 从头下载
+        os.remove(part_path)
+        os.remove(meta_path)
+        raise IOError(f"sha256 mismatch (expected {expected_sha256}, got {sha256}), discarded the downloaded file")
+
+    os.replace(part_path, local_path)
+    try:
+        os.remove(meta_path)
+    except OSError:
+        pass
+    return offset, sha256
+
+
+def _published_sha256(sftp, full_remote_path):
+    """归档的发布摘要：优先取 gis-catalog.json 中的记录，其次是服务器上的 <归档>.sha256 旁路文件"""
+    record = _server_package_records().get(full_remote_path)
+    if record and record.sha256:
+        return record.sha256
+    try:
+        with sftp.open(f"{full_remote_path}.sha256", 'rb') as f:
+            content = f.read(4096).decode('utf-8', 'ignore').split()
+    except (IOError, OSError):
+        return None
+    if content and re.fullmatch(r'[0-9a-fA-F]{64}', content[0]):
+        return content[0].lower()
+    return None
+
+
+def _record_package_digest(final_dir_name, archive_name, size, sha256, verified):
+    """记录已安装包的归档摘要，状态检查可以直接信任，无需重新计算"""
+    digests_path = lean_cache.cache_path("digests.json")
+    digests = lean_cache.load_json(digests_path, {})
+    digests[final_dir_name] = {'archive': archive_name, 'size': size, 'sha256': sha256, 'verified': verified,
+                               'time': time.time()}
+    lean_cache.save_json(digests_path, digests)
+
+
+def load_package_digests():
+    return lean_cache.load_json(lean_cache.cache_path("digests.json"), {})
+
+
+# 安装后保留的归档：.gis_cache/archives/<包目录名><扩展名>，gis lean serve 把它们提供给同伴，
+# 下载新版本时按块列表从中复用相同的块；同一个包（同一编译器）只保留最近的 ARCHIVE_KEEP_VERSIONS 个版本
+ARCHIVE_CACHE_DIR = "archives"
+ARCHIVE_KEEP_VERSIONS = 2
+
+
+# 本机运行过 gis lean serve 的标记，此后下载的归档都会保留，供下次启动时提供给同伴
+PEER_SERVE_MARKER = "peer_serve.json"
+
+
+def _keep_archives_enabled():
+    """
+    默认解压后删除归档。以下情况保留：配置项 lean_keep_archives 为 true、lean_chunks 为 true
+    （按块复用需要旧版本的归档）、或本机运行过 gis lean serve
+    """
+    if show_config("lean_keep_archives") is True or _chunks_enabled():
+        return True
+    return os.path.isfile(lean_cache.cache_path(PEER_SERVE_MARKER))
+
+
+def kept_archive_path(final_dir_name, package_filename):
+    """包目录名唯一（含版本和编译器），不同编译器目录下的同名归档不会互相覆盖"""
+    base_package_name = final_dir_name.rsplit('@', 1)[0]
+    return lean_cache.cache_path(ARCHIVE_CACHE_DIR, f"{final_dir_name}{package_filename[len(base_package_name):]}")
+
+
+def _prune_kept_archives(digests, final_dir_name):
+    """删除同一个包、同一编译器更早版本的保留归档，只保留最近下载的 ARCHIVE_KEEP_VERSIONS 个"""
+    package_name, compiler_tag = final_dir_name.split('@', 1)[0], final_dir_name.rsplit('@', 1)[-1]
+    kept = [(record.get('time', 0), name) for name, record in digests.items()
+            if record.get('path') and name.split('@', 1)[0] == package_name
+            and name.rsplit('@', 1)[-1] == compiler_tag]
+    for _, name in sorted(kept, reverse=True)[ARCHIVE_KEEP_VERSIONS:]:
+        try:
+            os.remove(os.path.join(lean_local_path, digests[name].pop('path')))
+        except OSError:
+            pass
+
+
+def _keep_package_archive(final_dir_name, local_zip_path, say=print):
+    """解压成功后把归档移到 .gis_cache/archives，并在摘要记录中写入归档名和路径（相对 lean_local_path）"""
+    if not _keep_archives_enabled():
+        try:
+            os.remove(local_zip_path)
+        except OSError as e:
+            say(f"Error deleting archive: {e}")
+        return None
+    kept_path = kept_archive_path(final_dir_name, os.path.basename(local_zip_path))
+    try:
+        os.replace(local_zip_path, kept_path)
+    except OSError as e:
+        say(Fore.YELLOW + f"Warning: Unable to keep the archive of {final_dir_name}: {e}" + Style.RESET_ALL)
+        return None
+    # 并行解压时多个线程会同时更新摘要记录
+    with _DOWNLOAD_LOG_LOCK:
+        digests_path = lean_cache.cache_path("digests.json")
+        digests = lean_cache.load_json(digests_path, {})
+        record = digests.get(final_dir_name)
+        if record is not None:
+            record['archive'] = os.path.basename(kept_path)
+            record['path'] = os.path.relpath(kept_path, lean_local_path)
+            _prune_kept_archives(digests, final_dir_name)
+            lean_cache.save_json(digests_path, digests)
+    return kept_path
+
+
+# 同伴缓存：{地址: (HttpTransport, {包目录名: 记录})}，不可达的同伴记为 None，本次运行内不再尝试
+_PEER_INDEXES = {}
+_PEER_LOCK = threading.Lock()
+# 本次运行从同伴缓存下载的包数和字节数
+_PEER_STATS = {'packages': 0, 'bytes': 0}
+
+
+def get_lean_peers():
+    """配置项 lean_peers：同伴缓存地址列表（或逗号分隔的字符串），按顺序优先于中心服务器"""
+    peers = show_config("lean_peers") or []
+    if isinstance(peers, str):
+        peers = peers.split(',')
+    return [str(peer).strip().rstrip('/') for peer in peers if str(peer).strip()]
+
+
+def _load_peer(peer_url):
+    with _PEER_LOCK:
+        if peer_url in _PEER_INDEXES:
+            return _PEER_INDEXES[peer_url]
+        peer = None
+        try:
+            transport = lean_transport.HttpTransport(peer_url, '/', timeout=lean_peer.PEER_TIMEOUT)
+            body, _ = transport.fetch_if_modified(f"/{lean_peer.PEER_INDEX_FILENAME}")
+            packages = lean_peer.load_peer_index(body)
+            if packages is not None:
+                peer = (transport, packages)
+        except (ValueError, OSError, http.client.HTTPException) as e:
+            _print_line(Fore.YELLOW + f"Peer cache {peer_url} is unavailable: {e}" + Style.RESET_ALL)
+        _PEER_INDEXES[peer_url] = peer
+        return peer
+
+
+def find_peer_archives(final_dir_name, attr, expected_sha256):
+    """
+    按 lean_peers 的顺序返回持有该归档的同伴 [(地址, HttpTransport, 记录)]。
+    大小必须与服务器一致；服务器发布了摘要时摘要也必须一致，否则要求同伴的副本下载于服务器归档最后修改之后。
+    """
+    found = []
+    for peer_url in get_lean_peers():
+        peer = _load_peer(peer_url)
+        record = peer[1].get(final_dir_name) if peer else None
+        if not record or record.get('size') != attr.st_size:
+            continue
+        if expected_sha256:
+            if str(record.get('sha256', '')).lower() != expected_sha256.lower():
+                continue
+        elif not attr.st_mtime or record.get('time', 0) < attr.st_mtime:
+            continue
+        found.append((peer_url, peer[0], record))
+    return found
+
+
+# 本次运行通过块列表下载的归档：从本地旧版本复用的字节数和从服务器读取的字节数
+_CHUNK_STATS = {'packages': 0, 'reused': 0, 'fetched': 0}
+_CHUNK_LOCK = threading.Lock()
+
+
+def _chunks_enabled():
+    """配置项 lean_chunks 为 true 时使用服务器发布的块列表下载（并保留归档供以后的版本复用），默认整体下载"""
+    return show_config("lean_chunks") is True
+
+
+def _local_chunk_record_path(final_dir_name):
+    return lean_cache.cache_path("chunks", f"{lean_cache.cache_key(final_dir_name)}.json")
+
+
+def _load_remote_chunk_index(sftp, full_remote_path, attr, expected_sha256):
+    """
+    读取服务器上的 <归档>.chunks.json。块列表必须属于当前的归档：大小一致，
+    且修改时间一致（精确到秒）或其中的 sha256 与发布摘要一致；否则返回 None。
+    """
+    if not _chunks_enabled() or attr.st_size < lean_chunks.CHUNK_MIN_ARCHIVE:
+        return None
+    try:
+        with sftp.open(f"{full_remote_path}{lean_chunks.CHUNK_INDEX_SUFFIX}", 'rb') as f:
+            index = lean_chunks.load_chunk_index(f.read())
+    except (IOError, OSError):
+        return None
+    if not index or index['size'] != attr.st_size:
+        return None
+    if expected_sha256:
+        if index.get('sha256') != expected_sha256.lower():
+            return None
+    elif not attr.st_mtime or int(index.get('mtime') or 0) != int(attr.st_mtime):
+        return None
+    return index
+
 
-            if not target_version_info:
-                print(
-                    Fore.YELLOW + f"Warning: No version found for '{pkg_name}' in {target_compiler}. Searching all compilers..." + Style.RESET_ALL)
-                target_version_info = find_best_in_list(all_versions)
+def _load_local_chunks(final_dir_name):
+    """
+    同名包（任意版本、编译器）安装后保留在 .gis_cache/archives 中的归档的块，来自下载时记录的块列表。
+    文件名前缀只用于粗筛（opencv 的前缀也会匹配 opencv_contrib），包名以保留的归档名（<包目录名><扩展名>）为准
+    """
+    local = lean_chunks.LocalChunks()
+    package_name = final_dir_name.split('@', 1)[0]
+    prefix = f"{lean_cache.cache_key(package_name)}_"
+    records_dir = os.path.dirname(_local_chunk_record_path(final_dir_name))
+    for file_name in os.listdir(records_dir):
+        if not file_name.startswith(prefix) or not file_name.endswith('.json'): continue
+        record = lean_cache.load_json(os.path.join(records_dir, file_name))
+        if not record or not record.get('archive') or not record.get('chunks'): continue
+        if os.path.basename(record['archive']).split('@', 1)[0] != package_name: continue
+        local.add_archive(os.path.join(lean_local_path, record['archive']), record)
+    return local
+
+
+def _record_local_chunks(final_dir_name, archive_name, index):
+    """记录归档安装后保留的路径（相对 lean_local_path）；下载的文件在解压后才移到那里。不保留归档时不记录"""
+    if not _keep_archives_enabled():
+        return
+    kept_path = kept_archive_path(final_dir_name, archive_name)
+    lean_cache.save_json(_local_chunk_record_path(final_dir_name),
+                         {'archive': os.path.relpath(kept_path, lean_local_path), 'size': index['size'],
+                          'chunks': index['chunks']})
 
-        if not target_version_info:
-            req_str = f"=={req_version_str}" if req_version_str else ""
-            unresolved_packages.append(f"{pkg_name}{req_str}")
-            continue
 
-        target_version_str = target_version_info['version_str']
-        full_remote_path = target_version_info['full_path']
-        server_time = target_version_info['time']
-        found_compiler = target_version_info['compiler']
+def _download_chunked(sftp, full_remote_path, local_zip_path, final_dir_name, attr, expected_sha256, index,
+                      callback):
+    """按块列表下载：本地旧版本中已有的块直接复制，只从服务器读取缺少的字节范围；本地没有任何块时返回 None"""
+    local = _load_local_chunks(final_dir_name)
+    if not len(local):
+        return None
+    fetched = [0]
 
-        target_key = f"{pkg_name}@{target_version_str}@{found_compiler}"
+    def fetch_range(offset, length):
+        fetched[0] += length
+        return _iter_download_blocks(sftp, full_remote_path, offset, length)
 
-        if target_key not in local_packages_map:
-            missing_packages.append(target_key)
-            missing_packages_.append(full_remote_path)
-        else:
-            local_info = local_packages_map[target_key]
-            if server_time > local_info['time']:
-                print(f"{target_key} needs update.")
-                need_update_packages.append(target_key)
-                need_update_packages_.append(full_remote_path)
+    try:
+        resumed, sha256 = _resumable_get(sftp, full_remote_path, local_zip_path, attr, expected_sha256, callback,
+                                         iter_blocks=local.assemble(index, fetch_range))
+    finally:
+        local.close()
+    with _CHUNK_LOCK:
+        _CHUNK_STATS['packages'] += 1
+        _CHUNK_STATS['reused'] += local.reused
+        _CHUNK_STATS['fetched'] += fetched[0]
+    return resumed, sha256
 
 
-def progress_bar(current, total):
-    if total > 0:
-        percent = (current / total) * 100
-        bar_length = 50
-        block = int(bar_length * current // total)
-        progress = "#" * block + "-" * (bar_length - block)
-        print(f"\r[{progress}] {percent:.2f}%", end='')
+def _download_from_peers(local_zip_path, final_dir_name, attr, expected_sha256, callback, say):
+    """依次尝试持有该归档的同伴缓存，返回 (续传的起始字节数, sha256, 同伴地址)，都失败时同伴地址为 None"""
+    for peer_url, transport, record in find_peer_archives(final_dir_name, attr, expected_sha256):
+        try:
+            resumed, sha256 = _resumable_get(transport, f"{lean_peer.PEER_ARCHIVE_PREFIX}{record['archive']}",
+                                             local_zip_path, attr, expected_sha256 or record['sha256'], callback)
+            with _PEER_LOCK:
+                _PEER_STATS['packages'] += 1
+                _PEER_STATS['bytes'] += attr.st_size - resumed
+            return resumed, sha256, peer_url
+        except Exception as e:
+            say(Fore.YELLOW + f"Peer cache {peer_url} failed for {final_dir_name}: {e}" + Style.RESET_ALL)
+            if not expected_sha256:
+                # 没有发布摘要时无法验证同伴已写入的部分，从服务器重新下载
+                for path in (f"{local_zip_path}.part", f"{local_zip_path}.part.json"):
+                    if os.path.exists(path): os.remove(path)
+    return 0, None, None
 
 
-def extract_file(file_path, extract_to):
-    if file_path.endswith('.zip'):
-        with zipfile.ZipFile(file_path, 'r') as zip_ref:
-            total_files = len(zip_ref.namelist())
-            with tqdm(total=total_files, desc="Unzipping", unit="file") as pbar:
-                for file_info in zip_ref.infolist():
-                    zip_ref.extract(file_info, extract_to)
-                    pbar.update(1)
-    elif file_path.endswith('.rar'):
-        with rarfile.RarFile(file_path, 'r') as rar_ref:
-            total_files = len(rar_ref.namelist())
-            with tqdm(total=total_files, desc="Unzipping", unit="file") as pbar:
-                for file_info in rar_ref.infolist():
-                    rar_ref.extract(file_info, extract_to)
-                    pbar.update(1)
-    elif file_path.endswith('.tar') or file_path.endswith('.tar.gz') or file_path.endswith('.tgz'):
-        with tarfile.open(file_path, 'r:*') as tar_ref:
-            total_files = len(tar_ref.getmembers())
-            with tqdm(total=total_files, desc="Unzipping", unit="file") as pbar:
-                for member in tar_ref.getmembers():
-                    tar_ref.extract(member, extract_to)
-                    pbar.update(1)
-    elif file_path.endswith('.7z'):
-        with py7zr.SevenZipFile(file_path, mode='r') as archive:
-            total_files = len(archive.getnames())
-            with tqdm(total=total_files, desc="Unzipping", unit="file") as pbar:
-                archive.extractall(path=extract_to)
-                pbar.update(total_files)
-    else:
-        return
+def _download_archive(sftp, full_remote_path, local_zip_path, final_dir_name, attr, expected_sha256, callback, say):
+    """
+    先按 lean_peers 的顺序从局域网同伴缓存下载，同伴没有、不可达或校验失败时从 lean 服务器下载。
+    同伴的数据按发布摘要（没有时按同伴记录的摘要）逐块校验，续传使用同一个 .part 文件。
+    服务器为归档发布了块列表时，复用本地旧版本中相同的块，只读取变化的部分，并记录块列表供以后的版本使用。
+    返回 (续传的起始字节数, sha256, 同伴地址或 None)。
+    """
+    chunk_index = None
+    if not lean_transport.is_local_transport(sftp):
+        chunk_index = _load_remote_chunk_index(sftp, full_remote_path, attr, expected_sha256)
+        if chunk_index and not expected_sha256:
+            expected_sha256 = chunk_index['sha256']
+        resumed, sha256, peer_url = _download_from_peers(local_zip_path, final_dir_name, attr, expected_sha256,
+                                                         callback, say)
+        if peer_url:
+            if chunk_index:
+                _record_local_chunks(final_dir_name, os.path.basename(local_zip_path), chunk_index)
+            return resumed, sha256, peer_url
+    if chunk_index:
+        result = _download_chunked(sftp, full_remote_path, local_zip_path, final_dir_name, attr, expected_sha256,
+                                   chunk_index, callback)
+        if result is None:
+            result = _resumable_get(sftp, full_remote_path, local_zip_path, attr, expected_sha256, callback)
+        _record_local_chunks(final_dir_name, os.path.basename(local_zip_path), chunk_index)
+        return result[0], result[1], None
+    resumed, sha256 = _resumable_get(sftp, full_remote_path, local_zip_path, attr, expected_sha256, callback)
+    return resumed, sha256, None
+
+
+def print_transfer_summary():
+    if _PEER_STATS['packages']:
+        print(f"Fetched {_PEER_STATS['packages']} packages ({format_size(_PEER_STATS['bytes'])}) from LAN peer caches.")
+    if _CHUNK_STATS['packages']:
+        print(f"Chunked downloads: {_CHUNK_STATS['packages']} packages, reused {format_size(_CHUNK_STATS['reused'])} "
+              f"from local archives, fetched {format_size(_CHUNK_STATS['fetched'])} from the server.")
+
+
+def serve_lean_peer(args, remaining):
+    """gis lean serve [端口]：把本机已下载的归档只读地提供给局域网内的其他 gis 客户端"""
+    port = remaining[0] if remaining else show_number_config("lean_serve_port", lean_peer.PEER_PORT)
     try:
-        os.remove(file_path)
-    except Exception as e:
-        print(f"Error deleting archive: {e}")
-
+        port = int(port)
+    except (TypeError, ValueError):
+        print(Fore.RED + f"Error: Invalid port '{port}'" + Style.RESET_ALL)
+        return False
+    if not lean_local_path or not os.path.isdir(lean_local_path):
+        print(Fore.RED + f"Error: lean_local_path {lean_local_path} does not exist." + Style.RESET_ALL)
+        return False
 
-def download_package(sftp, full_remote_path):
-    package_filename = os.path.basename(full_remote_path)
-    filename_no_ext = os.path.splitext(package_filename)[0]
-    if filename_no_ext.endswith('.tar'):
-        filename_no_ext = os.path.splitext(filename_no_ext)[0]
-    base_package_name = filename_no_ext
+    try:
+        server = lean_peer.PeerServer(('', port), lean_local_path, load_package_digests)
+    except OSError as e:
+        print(Fore.RED + f"Error: Unable to listen on port {port}: {e}" + Style.RESET_ALL)
+        return False
+    lean_cache.save_json(lean_cache.cache_path(PEER_SERVE_MARKER), {'port': port, 'time': int(time.time())})
+    count = len(server.peer_index()['packages'])
+    print(f"Serving {count} lean archives from {lean_local_path} on http://{socket.gethostname()}:{port}/")
+    print(f"Add this address to lean_peers on other machines. Press Ctrl+C to stop.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopped.")
+    finally:
+        server.server_close()
+    return True
 
-    # 【正则修改】支持 GCC12.3.0
-    compiler_tag = "Unknown"
-    match = re.search(r'/(VS\d+|GCC[\d\.]+|CLANG[\d\.]+|GCC)/', full_remote_path, re.IGNORECASE)
-    if match:
-        compiler_tag = match.group(1).upper()
 
-    final_dir_name = f"{base_package_name}@{compiler_tag}"
-    target_dir_path = os.path.join(lean_local_path, final_dir_name)
+def fetch_package_archive(sftp, full_remote_path, show_progress=True, on_progress=None, errors=None):
+    """
+    下载阶段：把归档下载到 lean_local_path，返回 (是否成功, 包目录名, 本地归档路径)。
+    on_progress(已传输字节数, 总大小) 在不显示进度条时接收下载进度；失败时异常追加到 errors 列表中，
+    调用方据此判断是否是连接问题、是否值得重连后续传。
+    """
+    package_filename, compiler_tag, final_dir_name = _package_target_names(full_remote_path)
     local_zip_path = os.path.join(lean_local_path, package_filename)
+    # 并行下载时不显示进度条，逐行输出
+    say = print if show_progress else _print_line
 
     try:
         os.makedirs(os.path.dirname(local_zip_path), exist_ok=True)
-        total_size = sftp.stat(full_remote_path).st_size
-        print("-" * 35)
-        print(f"Fetching: {final_dir_name} (Compiler: {compiler_tag})")
-        sftp.get(full_remote_path, local_zip_path, callback=lambda x, y: progress_bar(x, total_size))
-        print(f"\nDownload done!")
+        attr = sftp.stat(full_remote_path)
+        total_size = attr.st_size
+        expected_sha256 = _published_sha256(sftp, full_remote_path)
+        if show_progress:
+            print("-" * 35)
+            print(f"Fetching: {final_dir_name} (Compiler: {compiler_tag})")
+            resumed, sha256, peer_url = _download_archive(sftp, full_remote_path, local_zip_path, final_dir_name,
+                                                          attr, expected_sha256,
+                                                          lambda x, y: progress_bar(x, total_size), say)
+            source = f" from peer {peer_url}" if peer_url else ""
+            if resumed:
+                print(f"\nResumed from {format_size(resumed)}, download done{source}!")
+            else:
+                print(f"\nDownload done{source}!")
+        else:
+            say(f"Fetching: {final_dir_name} (Compiler: {compiler_tag}, {format_size(total_size)})")
+            resumed, sha256, peer_url = _download_archive(sftp, full_remote_path, local_zip_path, final_dir_name,
+                                                          attr, expected_sha256, on_progress, say)
+            say(f"Download done: {final_dir_name}" + (f" (resumed from {format_size(resumed)})" if resumed else "")
+                + (f" from peer {peer_url}" if peer_url else ""))
+        if expected_sha256:
+            say(f"sha256 verified: {final_dir_name}")
     except Exception as e:
-        print(f"\nFetch failed! {e}")
-        return 1, final_dir_name
-
-    try:
-        download_time = datetime.fromtimestamp(os.path.getmtime(local_zip_path)).isoformat()
-        log_path = os.path.join(lean_local_path, "download.log")
-        logs = {}
-        if os.path.exists(log_path):
-            with open(log_path, 'r') as f:
-                content = f.read()
-                if content: logs = ast.literal_eval(content)
-        logs[final_dir_name] = download_time
-        with open(log_path, 'w') as f:
-            f.write(str(logs))
-    except Exception:
-        pass
+        if errors is not None:
+            errors.append(e)
+        say(f"\nFetch failed! {final_dir_name}: {e}" if show_progress else f"Fetch failed! {final_dir_name}: {e}")
+        partial_size = os.path.getsize(f"{local_zip_path}.part") if os.path.exists(f"{local_zip_path}.part") else 0
+        if partial_size:
+            say(f"Kept {format_size(partial_size)} of {final_dir_name} in a .part file, the next update resumes from there.")
+        return False, final_dir_name, local_zip_path
+
+    # 并行下载时多个线程会同时更新 download.log 和摘要记录
+    with _DOWNLOAD_LOG_LOCK:
+        _record_download_time(final_dir_name, local_zip_path)
+        _record_package_digest(final_dir_name, package_filename, total_size, sha256, bool(expected_sha256))
+    return True, final_dir_name, local_zip_path
+
+
+def install_package_archive(final_dir_name, local_zip_path, show_progress=True):
+    """解压阶段：解压到临时目录后移动到 <lean_local_path>/<包目录名>，返回 2 成功 / 3 解压失败"""
+    target_dir_path = os.path.join(lean_local_path, final_dir_name)
+    say = print if show_progress else _print_line
 
     if os.path.isdir(target_dir_path):
         shutil.rmtree(target_dir_path, ignore_errors=True)
 
-    print(f"Unzipping to {final_dir_name}...")
+    say(f"Unzipping to {final_dir_name}...")
     try:
         temp_extract_dir = os.path.join(lean_local_path, f"temp_{final_dir_name}")
         if os.path.isdir(temp_extract_dir): shutil.rmtree(temp_extract_dir)
         os.makedirs(temp_extract_dir, exist_ok=True)
 
-        extract_file(local_zip_path, temp_extract_dir)
+        extract_file(local_zip_path, temp_extract_dir, show_progress, remove_archive=False)
 
         extracted_items = os.listdir(temp_extract_dir)
-        if not extracted_items: return 3, final_dir_name
+        if not extracted_items: return 3
 
         source_dir = temp_extract_dir
         if len(extracted_items) == 1:
@@ -1059,33 +2507,233 @@ def download_package(sftp, full_remote_path):
         shutil.move(source_dir, target_dir_path)
 
         if os.path.exists(temp_extract_dir): shutil.rmtree(temp_extract_dir)
+        _keep_package_archive(final_dir_name, local_zip_path, say)
 
-        print(f"Installed successfully: {final_dir_name}")
+        say(f"Installed successfully: {final_dir_name}")
 
         global _CACHE_LOCAL_PACKAGES
         _CACHE_LOCAL_PACKAGES = None
 
-        return 2, final_dir_name
+        return 2
 
     except Exception as e:
-        print(f"Unzip failed: {e}")
-        return 3, final_dir_name
+        say(f"Unzip failed: {final_dir_name}: {e}")
+        return 3
 
 
-def process_manifests(args, manifest_directory):
-    original_directory = os.getcwd()
-    local_has_command_set = set()
+# 连接中断后同一个包最多重新排队的次数，每次都从 .part 文件续传
+DOWNLOAD_RECONNECT_RETRIES = 3
 
+
+def _channel_closed(channel):
     try:
-        os.chdir(manifest_directory)
-        package_operations = {}
+        return channel.get_channel().closed
+    except Exception:
+        return False
+
+
+def recover_lean_connection(channel, errors, generation):
+    """
+    下载失败后判断是否是连接问题（通道或 SSH 连接断开、读超时），是则恢复连接，返回 True 表示应当重试。
+    SSH 连接仍有应答时只需要调用方换一个新通道；没有应答时带退避重连。
+    文件不存在、摘要不一致等其他错误以及不经过 SSH 的后端返回 False。
+    """
+    if lean_transport.is_direct_transport(channel):
+        return False
+    lost = _channel_closed(channel) or not _session_active() or \
+        any(isinstance(e, CONNECTION_ERRORS) for e in errors)
+    if not lost:
+        return False
+    if probe_sftp_session():
+        return True
+    return reconnect_sftp_session(generation) is not None
+
+
+def download_package(sftp, full_remote_path, show_progress=True):
+    for attempt in range(DOWNLOAD_RECONNECT_RETRIES + 1):
+        generation, errors = _SESSION_GENERATION, []
+        ok, final_dir_name, local_zip_path = fetch_package_archive(sftp, full_remote_path, show_progress,
+                                                                   errors=errors)
+        if ok or attempt == DOWNLOAD_RECONNECT_RETRIES or not recover_lean_connection(sftp, errors, generation):
+            break
+        sftp = get_sftp_session()
+        if not sftp: break
+        print(f"Connection restored, resuming {final_dir_name}...")
+    if not ok:
+        return 1, final_dir_name
+    return install_package_archive(final_dir_name, local_zip_path, show_progress), final_dir_name
+
+
+DOWNLOAD_JOBS = 4
+# 自适应并发的上限；OpenSSH 默认每个连接最多 10 个会话（MaxSessions），还要留给共享会话和 exec 通道
+DOWNLOAD_JOBS_MAX = 8
+EXTRACT_JOBS = max(1, min(4, (os.cpu_count() or 2) // 2))
+
+
+def get_download_jobs(args=None):
+    """--jobs 优先，其次是配置项 lean_download_jobs"""
+    jobs = getattr(args, 'jobs', None)
+    return max(1, int(jobs)) if jobs else show_number_config("lean_download_jobs", DOWNLOAD_JOBS, minimum=1)
+
+
+def get_download_job_limit(args=None):
+    """自适应并发的上限：显式指定 --jobs 时固定为该值，否则取配置项 lean_download_jobs_max"""
+    if getattr(args, 'jobs', None):
+        return get_download_jobs(args)
+    return show_number_config("lean_download_jobs_max", DOWNLOAD_JOBS_MAX, minimum=1)
+
+
+def print_download_concurrency():
+    """运行总结：自适应控制器最终稳定的并发数和吞吐"""
+    controller = _DOWNLOAD_CONCURRENCY
+    if controller is None: return
+    message = f"Download concurrency: {controller.limit}"
+    if controller.adaptive:
+        message += f" (adaptive 1-{controller.maximum}, peak {controller.peak_limit}, {controller.backoffs} back-offs)"
+    if controller.best_rate:
+        message += f", peak throughput {format_size(controller.best_rate)}/s"
+    if controller.channel_rate():
+        message += f", {format_size(controller.channel_rate())}/s per channel"
+    print(message)
 
-        local_packages = get_local_packages()
-        local_lookup = {}
-        for unique_key, info in local_packages.items():
-            pkg_name = info.get('name')
-            if pkg_name: local_lookup.setdefault(pkg_name, []).append(unique_key)
 
+def _server_package_records():
+    """已加载的服务器包记录 -> {远程路径: LeanPackage}，提供大小和目录中发布的摘要"""
+    by_path = {}
+    for packages_dict in list(_CACHE_SERVER_PACKAGES.values()):
+        for records in packages_dict.values():
+            for record in records:
+                by_path[record.full_path] = record
+    return by_path
+
+
+def _open_download_channel(sftp):
+    """在共享的 SSH 连接上为下载线程单独打开一个 SFTP 通道，失败时退回共享会话（重连后是新的共享会话）"""
+    if lean_transport.is_direct_transport(sftp):
+        return sftp, False
+    try:
+        channel = _GLOBAL_SSH.open_sftp()
+        channel.get_channel().settimeout(SFTP_CHANNEL_TIMEOUT)
+        return channel, True
+    except Exception:
+        return _GLOBAL_SFTP or sftp, False
+
+
+def download_packages(sftp, package_paths, jobs=1, on_installed=None, max_jobs=None):
+    """
+    下载 -> 解压 -> 拷贝 三级流水线，返回与 download_package 相同的 (num, name) 列表。
+    下载线程（每个线程一个 SFTP 通道，按归档大小从大到小调度）下载完一个包就交给解压线程，
+    然后立即开始下一个下载；解压完成的包交给单独的拷贝线程执行 on_installed(包目录名)，
+    网络、CPU 和磁盘同时保持忙碌。
+    同时下载的数量从 jobs 开始，由 AdaptiveConcurrency 在 [1, max_jobs] 内按总吞吐和错误调整，
+    控制器保存在 _DOWNLOAD_CONCURRENCY 中供运行总结输出。
+    SSH 连接中途断开时，下载失败的包在重连后重新排队，从 .part 文件续传，而不是直接记为失败。
+    """
+    global _DOWNLOAD_CONCURRENCY
+    _DOWNLOAD_CONCURRENCY = None
+    if len(package_paths) <= 1:
+        results = [download_package(sftp, package_path) for package_path in package_paths]
+        if on_installed:
+            for num, name in results:
+                if num == 2: on_installed(name)
+        return results
+
+    records = _server_package_records()
+    ordered = sorted(package_paths, key=lambda p: records[p].size if p in records else 0, reverse=True)
+    max_jobs = max(jobs, max_jobs or jobs)
+    controller = lean_concurrency.AdaptiveConcurrency(jobs, minimum=1 if max_jobs > jobs else jobs, maximum=max_jobs)
+    _DOWNLOAD_CONCURRENCY = controller
+    workers = min(controller.maximum, len(ordered))
+    if controller.adaptive:
+        print(f"Downloading {len(ordered)} packages with {controller.limit} parallel jobs (adaptive, up to {max_jobs}), "
+              f"extracting on {EXTRACT_JOBS} workers...")
+    else:
+        print(f"Downloading {len(ordered)} packages with {workers} parallel jobs, extracting on {EXTRACT_JOBS} workers...")
+
+    local = threading.local()
+    channels = []
+    channels_lock = threading.Lock()
+
+    def copy_stage(final_dir_name):
+        try:
+            on_installed(final_dir_name)
+        except Exception as e:
+            _print_line(Fore.YELLOW + f"Warning: Copy operations for {final_dir_name} failed: {e}" + Style.RESET_ALL)
+
+    def extract_stage(final_dir_name, local_zip_path):
+        num = install_package_archive(final_dir_name, local_zip_path, show_progress=False)
+        if num == 2 and on_installed:
+            copy_executor.submit(copy_stage, final_dir_name)
+        return num, final_dir_name
+
+    def drop_channel():
+        """丢弃当前线程的通道（属于旧连接或已经超时），下一次下载时重新打开"""
+        channel = getattr(local, 'sftp', None)
+        local.sftp = None
+        if channel is not None and getattr(local, 'owned', False):
+            try:
+                channel.close()
+            except Exception:
+                pass
+
+    def thread_channel():
+        if getattr(local, 'sftp', None) is not None and local.generation != _SESSION_GENERATION:
+            drop_channel()
+        if getattr(local, 'sftp', None) is None:
+            local.generation = _SESSION_GENERATION
+            local.sftp, local.owned = _open_download_channel(sftp)
+            if local.owned:
+                with channels_lock:
+                    channels.append(local.sftp)
+            elif not lean_transport.is_direct_transport(sftp):
+                # 服务器拒绝了新的 SFTP 通道（例如达到 MaxSessions），说明并发已经过多
+                controller.record_failure()
+        return local.sftp
+
+    def download_stage(package_path):
+        final_dir_name = _package_target_names(package_path)[2]
+        for attempt in range(DOWNLOAD_RECONNECT_RETRIES + 1):
+            slot = controller.acquire()
+            ok, errors, channel, generation = False, [], None, _SESSION_GENERATION
+            try:
+                channel = thread_channel()
+                ok, final_dir_name, local_zip_path = fetch_package_archive(
+                    channel, package_path, show_progress=False, errors=errors,
+                    on_progress=lambda transferred, total: controller.progress(slot, transferred))
+            finally:
+                # 失败会让控制器减半并发，断线重连期间也不会有更多通道同时重试
+                controller.release(slot, ok)
+            if ok or attempt == DOWNLOAD_RECONNECT_RETRIES or \
+                    not recover_lean_connection(channel, errors, generation):
+                break
+            drop_channel()
+            _print_line(f"Re-queued {final_dir_name}, resuming from the .part file...")
+        if not ok:
+            return 1, final_dir_name
+        return extract_executor.submit(extract_stage, final_dir_name, local_zip_path)
+
+    try:
+        # 退出顺序：先等下载，再等解压，最后等拷贝，后一级的任务只会由前一级提交
+        with ThreadPoolExecutor(max_workers=1) as copy_executor, \
+                ThreadPoolExecutor(max_workers=EXTRACT_JOBS) as extract_executor, \
+                ThreadPoolExecutor(max_workers=workers) as download_executor:
+            staged = list(download_executor.map(download_stage, ordered))
+    finally:
+        for channel in channels:
+            try:
+                channel.close()
+            except Exception:
+                pass
+    return [item.result() if isinstance(item, Future) else item for item in staged]
+
+
+def collect_manifest_operations(args, manifest_directory):
+    """读取项目及 dependency 下的 manifest，返回 {(包名, 版本): [copy/move 操作]}"""
+    original_directory = os.getcwd()
+    package_operations = {}
+
+    try:
+        os.chdir(manifest_directory)
         target_subdir = 'dependency'
 
         for root, dirs, files in os.walk(manifest_directory):
@@ -1132,59 +2780,137 @@ def process_manifests(args, manifest_directory):
                     except Exception as e:
                         print(f"Error reading {manifest_path}: {e}")
 
-        local_has_command_set = set(package_operations.keys())
+    finally:
+        os.chdir(original_directory)
 
-        for (pkg_name, pkg_version), operations in package_operations.items():
-            if not operations: continue
+    return package_operations
 
-            real_unique_key = find_real_package_key(pkg_name, pkg_version, local_lookup, local_packages)
 
-            if real_unique_key:
-                base_source_dir = local_packages[real_unique_key]['full_path']
-                for operation in operations:
-                    match = re.match(r'(?P<command>\w+)\s+(?P<source>.+?)\s+to\s+(?P<destination>[^\s]+)', operation)
-                    if not match: continue
-                    command, source, dest = match.group('command'), match.group('source'), match.group('destination')
-                    abs_dest = os.path.join(manifest_directory, dest) if dest != './' else manifest_directory
-                    os.makedirs(abs_dest, exist_ok=True)
-                    full_source_pattern = os.path.join(base_source_dir, source)
-                    items = glob.glob(full_source_pattern)
-                    if not items:
-                        print(f"Warning for '{pkg_name}': No items matching '{full_source_pattern}'")
-                        continue
-                    print(f"Executing {pkg_name}: {command} {source} -> {dest}")
-                    for item in items:
-                        try:
-                            if command == "copy":
-                                if os.path.isfile(item):
-                                    shutil.copy2(item, abs_dest)
-                                elif os.path.isdir(item):
-                                    shutil.copytree(item, os.path.join(abs_dest, os.path.basename(item)),
-                                                    dirs_exist_ok=True)
-                            elif command == "move":
-                                shutil.move(item, abs_dest)
-                        except Exception as e:
-                            print(f"  Error: {e}")
-            else:
-                ver_msg = f"@{pkg_version}" if pkg_version else ""
-                print(
-                    Fore.YELLOW + f"Warning: Package '{pkg_name}{ver_msg}' source directory not found locally." + Style.RESET_ALL)
+def run_manifest_operations(manifest_directory, package_operations, keys=None):
+    """执行 manifest 中的 copy/move 操作；keys 为 None 时执行全部"""
+    local_packages = get_local_packages()
+    local_lookup = {}
+    for unique_key, info in local_packages.items():
+        pkg_name = info.name
+        if pkg_name: local_lookup.setdefault(pkg_name, []).append(unique_key)
+
+    for pkg_name, pkg_version in (package_operations if keys is None else keys):
+        operations = package_operations.get((pkg_name, pkg_version))
+        if not operations: continue
+
+        real_unique_key = find_real_package_key(pkg_name, pkg_version, local_lookup, local_packages)
+
+        if real_unique_key:
+            base_source_dir = local_packages[real_unique_key].full_path
+            for operation in operations:
+                match = re.match(r'(?P<command>\w+)\s+(?P<source>.+?)\s+to\s+(?P<destination>[^\s]+)', operation)
+                if not match: continue
+                command, source, dest = match.group('command'), match.group('source'), match.group('destination')
+                abs_dest = os.path.join(manifest_directory, dest) if dest != './' else manifest_directory
+                os.makedirs(abs_dest, exist_ok=True)
+                full_source_pattern = os.path.join(base_source_dir, source)
+                items = glob.glob(full_source_pattern)
+                if not items:
+                    _print_line(f"Warning for '{pkg_name}': No items matching '{full_source_pattern}'")
+                    continue
+                _print_line(f"Executing {pkg_name}: {command} {source} -> {dest}")
+                for item in items:
+                    try:
+                        if command == "copy":
+                            if os.path.isfile(item):
+                                shutil.copy2(item, abs_dest)
+                            elif os.path.isdir(item):
+                                shutil.copytree(item, os.path.join(abs_dest, os.path.basename(item)),
+                                                dirs_exist_ok=True)
+                        elif command == "move":
+                            shutil.move(item, abs_dest)
+                    except Exception as e:
+                        _print_line(f"  Error: {e}")
+        else:
+            ver_msg = f"@{pkg_version}" if pkg_version else ""
+            _print_line(
+                Fore.YELLOW + f"Warning: Package '{pkg_name}{ver_msg}' source directory not found locally." + Style.RESET_ALL)
+
+
+def process_manifests(args, manifest_directory, done_keys=()):
+    package_operations = collect_manifest_operations(args, manifest_directory)
+    run_manifest_operations(manifest_directory, package_operations,
+                            [key for key in package_operations if key not in done_keys])
+    return set(package_operations.keys())
+
+
+def _operation_keys_for_package(final_dir_name, package_operations):
+    """找出解析到刚安装的包目录的操作项，与最终执行时 find_real_package_key 的选择一致"""
+    local_packages = get_local_packages()
+    local_lookup = {}
+    for unique_key, info in local_packages.items():
+        if info.name: local_lookup.setdefault(info.name, []).append(unique_key)
+
+    target_dir_path = os.path.join(lean_local_path, final_dir_name)
+    keys = []
+    for pkg_name, pkg_version in package_operations:
+        real_unique_key = find_real_package_key(pkg_name, pkg_version, local_lookup, local_packages)
+        if real_unique_key and local_packages[real_unique_key].full_path == target_dir_path:
+            keys.append((pkg_name, pkg_version))
+    return keys
+
+
+def _sync_support_file(sftp, remote_path, local_path, published_sha256=None):
+    """
+    同步单个辅助文件，返回 True 表示本地文件被更新。
+    远程大小/修改时间与上次同步相同，或者与目录中发布的摘要一致时不传输；
+    下载后内容没有变化时也不替换本地文件，保持其修改时间不变。
+    """
+    attr = sftp.stat(remote_path)
+    remote_stat = [attr.st_size, attr.st_mtime]
+
+    records_path = lean_cache.cache_path("support_files.json")
+    records = lean_cache.load_json(records_path, {})
+    record = records.get(local_path) or {}
+    local_sha256 = lean_cache.file_sha256(local_path)
 
+    if local_sha256 and record.get('sha256') == local_sha256 and record.get('remote_stat') == remote_stat:
+        return False
+    if local_sha256 and published_sha256 == local_sha256:
+        records[local_path] = {'remote_stat': remote_stat, 'sha256': local_sha256}
+        lean_cache.save_json(records_path, records)
+        return False
+
+    tmp_path = f"{local_path}.part"
+    try:
+        pipelined_get(sftp, remote_path, tmp_path)
+        new_sha256 = lean_cache.file_sha256(tmp_path)
+        if new_sha256 == local_sha256:
+            os.remove(tmp_path)
+            updated = False
+        else:
+            os.replace(tmp_path, local_path)
+            updated = True
     finally:
-        os.chdir(original_directory)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
 
-    return local_has_command_set
+    records[local_path] = {'remote_stat': remote_stat, 'sha256': new_sha256}
+    lean_cache.save_json(records_path, records)
+    return updated
 
 
 def import_cmake(sftp, lean_remote_path):
+    # 目录文件已在本地缓存时（stat 未变）不产生额外传输
+    catalog = _load_published_json(sftp, f"{lean_remote_path}/{lean_catalog.CATALOG_FILENAME}",
+                                   lean_catalog.load_catalog) or {}
+    published = catalog.get("support_files") or {}
+
     remote_cmake_path = f"{lean_remote_path}/import.cmake"
     local_cmake_path = os.path.join(lean_local_path, "import.cmake")
 
     try:
         print("The file import.cmake is being synchronized....")
-        sftp.get(remote_cmake_path, local_cmake_path)
-        print(
-            Fore.GREEN + f"import.cmake The file has been successfully synchronized to: {local_cmake_path}" + Style.RESET_ALL)
+        if _sync_support_file(sftp, remote_cmake_path, local_cmake_path, published.get("import.cmake")):
+            print(
+                Fore.GREEN + f"import.cmake The file has been successfully synchronized to: {local_cmake_path}" + Style.RESET_ALL)
+        else:
+            print(f"import.cmake is already up to date: {local_cmake_path}")
     except Exception as e:
         print(Fore.YELLOW + f"Warning: Unable to synchronize the import.cmake file. Reason: {e}" + Style.RESET_ALL)
         print(Fore.YELLOW + "Will continue to carry out other tasks..." + Style.RESET_ALL)
@@ -1195,14 +2921,16 @@ def import_cmake(sftp, lean_remote_path):
 
     try:
         print(f"The file {new_filename} is being synchronized....")
-        sftp.get(remote_new_file_path, local_new_file_path)
-        print(
-            Fore.GREEN + f"{new_filename} The file has been successfully synchronized to: {local_new_file_path}" + Style.RESET_ALL)
+        if _sync_support_file(sftp, remote_new_file_path, local_new_file_path, published.get(new_filename)):
+            print(
+                Fore.GREEN + f"{new_filename} The file has been successfully synchronized to: {local_new_file_path}" + Style.RESET_ALL)
+        else:
+            print(f"{new_filename} is already up to date: {local_new_file_path}")
     except Exception as e:
         print(Fore.YELLOW + f"Warning: Unable to synchronize the {new_filename} file. Reason: {e}" + Style.RESET_ALL)
 
 
-def write_manifest(manifest_name, spec):
+def write_manifest(manifest_name, spec, force_rescan=False):
     if not spec:
         return False
 
@@ -1218,7 +2946,7 @@ def write_manifest(manifest_name, spec):
         try:
             sftp = get_sftp_session()
             if not sftp: return False
-            server_dict = get_server_packages(sftp, lean_remote_path)
+            server_dict = get_server_packages(sftp, lean_remote_path, force_rescan=force_rescan)
             server_packages_names = set(server_dict.keys())
 
         except Exception as e:
@@ -1343,7 +3071,7 @@ def resolve_lean_args(args):
         elif args.obj_name and not args.manifest_filename:
             args.manifest_filename = f'{args.obj_name[0]}.manifest'
 
-        if not write_manifest(args.manifest_filename, args.spec):
+        if not write_manifest(args.manifest_filename, args.spec, getattr(args, 'rescan', False)):
             return False
 
         args.spec = None
@@ -1423,7 +3151,7 @@ def configure_env_vars(final_reqs, remote_cmds, local_cmds_set):
     local_packages = get_local_packages()
     local_lookup = {}
     for key, info in local_packages.items():
-        if info.get('name'): local_lookup.setdefault(info['name'], []).append(key)
+        if info.name: local_lookup.setdefault(info.name, []).append(key)
 
     has_action = False
 
@@ -1438,7 +3166,7 @@ def configure_env_vars(final_reqs, remote_cmds, local_cmds_set):
 
         if not real_unique_key: continue
 
-        bin_path = os.path.join(local_packages[real_unique_key]['full_path'], "bin")
+        bin_path = os.path.join(local_packages[real_unique_key].full_path, "bin")
 
         if os.path.isdir(bin_path):
             if not has_action:
@@ -1471,8 +3199,11 @@ def update_lean(args, repo_path):
         final_reqs, remote_cmds = get_lean_mainfest_packages(
             args, repo_path, sftp=sftp, lean_remote_path=lean_remote_path
         )
+        target_compiler = get_target_compiler(args)
+        server_packages = get_server_packages(sftp, lean_remote_path, force_rescan=getattr(args, 'rescan', False),
+                                              compilers=[target_compiler])
         print(
-            f"Found local packages: {len(get_local_packages())} \nremote packages: {len(get_server_packages(sftp, lean_remote_path))} \nproject need packages: {len(final_reqs)} ")
+            f"Found local packages: {len(get_local_packages())} \nremote packages ({target_compiler}): {len(server_packages)} \nproject need packages: {len(final_reqs)} ")
         compare_packages(args, sftp, lean_remote_path)
         print(f"{len(unresolved_packages)} unresolved packages (NOT FOUND on server): ", end="")
         if len(unresolved_packages) != 0:
@@ -1499,27 +3230,31 @@ def update_lean(args, repo_path):
             print()
         else:
             print("None!")
+        # 每个包安装完成后立即执行它的 copy/move 操作，剩余的操作在全部下载结束后统一执行
+        manifest_operations = collect_manifest_operations(args, repo_path)
+        done_manifest_keys, done_remote_keys = set(), set()
+
+        def install_copy_stage(final_dir_name):
+            manifest_keys = _operation_keys_for_package(final_dir_name, manifest_operations)
+            remote_keys = _operation_keys_for_package(final_dir_name, remote_cmds or {})
+            run_manifest_operations(repo_path, manifest_operations, manifest_keys)
+            execute_remote_copy(repo_path, {key: remote_cmds[key] for key in remote_keys})
+            done_manifest_keys.update(manifest_keys)
+            done_remote_keys.update(remote_keys)
+
         success = 0
         fetch_failed = 0
         unzip_faild = 0
         fetch_failed_name = []
         unzip_faild_name = []
-        if len(missing_packages_) != 0:
-            print("Fetching missing lean packages:")
-            for package_path in missing_packages_:
-                num, name = download_package(sftp, package_path)
-                if num == 1:
-                    fetch_failed += 1
-                    fetch_failed_name.append(name)
-                elif num == 2:
-                    success += 1
-                elif num == 3:
-                    unzip_faild += 1
-                    unzip_faild_name.append(name)
-        if len(need_update_packages_) != 0:
-            print("Updating lean packages:")
-            for package_path in need_update_packages_:
-                num, name = download_package(sftp, package_path)
+        if len(missing_packages_) != 0 or len(need_update_packages_) != 0:
+            if len(missing_packages_) != 0:
+                print(f"Fetching missing lean packages: {len(missing_packages_)}")
+            if len(need_update_packages_) != 0:
+                print(f"Updating lean packages: {len(need_update_packages_)}")
+            results = download_packages(sftp, missing_packages_ + need_update_packages_, get_download_jobs(args),
+                                        on_installed=install_copy_stage, max_jobs=get_download_job_limit(args))
+            for num, name in results:
                 if num == 1:
                     fetch_failed += 1
                     fetch_failed_name.append(name)
@@ -1551,11 +3286,13 @@ def update_lean(args, repo_path):
             print()
         else:
             print("None!")
+        print_download_concurrency()
+        print_transfer_summary()
         print("Your local lean packages are all up to date with remote lean server.")
         workspace_directory = os.path.join(repo_path, "workspace")
         print("Starting copy lean dll to workspace...")
-        local_manifest_set = process_manifests(args, repo_path)
-        execute_remote_copy(repo_path, remote_cmds)
+        local_manifest_set = process_manifests(args, repo_path, done_manifest_keys)
+        execute_remote_copy(repo_path, remote_cmds, done_remote_keys)
         configure_env_vars(final_reqs, remote_cmds, local_manifest_set)
     except paramiko.AuthenticationException:
         print("Authentication failed. Please check the username and password.")
@@ -1604,8 +3341,8 @@ def import_dep_lean(args):
     local_packages = get_local_packages()
     local_lookup = {}
     for unique_key, info in local_packages.items():
-        if info.get('name'):
-            local_lookup.setdefault(info['name'], []).append(unique_key)
+        if info.name:
+            local_lookup.setdefault(info.name, []).append(unique_key)
 
     if len(args.target_manifests) != len(args.obj_name):
         return
@@ -1639,7 +3376,7 @@ def import_dep_lean(args):
 
             folder_name_to_import = None
             if real_key:
-                folder_name_to_import = os.path.basename(local_packages[real_key]['full_path'])
+                folder_name_to_import = os.path.basename(local_packages[real_key].full_path)
 
             if folder_name_to_import:
                 cmake_list = f'cmake/{current_obj}'
@@ -1727,11 +3464,7 @@ def update_lean_specific(args):
         import_cmake(sftp, lean_remote_path)
 
         specific_lean = args.specific
-        if getattr(args, 'compiler', None):
-            target_compiler = args.compiler.upper()
-        else:
-            target_file = args.target_manifests[0] if args.target_manifests else args.manifest_filename
-            target_compiler = get_project_compiler(os.getcwd(), target_file)
+        target_compiler = get_target_compiler(args)
 
         req_pkg_name = specific_lean
         req_version_str = None
@@ -1741,55 +3474,24 @@ def update_lean_specific(args):
             req_pkg_name = parts[0].strip()
             req_version_str = parts[1].strip()
 
-        server_packages = get_server_packages(sftp, lean_remote_path)
+        try:
+            target_info = resolve_server_package(sftp, lean_remote_path, req_pkg_name, req_version_str,
+                                                 target_compiler, getattr(args, 'rescan', False))
+        except InvalidVersion:
+            print(Fore.RED + f"Error: Invalid version format '{req_version_str}'" + Style.RESET_ALL)
+            return
 
-        if req_pkg_name not in server_packages:
+        if not target_info and not server_has_package(sftp, lean_remote_path, req_pkg_name, target_compiler):
             print(Fore.RED + f"Error: Package '{req_pkg_name}' not found on server." + Style.RESET_ALL)
             return
-
-        all_versions = server_packages[req_pkg_name]
-        target_info = None
-
-        if req_version_str:
-            try:
-                req_version_obj = parse_version(req_version_str)
-
-                target_info = next((v for v in all_versions if
-                                    v['version'] == req_version_obj and v['compiler'] == target_compiler), None)
-
-                if not target_info:
-                    target_info = next((v for v in all_versions if v['version'] == req_version_obj), None)
-                    if target_info:
-                        print(
-                            Fore.YELLOW + f"Warning: Found version {req_version_str} in {target_info['compiler']} (Target is {target_compiler}). Using it." + Style.RESET_ALL)
-
-            except InvalidVersion:
-                print(Fore.RED + f"Error: Invalid version format '{req_version_str}'" + Style.RESET_ALL)
-                return
-        else:
-            def find_best_in_list(ver_list):
-                stable = [v for v in ver_list if v['location'] == 'stable']
-                common = [v for v in ver_list if v['location'] == 'common']
-                if stable: return max(stable, key=lambda v: v['version'])
-                if common: return max(common, key=lambda v: v['version'])
-                return None
-
-            target_compiler_versions = [v for v in all_versions if v['compiler'] == target_compiler]
-            if target_compiler_versions:
-                target_info = find_best_in_list(target_compiler_versions)
-
-            if not target_info:
-                print(
-                    Fore.YELLOW + f"Warning: No version found for '{req_pkg_name}' in {target_compiler}. Searching all compilers..." + Style.RESET_ALL)
-                target_info = find_best_in_list(all_versions)
         if not target_info:
             ver_msg = f"version {req_version_str}" if req_version_str else "any version"
             print(Fore.RED + f"Error: Could not find {ver_msg} for {req_pkg_name}." + Style.RESET_ALL)
             return
 
-        full_remote_path = target_info['full_path']
-        version_str = target_info['version_str']
-        found_compiler = target_info['compiler']
+        full_remote_path = target_info.full_path
+        version_str = target_info.version_str
+        found_compiler = target_info.compiler
 
         local_packages = get_local_packages()
         target_key = f"{req_pkg_name}@{version_str}@{found_compiler}"
@@ -1800,7 +3502,7 @@ def update_lean_specific(args):
             should_download = True
         else:
             local_info = local_packages[target_key]
-            if target_info['time'] > local_info['time']:
+            if _server_package_is_newer(target_info, target_key, local_info, load_package_digests()):
                 print(f"Status: Update available (Server is newer).")
                 should_download = True
             else:
@@ -1911,7 +3613,7 @@ def status_lean_local(args, repo_path):
         local_packages = get_local_packages()
         local_lookup = {}
         for unique_key, info in local_packages.items():
-            if info.get('name'): local_lookup.setdefault(info['name'], []).append(unique_key)
+            if info.name: local_lookup.setdefault(info.name, []).append(unique_key)
 
         for (pkg_name, pkg_version), operations in package_operations.items():
             if not operations: continue
@@ -1919,7 +3621,7 @@ def status_lean_local(args, repo_path):
             real_unique_key = find_real_package_key(pkg_name, pkg_version, local_lookup, local_packages)
 
             if real_unique_key:
-                base_source_dir = local_packages[real_unique_key]['full_path']
+                base_source_dir = local_packages[real_unique_key].full_path
                 for operation in operations:
                     match = re.match(r'(?P<command>\w+)\s+(?P<source>.+?)\s+to\s+(?P<destination>[^\s]+)', operation)
                     if not match: continue
@@ -1970,7 +3672,7 @@ def status_lean_local(args, repo_path):
             real_unique_key = find_real_package_key(pkg_name, pkg_version, local_lookup, local_packages)
             if not real_unique_key: continue
 
-            bin_path = os.path.join(local_packages[real_unique_key]['full_path'], "bin")
+            bin_path = os.path.join(local_packages[real_unique_key].full_path, "bin")
 
             if os.path.isdir(bin_path):
                 norm_bin = os.path.normpath(bin_path).lower()
@@ -1992,7 +3694,33 @@ def status_lean_local(args, repo_path):
         os.chdir(original_directory)
 
 
-def status_lean_remote():
+def print_server_snapshot_diff(previous, current):
+    if not previous:
+        print(f"No previous snapshot of the lean server, saved the current listing ({len(current)} archives) as baseline.")
+        return
+
+    taken = datetime.fromtimestamp(previous.get('taken', 0)).strftime('%Y-%m-%d %H:%M:%S')
+    added, removed, updated = lean_index.diff_snapshots(previous.get('packages', {}), current)
+    print(f"Changes on the lean server since {taken}:")
+    if not added and not removed and not updated:
+        print("None!")
+        return
+
+    def describe(row):
+        name, version_str, compiler, channel = row[0], row[1], row[2], row[3]
+        return f"{name:<25} {version_str:<15} {compiler:<12} {channel:<10}"
+
+    for row in added:
+        print(Fore.GREEN + f"+ {describe(row)} {format_size(row[4]):>10}" + Style.RESET_ALL)
+    for row in removed:
+        print(Fore.RED + f"- {describe(row)} {format_size(row[4]):>10}" + Style.RESET_ALL)
+    for old_row, new_row in updated:
+        print(Fore.YELLOW + f"* {describe(new_row)} {format_size(old_row[4]):>10} -> {format_size(new_row[4])}"
+              + Style.RESET_ALL)
+    print(f"{len(added)} added, {len(removed)} removed, {len(updated)} updated.")
+
+
+def status_lean_remote(args=None):
     lean_remote_path = match_lean_remote()
     if lean_remote_path is None:
         print(
@@ -2004,18 +3732,29 @@ def status_lean_remote():
         if not sftp: return False
         import_cmake(sftp, lean_remote_path)
 
-        server_packages = get_server_packages(sftp, lean_remote_path)
+        server_packages = get_server_packages(sftp, lean_remote_path, force_rescan=getattr(args, 'rescan', False))
+
+        # 每次查看都保存快照，--diff 只输出与上一次查看相比的变化
+        snapshot_path = lean_cache.cache_path("snapshots", f"{lean_cache.cache_key(lean_remote_path)}.json")
+        previous = lean_cache.load_json(snapshot_path)
+        current = {info.full_path: [name, info.version_str, info.compiler, info.location, info.size, info.mtime]
+                   for name, versions_list in server_packages.items() for info in versions_list}
+
+        if getattr(args, 'diff', False):
+            print_server_snapshot_diff(previous, current)
+        else:
+            print(f"{'Package':<25} {'Version':<15} {'Location':<10} {'Date'}")
+            print("-" * 75)
 
-        print(f"{'Package':<25} {'Version':<15} {'Location':<10} {'Date'}")
-        print("-" * 75)
+            for name, versions_list in server_packages.items():
+                for info in versions_list:
+                    version_str = str(info.version)
+                    location = info.location
+                    date_str = str(info.time)
 
-        for name, versions_list in server_packages.items():
-            for info in versions_list:
-                version_str = str(info['version'])
-                location = info['location']
-                date_str = str(info['time'])
+                    print(f"{name:<25} {version_str:<15} {location:<10} {date_str}")
 
-                print(f"{name:<25} {version_str:<15} {location:<10} {date_str}")
+        lean_cache.save_json(snapshot_path, {'taken': time.time(), 'packages': current})
 
     except paramiko.AuthenticationException:
         print("Authentication failed. Please check the username and password.")
@@ -0,0 +1,62 @@
+import hashlib
+import json
+import os
+import re
+
+from gits.config import show_config
+
+# 本地缓存目录：放在 lean_local_path 下，目录名不含 '@' / '-'，不会被当成 lean 包扫描
+CACHE_DIR_NAME = ".gis_cache"
+
+lean_local_path = show_config("lean_local_path")
+
+
+def cache_key(text):
+    """把远程路径等任意字符串转换成可用作文件名的 key"""
+    key = re.sub(r'[^0-9A-Za-z.]+', '_', str(text)).strip('_')
+    return key or "default"
+
+
+def cache_path(*parts):
+    """返回缓存目录下的路径，并确保父目录存在"""
+    path = os.path.join(lean_local_path or os.path.expanduser("~"), CACHE_DIR_NAME, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def load_json(path, default=None):
+    if not os.path.isfile(path):
+        return default
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def save_json(path, data):
+    """先写临时文件再替换，避免中途中断留下损坏的缓存"""
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+        return True
+    except OSError as e:
+        print(f"Warning: Failed to write cache file {path}: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return False
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """计算本地文件的 sha256，文件不存在时返回 None"""
+    if not os.path.isfile(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,138 @@
+import json
+import os
+import time
+
+# 服务器发布的包目录文件，与 import.cmake 放在同一个 OS 目录下
+CATALOG_FILENAME = "gis-catalog.json"
+CATALOG_FORMAT = 1
+CATALOG_FIELDS = ["compiler", "name", "channel", "file", "version", "size", "mtime", "sha256"]
+# 每次更新都会同步到客户端的辅助文件，目录中记录其摘要
+SUPPORT_FILES = ["import.cmake", "gits-usage-readme.md"]
+
+
+def split_package_path(lean_remote_path, full_path):
+    """<os_dir>/<compiler>/<package>/<stable|common>/<file> -> (compiler, package, channel, file)"""
+    rel_path = full_path[len(lean_remote_path):].strip('/')
+    parts = rel_path.split('/')
+    if len(parts) != 4 or parts[2] not in ('stable', 'common'):
+        return None
+    return tuple(parts)
+
+
+def package_version_str(filename):
+    name_no_ext = os.path.splitext(filename)[0]
+    if name_no_ext.endswith('.tar'):
+        name_no_ext = os.path.splitext(name_no_ext)[0]
+    if '@' in name_no_ext:
+        return name_no_ext.split('@', 1)[1]
+    if '-' in name_no_ext:
+        return name_no_ext.rsplit('-', 1)[1]
+    return None
+
+
+def build_catalog(lean_remote_path, files, checksums, support_checksums=None):
+    """
+    files: {远程路径: [mtime, size]}，checksums: {远程路径: sha256}
+    support_checksums: {辅助文件名: sha256}
+    只收录符合 lean 目录结构的归档，输出按路径排序，便于比较和压缩。
+    """
+    rows = []
+    for full_path in sorted(files):
+        parts = split_package_path(lean_remote_path, full_path)
+        if not parts: continue
+        compiler, name, channel, filename = parts
+        version_str = package_version_str(filename)
+        if not version_str: continue
+        mtime, size = files[full_path][0], files[full_path][1]
+        rows.append([compiler, name, channel, filename, version_str, size, mtime, checksums.get(full_path)])
+
+    return {
+        "format": CATALOG_FORMAT,
+        "generated": time.time(),
+        "fields": CATALOG_FIELDS,
+        "packages": rows,
+        "support_files": support_checksums or {}
+    }
+
+
+def dump_catalog(catalog):
+    return json.dumps(catalog, separators=(',', ':')).encode('utf-8')
+
+
+def load_catalog(data):
+    """解析目录文件内容，格式不兼容时返回 None"""
+    try:
+        catalog = json.loads(data.decode('utf-8') if isinstance(data, bytes) else data)
+    except ValueError:
+        return None
+    if not isinstance(catalog, dict) or catalog.get("format") != CATALOG_FORMAT:
+        return None
+    return catalog
+
+
+def catalog_files(lean_remote_path, catalog):
+    """目录文件 -> {远程路径: [mtime, size, sha256]}，与服务器扫描结果格式一致"""
+    fields = catalog.get("fields", CATALOG_FIELDS)
+    index = {field: i for i, field in enumerate(fields)}
+    files = {}
+    for row in catalog.get("packages", []):
+        try:
+            full_path = '/'.join([lean_remote_path.rstrip('/'), row[index["compiler"]], row[index["name"]],
+                                  row[index["channel"]], row[index["file"]]])
+            files[full_path] = [float(row[index["mtime"]]), int(row[index["size"]]), row[index["sha256"]]]
+        except (KeyError, IndexError, TypeError, ValueError):
+            continue
+    return files
+
+
+# dep_tree 下预先计算的传递依赖闭包
+CLOSURE_FILENAME = "gis-closure.json"
+
+
+def resolve_dep_key(dep_files, name, version):
+    """与客户端查找 .dep 的顺序一致：先 name@version，再 name"""
+    if version and f"{name}@{version}" in dep_files:
+        return f"{name}@{version}"
+    if name in dep_files:
+        return name
+    return None
+
+
+def build_dep_closure(dep_files):
+    """
+    dep_files: {dep 文件名(不含 .dep): (requires, cmds)}
+    为每个 dep 文件按客户端遍历顺序计算可达的全部 dep 文件，客户端一次读取即可解析整个清单。
+    """
+    closures = {}
+    for root_key in dep_files:
+        order = [root_key]
+        seen_files = {root_key}
+        checked_keys = set()
+        stack = list(dep_files[root_key][0])
+        while stack:
+            name, version = stack.pop()
+            req_key = f"{name}@{version}" if version else name
+            if req_key in checked_keys: continue
+            checked_keys.add(req_key)
+
+            file_key = resolve_dep_key(dep_files, name, version)
+            if not file_key or file_key in seen_files: continue
+            seen_files.add(file_key)
+            order.append(file_key)
+            stack.extend(dep_files[file_key][0])
+        closures[root_key] = order
+
+    return {
+        "format": CATALOG_FORMAT,
+        "generated": time.time(),
+        "files": {key: {"requires": [list(r) for r in requires], "cmds": [list(c) for c in cmds]}
+                  for key, (requires, cmds) in dep_files.items()},
+        "closures": closures
+    }
+
+
+def load_dep_closure(data):
+    closure = load_catalog(data)
+    if not closure or not isinstance(closure.get("files"), dict):
+        return None
+    return closure
@@ -0,0 +1,125 @@
+import threading
+import time
+
+
+class DownloadSlot:
+    """一次下载占用的并发名额，记录该通道的传输量用于计算单通道吞吐"""
+    __slots__ = ('started', 'last_progress', 'transferred', 'stalled')
+
+    def __init__(self, now):
+        self.started = now
+        self.last_progress = now
+        self.transferred = 0
+        self.stalled = False
+
+
+class AdaptiveConcurrency:
+    """
+    lean 下载并发数的 AIMD 控制器。
+    每 SAMPLE_INTERVAL 秒统计一次所有通道的总吞吐：名额用满且吞吐比上一次提高至少 GAIN_THRESHOLD 时并发数加 1，
+    加 1 之后吞吐反而下降则退回；期间有下载失败、SFTP 通道打不开或某个通道超过 STALL_SECONDS 没有数据时减半。
+    minimum == maximum 时就是固定并发数。所有方法都是线程安全的。
+    """
+    SAMPLE_INTERVAL = 2.0
+    GAIN_THRESHOLD = 0.1
+    STALL_SECONDS = 30.0
+
+    def __init__(self, initial, minimum=1, maximum=None):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum or initial)
+        self.limit = min(self.maximum, max(self.minimum, initial))
+        self.peak_limit = self.limit
+        self.backoffs = 0
+        self.best_rate = 0.0
+        self.total_bytes = 0
+        self._condition = threading.Condition()
+        self._active = set()
+        self._channel_rates = []
+        self._last_rate = None
+        self._interval_start = time.monotonic()
+        self._interval_bytes = 0
+        self._interval_failures = 0
+
+    @property
+    def adaptive(self):
+        return self.maximum > self.minimum
+
+    def acquire(self):
+        """等待一个空闲名额，返回 DownloadSlot"""
+        with self._condition:
+            while len(self._active) >= self.limit:
+                self._condition.wait(self.SAMPLE_INTERVAL)
+                self._adjust(time.monotonic())
+            slot = DownloadSlot(time.monotonic())
+            self._active.add(slot)
+            return slot
+
+    def progress(self, slot, transferred):
+        """下载回调：transferred 为该归档累计传输的字节数"""
+        with self._condition:
+            now = time.monotonic()
+            delta = max(0, transferred - slot.transferred)
+            slot.transferred = max(slot.transferred, transferred)
+            if delta:
+                slot.last_progress = now
+                self._interval_bytes += delta
+                self.total_bytes += delta
+            self._adjust(now)
+
+    def record_failure(self):
+        """SFTP 通道打开失败等不占用名额的错误"""
+        with self._condition:
+            self._interval_failures += 1
+            self._adjust(time.monotonic())
+
+    def release(self, slot, ok=True):
+        with self._condition:
+            now = time.monotonic()
+            self._active.discard(slot)
+            elapsed = now - slot.started
+            if ok and slot.transferred and elapsed > 0:
+                self._channel_rates.append(slot.transferred / elapsed)
+            if not ok:
+                self._interval_failures += 1
+            self._adjust(now)
+            self._condition.notify_all()
+
+    def channel_rate(self):
+        """成功下载的平均单通道吞吐（字节/秒）"""
+        with self._condition:
+            return sum(self._channel_rates) / len(self._channel_rates) if self._channel_rates else 0.0
+
+    def _adjust(self, now):
+        elapsed = now - self._interval_start
+        if elapsed < self.SAMPLE_INTERVAL:
+            return
+        rate = self._interval_bytes / elapsed
+        self.best_rate = max(self.best_rate, rate)
+
+        stalls = 0
+        for slot in self._active:
+            if not slot.stalled and now - slot.last_progress > self.STALL_SECONDS:
+                slot.stalled = True
+                stalls += 1
+
+        old_limit = self.limit
+        if self._interval_failures or stalls:
+            self.limit = max(self.minimum, self.limit // 2)
+            if self.limit < old_limit:
+                self.backoffs += 1
+            self._last_rate = None
+        else:
+            if self._last_rate is None or rate >= self._last_rate * (1 + self.GAIN_THRESHOLD):
+                # 只有名额全部占满时增加并发才有意义
+                if len(self._active) >= self.limit and self.limit < self.maximum:
+                    self.limit += 1
+            elif rate < self._last_rate * (1 - self.GAIN_THRESHOLD) and self.limit > self.minimum:
+                self.limit -= 1
+            self._last_rate = rate
+
+        self.peak_limit = max(self.peak_limit, self.limit)
+        self._interval_start = now
+        self._interval_bytes = 0
+        self._interval_failures = 0
+        if self.limit > old_limit:
+            self._condition.notify_all()
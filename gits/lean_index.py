@@ -0,0 +1,171 @@
+import re
+import sys
+from bisect import bisect_left
+from datetime import datetime
+
+from packaging.version import Version, VERSION_PATTERN
+
+_VERSION_RE = re.compile(r"^\s*" + VERSION_PATTERN + r"\s*$", re.VERBOSE | re.IGNORECASE)
+# 相同的版本字符串共享同一个 Version 对象
+_VERSION_CACHE = {}
+
+
+def is_valid_version(version_str):
+    """只做正则校验，不构造 Version 对象"""
+    return _VERSION_RE.match(version_str) is not None
+
+
+def parse_version_cached(version_str):
+    version = _VERSION_CACHE.get(version_str)
+    if version is None:
+        version = _VERSION_CACHE[version_str] = Version(version_str)
+    return version
+
+
+class LeanPackage:
+    """
+    本地/服务器 lean 包记录。
+    使用 __slots__ 紧凑存储，重复出现的字符串（包名、版本、编译器、通道）做驻留，
+    时间戳保存为 float，版本号在第一次比较时才解析并缓存。
+    """
+    __slots__ = ('name', 'version_str', 'compiler', 'location', 'full_path', 'mtime', 'size', 'sha256', '_version')
+
+    def __init__(self, name, version_str, compiler, full_path, mtime, location=None, size=0, sha256=None):
+        self.name = sys.intern(name)
+        self.version_str = sys.intern(version_str)
+        self.compiler = sys.intern(compiler)
+        self.location = sys.intern(location) if location else None
+        self.full_path = full_path
+        self.mtime = float(mtime)
+        self.size = int(size)
+        self.sha256 = sha256
+        self._version = None
+
+    @property
+    def version(self):
+        if self._version is None:
+            self._version = parse_version_cached(self.version_str)
+        return self._version
+
+    @property
+    def time(self):
+        return datetime.fromtimestamp(self.mtime)
+
+    def __repr__(self):
+        return f"LeanPackage({self.name}@{self.version_str}@{self.compiler}, {self.location or 'local'})"
+
+
+class PackageIndex:
+    """
+    服务器包索引：name -> compiler -> channel -> 按版本排序的记录。
+    精确版本用二分查找，“最新 stable，否则最新 common”直接取排序后的最后一个。
+    每个通道的列表在第一次查询时才排序，没有被查询的包不需要解析版本号。
+    """
+    CHANNEL_PRIORITY = ('stable', 'common')
+
+    def __init__(self, packages_dict):
+        self._index = {}
+        for name, records in packages_dict.items():
+            by_compiler = self._index.setdefault(name, {})
+            for record in records:
+                by_compiler.setdefault(record.compiler, {}).setdefault(record.location, []).append(record)
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def compilers(self, name):
+        return sorted(self._index.get(name, {}))
+
+    def _channels(self, name, compiler):
+        by_channel = self._index.get(name, {}).get(compiler, {})
+        for channel, records in by_channel.items():
+            if isinstance(records, list):
+                records.sort(key=lambda r: r.version)
+                # 与记录列表平行的版本列表，用于 bisect（兼容 Python 3.8，不依赖 key 参数）
+                by_channel[channel] = (records, [r.version for r in records])
+        return by_channel
+
+    def find_exact(self, name, version, compiler=None):
+        """查找指定版本；compiler 为 None 时按编译器名称顺序在全部编译器中查找"""
+        compilers = [compiler] if compiler else self.compilers(name)
+        for current_compiler in compilers:
+            by_channel = self._channels(name, current_compiler)
+            for channel in self.CHANNEL_PRIORITY:
+                if channel not in by_channel: continue
+                records, versions = by_channel[channel]
+                pos = bisect_left(versions, version)
+                if pos < len(versions) and versions[pos] == version:
+                    return records[pos]
+        return None
+
+    def find_latest(self, name, compiler=None):
+        """最新的 stable 版本，没有 stable 时取最新的 common；compiler 为 None 时在全部编译器中比较"""
+        compilers = [compiler] if compiler else self.compilers(name)
+        for channel in self.CHANNEL_PRIORITY:
+            best = None
+            for current_compiler in compilers:
+                by_channel = self._channels(name, current_compiler)
+                if channel not in by_channel: continue
+                candidate = by_channel[channel][0][-1]
+                if best is None or candidate.version > best.version:
+                    best = candidate
+            if best:
+                return best
+        return None
+
+
+class SearchIndex:
+    """
+    gis lean search 使用的本地索引。
+    rows: [name, version, compiler, channel, size, mtime]；按小写包名排序后用二分查找做前缀匹配。
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self._by_name = {}
+        for row in rows:
+            self._by_name.setdefault(row[0].lower(), []).append(row)
+        self._names = sorted(self._by_name)
+
+    def match_names(self, term, substring=False):
+        term = term.lower()
+        if substring:
+            return [name for name in self._names if term in name]
+        start = bisect_left(self._names, term)
+        end = bisect_left(self._names, term + '\uffff')
+        return self._names[start:end]
+
+    def search(self, terms=None, substring=False, compiler=None, channel=None, specifier=None):
+        """按名称（前缀或子串）、编译器、通道和版本范围过滤，结果按包名升序、版本降序排列"""
+        if terms:
+            names = sorted({name for term in terms for name in self.match_names(term, substring)})
+        else:
+            names = self._names
+
+        results = []
+        for name in names:
+            rows = []
+            for row in self._by_name[name]:
+                if compiler and row[2].upper() != compiler.upper(): continue
+                if channel and row[3] != channel: continue
+                if specifier is not None and not specifier.contains(parse_version_cached(row[1]), prereleases=True):
+                    continue
+                rows.append(row)
+            rows.sort(key=lambda r: parse_version_cached(r[1]), reverse=True)
+            results.extend(rows)
+        return results
+
+
+def diff_snapshots(old_snapshot, new_snapshot):
+    """
+    比较两次服务器列表快照 {远程路径: [name, version, compiler, channel, size, mtime]}。
+    返回 (新增, 删除, 更新)，更新项为 (旧记录, 新记录)。
+    """
+    added = [new_snapshot[p] for p in sorted(new_snapshot) if p not in old_snapshot]
+    removed = [old_snapshot[p] for p in sorted(old_snapshot) if p not in new_snapshot]
+    updated = [(old_snapshot[p], new_snapshot[p]) for p in sorted(new_snapshot)
+               if p in old_snapshot and list(old_snapshot[p]) != list(new_snapshot[p])]
+    return added, removed, updated
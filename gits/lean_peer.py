@@ -0,0 +1,200 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+# 局域网内的 lean 包缓存：一台机器用 gis lean serve 把安装后保留在 .gis_cache/archives 中、已记录摘要的归档
+# 只读地提供给其他 gis 客户端；客户端按 lean_peers 的顺序先问这些机器，没有时再访问中心服务器。
+PEER_INDEX_FILENAME = "gis-peer.json"
+PEER_INDEX_FORMAT = 1
+PEER_ARCHIVE_PREFIX = "/archives/"
+PEER_PORT = 8765
+PEER_READ_SIZE = 256 * 1024
+# 客户端访问同伴缓存的超时：局域网内的机器不可达时应当很快放弃
+PEER_TIMEOUT = 5
+
+
+def peer_archive_path(local_root, record):
+    """摘要记录中保留的归档路径（path 相对 lean_local_path），没有保留归档时返回 None"""
+    path = record.get('path')
+    return os.path.join(local_root, path) if path else None
+
+
+def build_peer_index(local_root, digests):
+    """
+    由已安装包的摘要记录（load_package_digests 的结果）生成同伴索引：
+    {包目录名: {archive, size, sha256, time}}，只包含保留的归档仍然存在且大小与记录一致的包。
+    """
+    packages = {}
+    for final_dir_name, record in digests.items():
+        archive = record.get('archive')
+        path = peer_archive_path(local_root, record)
+        if not archive or not path or not record.get('sha256') or os.path.basename(archive) != archive:
+            continue
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            continue
+        if size != record.get('size'):
+            continue
+        packages[final_dir_name] = {'archive': archive, 'size': size, 'sha256': record['sha256'],
+                                    'time': record.get('time', 0)}
+    return {'format': PEER_INDEX_FORMAT, 'packages': packages}
+
+
+def load_peer_index(data):
+    try:
+        index = json.loads(data.decode('utf-8') if isinstance(data, bytes) else data)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if not isinstance(index, dict) or index.get('format') != PEER_INDEX_FORMAT:
+        return None
+    return index.get('packages') or {}
+
+
+def _parse_range(header, size):
+    """解析 'bytes=start-end' / 'bytes=start-'，返回 (start, end)（含 end），无效时返回 None"""
+    match = re.fullmatch(r'bytes=(\d*)-(\d*)', (header or '').strip())
+    if not match or (not match.group(1) and not match.group(2)):
+        return None
+    if not match.group(1):
+        length = int(match.group(2))
+        return (max(0, size - length), size - 1) if length else None
+    start = int(match.group(1))
+    end = int(match.group(2)) if match.group(2) else size - 1
+    if start >= size or end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+class PeerRequestHandler(BaseHTTPRequestHandler):
+    """只读地提供 /gis-peer.json 和 /archives/<归档名>，支持 HEAD、Range 和 ETag 条件请求"""
+    protocol_version = "HTTP/1.1"
+    server_version = "gis-peer/1"
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def _send_empty(self, status):
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _serve(self, send_body):
+        path = unquote(urlsplit(self.path).path)
+        index = self.server.peer_index()
+        if path == f"/{PEER_INDEX_FILENAME}":
+            body = json.dumps(index, separators=(',', ':')).encode('utf-8')
+            etag = f'"{self.server.index_etag(body)}"'
+            if self.headers.get('If-None-Match') == etag:
+                self._send_empty(304)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('ETag', etag)
+            self.end_headers()
+            if send_body:
+                self.wfile.write(body)
+            return
+
+        archive = path[len(PEER_ARCHIVE_PREFIX):] if path.startswith(PEER_ARCHIVE_PREFIX) else None
+        # 只提供索引中列出的归档，请求路径只用来查找索引，不会拼接成本地路径
+        file_path = self.server.archive_path(archive)
+        if file_path is None:
+            self._send_empty(404)
+            return
+        try:
+            f = open(file_path, 'rb')
+        except OSError:
+            self._send_empty(404)
+            return
+        with f:
+            st = os.fstat(f.fileno())
+            size = st.st_size
+            start, end = 0, size - 1
+            status = 200
+            if self.headers.get('Range'):
+                byte_range = _parse_range(self.headers['Range'], size)
+                if byte_range is None:
+                    self.send_response(416)
+                    self.send_header('Content-Range', f'bytes */{size}')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                start, end = byte_range
+                status = 206
+            length = max(0, end - start + 1)
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Content-Length', str(length))
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('Last-Modified', formatdate(st.st_mtime, usegmt=True))
+            if status == 206:
+                self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+            self.end_headers()
+            if not send_body:
+                return
+            f.seek(start)
+            remaining = length
+            try:
+                while remaining > 0:
+                    data = f.read(min(PEER_READ_SIZE, remaining))
+                    if not data: break
+                    self.wfile.write(data)
+                    remaining -= len(data)
+            except (BrokenPipeError, ConnectionResetError):
+                # 客户端读到需要的范围后会直接关闭连接
+                self.close_connection = True
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class PeerServer(ThreadingHTTPServer):
+    """
+    gis lean serve 的 HTTP 服务。load_digests() 返回最新的摘要记录，索引最多每 INDEX_TTL 秒重新生成一次，
+    本机之后下载的包会自动出现在索引中。
+    """
+    daemon_threads = True
+    INDEX_TTL = 5.0
+
+    def __init__(self, address, local_root, load_digests, verbose=False):
+        super().__init__(address, PeerRequestHandler)
+        self.local_root = local_root
+        self.load_digests = load_digests
+        self.verbose = verbose
+        self._index = None
+        self._paths = {}
+        self._index_time = 0.0
+        self._index_lock = threading.Lock()
+
+    def peer_index(self):
+        with self._index_lock:
+            now = time.monotonic()
+            if self._index is None or now - self._index_time > self.INDEX_TTL:
+                digests = self.load_digests()
+                self._index = build_peer_index(self.local_root, digests)
+                self._paths = {record['archive']: peer_archive_path(self.local_root, digests[final_dir_name])
+                               for final_dir_name, record in self._index['packages'].items()}
+                self._index_time = now
+            return self._index
+
+    def archive_path(self, archive):
+        """索引中归档名对应的本地路径，不在索引中时返回 None"""
+        self.peer_index()
+        with self._index_lock:
+            return self._paths.get(archive)
+
+    @staticmethod
+    def index_etag(body):
+        return hashlib.sha256(body).hexdigest()[:32]
@@ -0,0 +1,393 @@
+import http.client
+import os
+import shutil
+import stat
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate, parsedate_to_datetime
+from html.parser import HTMLParser
+from urllib.parse import quote, unquote, urlsplit
+
+# lean 服务器访问方式：auto（lean_remote_path 在本机可访问时直接读文件系统，否则 SFTP）/ sftp / local / http
+TRANSPORT_AUTO = "auto"
+TRANSPORT_SFTP = "sftp"
+TRANSPORT_LOCAL = "local"
+TRANSPORT_HTTP = "http"
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def is_local_transport(transport):
+    return getattr(transport, 'is_local', False)
+
+
+def is_http_transport(transport):
+    return getattr(transport, 'is_http', False)
+
+
+def is_direct_transport(transport):
+    """不经过 SSH 的后端（本地文件系统、HTTP），不需要也不能使用 exec_command"""
+    return getattr(transport, 'is_direct', False)
+
+
+def read_range(transport, path, offset, length):
+    """读取 [offset, offset + length) 范围内的数据，SFTP 与本地文件系统通用"""
+    with transport.open(path, 'rb') as f:
+        f.seek(offset)
+        return f.read(length)
+
+
+class TransportAttributes:
+    """与 paramiko.SFTPAttributes 中 gis 用到的字段一致"""
+    __slots__ = ('filename', 'st_mode', 'st_size', 'st_mtime')
+
+    def __init__(self, filename, st_mode, st_size, st_mtime):
+        self.filename = filename
+        self.st_mode = st_mode
+        self.st_size = st_size
+        self.st_mtime = st_mtime
+
+    @classmethod
+    def from_stat(cls, filename, st):
+        return cls(filename, st.st_mode, st.st_size, st.st_mtime)
+
+
+class LocalTransport:
+    """
+    lean_remote_path 挂载在本地（NFS/SMB 共享、CI 机器上的目录）时使用的后端。
+    提供 gis 使用的 SFTPClient 接口子集（stat / open / listdir_attr / get / posix_rename / remove），
+    外加 scan_files 和 read_range；直接访问文件系统，没有 SSH 加密和往返开销。
+    所有方法都是无状态的，可以在多个下载线程之间共享。
+    """
+    is_local = True
+    is_direct = True
+
+    def stat(self, path):
+        return os.stat(path)
+
+    def open(self, path, mode='rb'):
+        return open(path, mode if 'b' in mode else mode + 'b')
+
+    def listdir(self, path):
+        return os.listdir(path)
+
+    def listdir_attr(self, path):
+        attrs = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    attrs.append(TransportAttributes.from_stat(entry.name, entry.stat()))
+                except OSError:
+                    continue
+        return attrs
+
+    def read_range(self, path, offset, length):
+        return read_range(self, path, offset, length)
+
+    def get(self, remotepath, localpath, callback=None):
+        total_size = os.path.getsize(remotepath)
+        transferred = 0
+        with open(remotepath, 'rb') as src, open(localpath, 'wb') as dst:
+            if callback is None:
+                shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+                return
+            for chunk in iter(lambda: src.read(COPY_CHUNK_SIZE), b''):
+                dst.write(chunk)
+                transferred += len(chunk)
+                callback(transferred, total_size)
+
+    def posix_rename(self, oldpath, newpath):
+        os.replace(oldpath, newpath)
+
+    def rename(self, oldpath, newpath):
+        os.rename(oldpath, newpath)
+
+    def remove(self, path):
+        os.remove(path)
+
+    def scan_files(self, root, suffixes=('.zip', '.tar')):
+        """
+        等价于服务器上的 find 扫描：返回 (当前时间, {路径: [mtime, size]})。
+        路径统一使用 '/' 分隔，与 SFTP 扫描结果的键一致。
+        """
+        files = {}
+        root = root.rstrip('/\\')
+        for dir_path, dir_names, file_names in os.walk(root):
+            rel_dir = os.path.relpath(dir_path, root).replace(os.sep, '/')
+            prefix = root if rel_dir == '.' else f"{root}/{rel_dir}"
+            for file_name in file_names:
+                if not file_name.endswith(suffixes): continue
+                try:
+                    st = os.stat(os.path.join(dir_path, file_name))
+                except OSError:
+                    continue
+                if stat.S_ISREG(st.st_mode):
+                    files[f"{prefix}/{file_name}"] = [st.st_mtime, st.st_size]
+        return int(time.time()), files
+
+    def close(self):
+        pass
+
+
+# HTTP 后端：单个归档大于该值且服务器支持 Range 时分块并发下载
+HTTP_PARALLEL_MIN_SIZE = 8 * 1024 * 1024
+HTTP_CHUNK_SIZE = 4 * 1024 * 1024
+HTTP_CHUNK_JOBS = 4
+HTTP_READ_SIZE = 256 * 1024
+HTTP_TIMEOUT = 60
+
+
+class _LinkParser(HTMLParser):
+    """解析静态文件服务器（http.server / nginx / Apache autoindex）的目录列表"""
+
+    def __init__(self):
+        super().__init__()
+        self.links = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag != 'a': return
+        href = dict(attrs).get('href')
+        if href and not href.startswith(('?', '#', '/', '../')) and '://' not in href:
+            self.links.append(unquote(href.split('?', 1)[0]))
+
+
+class HttpFile:
+    """只读的远程文件：open 时发出 GET，seek 到其他位置后用 Range 请求从新位置继续读取"""
+
+    def __init__(self, transport, path):
+        self._transport = transport
+        self._path = path
+        self._position = 0
+        self._response = None
+        self._connection = None
+        self._request(0)
+
+    def _request(self, offset):
+        self._close_response()
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+        self._connection = self._transport.new_connection()
+        self._connection.request('GET', self._transport.url_path(self._path), headers=headers)
+        response = self._connection.getresponse()
+        if response.status == 404:
+            response.read()
+            self._close_response()
+            raise FileNotFoundError(f"{self._path} not found on the lean HTTP server")
+        if response.status not in (200, 206):
+            response.read()
+            self._close_response()
+            raise IOError(f"HTTP {response.status} for {self._path}")
+        if offset and response.status == 200:
+            # 服务器不支持 Range：丢弃前面的数据，结果仍然正确
+            remaining = offset
+            while remaining > 0:
+                skipped = response.read(min(HTTP_READ_SIZE, remaining))
+                if not skipped: break
+                remaining -= len(skipped)
+        self._response = response
+        self._position = offset
+
+    def _close_response(self):
+        if self._connection is not None:
+            self._connection.close()
+        self._response = None
+        self._connection = None
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._position
+        if offset != self._position or self._response is None:
+            self._request(offset)
+
+    def tell(self):
+        return self._position
+
+    def read(self, size=-1):
+        if self._response is None:
+            self._request(self._position)
+        data = self._response.read() if size is None or size < 0 else self._response.read(size)
+        self._position += len(data)
+        return data
+
+    def close(self):
+        self._close_response()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class HttpTransport:
+    """
+    通过静态文件服务器（nginx、http.server 等）访问 lean 仓库，只读。
+    远程路径按 lean_remote_path 为根映射到 lean_http_url 下的 URL；包列表来自服务器发布的 gis-catalog.json，
+    目录列表使用服务器的 autoindex 页面。支持条件请求（ETag / If-Modified-Since）、Range 续传和单个归档分块并发下载。
+    每个线程使用各自的 keep-alive 连接。
+    """
+    is_http = True
+    is_direct = True
+
+    def __init__(self, base_url, root_path='/', chunk_jobs=HTTP_CHUNK_JOBS, timeout=HTTP_TIMEOUT):
+        parts = urlsplit(base_url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise ValueError(f"invalid lean_http_url: {base_url}")
+        self.base_url = base_url.rstrip('/')
+        self._scheme = parts.scheme
+        self._host = parts.hostname
+        self._port = parts.port
+        self._base_path = parts.path.rstrip('/')
+        self._root = root_path.rstrip('/\\')
+        self._chunk_jobs = max(1, int(chunk_jobs))
+        self._timeout = timeout
+        self._local = threading.local()
+
+    def url_path(self, path):
+        path = str(path).replace('\\', '/')
+        if self._root and path.startswith(self._root):
+            path = path[len(self._root):]
+        return f"{self._base_path}/{quote(path.lstrip('/'))}"
+
+    def new_connection(self):
+        connection_class = http.client.HTTPSConnection if self._scheme == 'https' else http.client.HTTPConnection
+        return connection_class(self._host, self._port, timeout=self._timeout)
+
+    def _request(self, method, path, headers=None):
+        """在当前线程的 keep-alive 连接上发请求并读完响应体；连接被服务器关闭时重连一次"""
+        for attempt in range(2):
+            connection = getattr(self._local, 'connection', None)
+            if connection is None:
+                connection = self._local.connection = self.new_connection()
+            try:
+                connection.request(method, self.url_path(path), headers=headers or {})
+                response = connection.getresponse()
+                body = response.read()
+                return response, body
+            except (http.client.HTTPException, ConnectionError, OSError):
+                connection.close()
+                self._local.connection = None
+                if attempt:
+                    raise
+
+    def stat(self, path):
+        response, _ = self._request('HEAD', path)
+        if response.status == 404:
+            raise FileNotFoundError(f"{path} not found on the lean HTTP server")
+        if response.status in (301, 302, 307, 308) or str(path).endswith('/'):
+            return TransportAttributes(os.path.basename(str(path).rstrip('/')), stat.S_IFDIR | 0o755, 0, None)
+        if response.status != 200:
+            raise IOError(f"HTTP {response.status} for {path}")
+        last_modified = response.getheader('Last-Modified')
+        mtime = parsedate_to_datetime(last_modified).timestamp() if last_modified else None
+        size = int(response.getheader('Content-Length') or 0)
+        return TransportAttributes(os.path.basename(str(path)), stat.S_IFREG | 0o644, size, mtime)
+
+    def open(self, path, mode='rb'):
+        if 'w' in mode or 'a' in mode:
+            raise IOError("the lean HTTP transport is read-only")
+        return HttpFile(self, path)
+
+    def read_range(self, path, offset, length):
+        response, body = self._request('GET', path, {'Range': f'bytes={offset}-{offset + length - 1}'})
+        if response.status == 206:
+            return body
+        if response.status == 200:
+            return body[offset:offset + length]
+        if response.status == 404:
+            raise FileNotFoundError(f"{path} not found on the lean HTTP server")
+        raise IOError(f"HTTP {response.status} for {path}")
+
+    def fetch_if_modified(self, path, validators=None):
+        """
+        条件 GET：validators 为上次响应的 {'etag', 'last_modified'}。
+        返回 (内容, 新 validators)；服务器返回 304 时内容为 None。文件不存在时抛出 FileNotFoundError。
+        """
+        validators = validators or {}
+        headers = {}
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+        response, body = self._request('GET', path, headers)
+        if response.status == 304:
+            return None, validators
+        if response.status == 404:
+            raise FileNotFoundError(f"{path} not found on the lean HTTP server")
+        if response.status != 200:
+            raise IOError(f"HTTP {response.status} for {path}")
+        return body, {'etag': response.getheader('ETag'),
+                      'last_modified': response.getheader('Last-Modified') or formatdate(usegmt=True)}
+
+    def _supports_ranges(self, path):
+        response, _ = self._request('HEAD', path)
+        return (response.getheader('Accept-Ranges') or '').lower() == 'bytes'
+
+    def iter_range(self, path, offset, length):
+        """
+        按顺序产出 [offset, offset + length) 的数据块。
+        较大的归档在服务器支持 Range 时分成 HTTP_CHUNK_SIZE 的块，由多个连接并发下载，
+        最多提前 chunk_jobs 块，内存占用有上限；调用方按顺序写入和计算摘要，续传语义不变。
+        """
+        if length <= 0:
+            return
+        if self._chunk_jobs > 1 and length >= HTTP_PARALLEL_MIN_SIZE and self._supports_ranges(path):
+            ranges = [(start, min(HTTP_CHUNK_SIZE, offset + length - start))
+                      for start in range(offset, offset + length, HTTP_CHUNK_SIZE)]
+            with ThreadPoolExecutor(max_workers=self._chunk_jobs) as executor:
+                pending = []
+                for start, size in ranges:
+                    pending.append(executor.submit(self.read_range, path, start, size))
+                    if len(pending) >= self._chunk_jobs:
+                        yield pending.pop(0).result()
+                for future in pending:
+                    yield future.result()
+            return
+
+        with self.open(path) as f:
+            f.seek(offset)
+            remaining = length
+            while remaining > 0:
+                data = f.read(min(HTTP_READ_SIZE, remaining))
+                if not data: return
+                remaining -= len(data)
+                yield data
+
+    def get(self, remotepath, localpath, callback=None):
+        total_size = self.stat(remotepath).st_size
+        transferred = 0
+        with open(localpath, 'wb') as f:
+            for data in self.iter_range(remotepath, 0, total_size):
+                f.write(data)
+                transferred += len(data)
+                if callback:
+                    callback(transferred, total_size)
+
+    def listdir(self, path):
+        return [attr.filename for attr in self.listdir_attr(path)]
+
+    def listdir_attr(self, path):
+        """依赖服务器开启目录列表（autoindex）；列表中只有名称，大小和修改时间未知"""
+        response, body = self._request('GET', f"{str(path).rstrip('/')}/")
+        if response.status == 404:
+            raise FileNotFoundError(f"{path} not found on the lean HTTP server")
+        if response.status != 200:
+            raise IOError(f"HTTP {response.status} listing {path}")
+        parser = _LinkParser()
+        parser.feed(body.decode('utf-8', errors='ignore'))
+        attrs = []
+        for link in dict.fromkeys(parser.links):
+            is_dir = link.endswith('/')
+            mode = (stat.S_IFDIR | 0o755) if is_dir else (stat.S_IFREG | 0o644)
+            attrs.append(TransportAttributes(link.rstrip('/'), mode, 0, None))
+        return attrs
+
+    def scan_files(self, root, suffixes=('.zip', '.tar')):
+        raise IOError("a lean HTTP repository needs a published gis-catalog.json, "
+                      "run 'gis lean index' on the server")
+
+    def close(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
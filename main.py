@@ -1,11 +1,13 @@
 import os
+import sys
 import argparse
 # from gits import cmds
 from gits.commands import cmds
+from gits import agent
 from conf import config
 
 
-def parse_args():
+def parse_args(argv=None):
     parser = argparse.ArgumentParser(
         description='gits = gis = git + git submodule + conan/vcpkg. Version: {}. Publish date: {}'.format(
             config.VERSION, config.PUBLISH_DATE))
@@ -69,13 +71,39 @@ def parse_args():
 
     parser.add_argument('--compiler', dest='compiler', default=None,
                         help='Designated compiler (e.g., VS2019)')
-    args, remaining = parser.parse_known_args()
+    parser.add_argument('--rescan', action='store_true',
+                        help='Force a full rescan of the lean server package index instead of an incremental refresh.')
+    parser.add_argument('--jobs', '-j', dest='jobs', type=int, default=None,
+                        help='Number of lean packages downloaded in parallel; disables the adaptive concurrency '
+                             '(default: start at lean_download_jobs or 4, adapt up to lean_download_jobs_max or 8).')
+    parser.add_argument('--diff', action='store_true',
+                        help='status --lean --remote: only show what changed on the server since the last look.')
+    parser.add_argument('--contains', action='store_true',
+                        help='lean search: match package names by substring instead of prefix.')
+    parser.add_argument('--channel', choices=['stable', 'common'], default=None,
+                        help='lean search: only show packages from this channel.')
+    parser.add_argument('--range', dest='version_range', default=None,
+                        help='lean search: version range filter (e.g., ">=1.2,<2.0").')
+    args, remaining = parser.parse_known_args(argv)
 
     return args, remaining
 
 
+def run(argv):
+    """gis agent 在进程内执行一条命令行"""
+    args, remaining = parse_args(argv)
+    cmds(args, remaining)
+
+
 def main():
     args, remaining = parse_args()
+    # gis agent 在运行时由它执行 lean 相关命令，复用已建立的连接和缓存
+    exit_code = agent.forward(args, sys.argv[1:])
+    if exit_code is not None:
+        sys.exit(exit_code)
+    if args.command == 'agent' and args.argument == 'run':
+        agent.serve(run)
+        return
     cmds(args, remaining)
     # print(args)
 
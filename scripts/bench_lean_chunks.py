@@ -0,0 +1,93 @@
+"""
+块列表分发的效果：生成两个相邻版本的 SDK 归档（新版本修改、新增、删除少量成员），
+统计切分速度，以及客户端已有旧版本时拼出新版本需要从服务器读取的字节比例。
+
+用法: python scripts/bench_lean_chunks.py [--members N] [--size MB] [--changed N] [--format zip|tar]
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import tarfile
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gits import lean_chunks
+
+
+def build_archive(members, archive_format):
+    buffer = io.BytesIO()
+    if archive_format == 'zip':
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as archive:
+            for name, data in members.items():
+                archive.writestr(zipfile.ZipInfo(name, (2024, 1, 1, 0, 0, 0)), data)
+    else:
+        with tarfile.open(fileobj=buffer, mode='w') as archive:
+            for name, data in members.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def blocks(data):
+    for offset in range(0, len(data), lean_chunks.CHUNK_FEED_SIZE):
+        yield data[offset:offset + lean_chunks.CHUNK_FEED_SIZE]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--members', type=int, default=300)
+    parser.add_argument('--size', type=int, default=256, help='archive size in MB (approximate)')
+    parser.add_argument('--changed', type=int, default=5, help='members modified in the new version')
+    parser.add_argument('--format', choices=['zip', 'tar'], default='zip')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    average = args.size * 1024 * 1024 // args.members
+    old_members = {f"sdk/bin/lib{i}.so": os.urandom(rng.randint(average // 4, average * 7 // 4))
+                   for i in range(args.members)}
+    new_members = dict(old_members)
+    for name in rng.sample(sorted(old_members), args.changed):
+        new_members[name] = os.urandom(len(old_members[name]))
+    del new_members[sorted(old_members)[1]]
+    new_members["sdk/include/version.h"] = b"#define SDK_VERSION 2\n"
+
+    old_archive = build_archive(old_members, args.format)
+    new_archive = build_archive(new_members, args.format)
+
+    start = time.perf_counter()
+    old_index = lean_chunks.build_chunk_index(blocks(old_archive), args.format, len(old_archive), 0)
+    elapsed = time.perf_counter() - start
+    new_index = lean_chunks.build_chunk_index(blocks(new_archive), args.format, len(new_archive), 0)
+    print(f"Chunking: {len(old_archive) / 1024 / 1024:.0f} MB in {elapsed:.2f}s "
+          f"({len(old_archive) / 1024 / 1024 / elapsed:.0f} MB/s), {len(old_index['chunks'])} chunks")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        old_path = os.path.join(tmp_dir, f"sdk@1.0.{args.format}")
+        with open(old_path, 'wb') as f:
+            f.write(old_archive)
+        local = lean_chunks.LocalChunks()
+        local.add_archive(old_path, old_index)
+        fetched = [0]
+
+        def fetch_range(offset, length):
+            fetched[0] += length
+            yield new_archive[offset:offset + length]
+
+        start = time.perf_counter()
+        rebuilt = b''.join(local.assemble(new_index, fetch_range)(0, len(new_archive)))
+        elapsed = time.perf_counter() - start
+        local.close()
+
+    assert rebuilt == new_archive
+    print(f"Rebuild: {elapsed:.2f}s, reused {local.reused / 1024 / 1024:.1f} MB, "
+          f"fetched {fetched[0] / 1024 / 1024:.1f} MB ({fetched[0] / len(new_archive):.1%} of the new version)")
+
+
+if __name__ == "__main__":
+    main()
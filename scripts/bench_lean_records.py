@@ -0,0 +1,84 @@
+"""
+lean 包记录的内存/速度对比：旧的 dict 记录 vs LeanPackage。
+
+用法: python scripts/bench_lean_records.py [条目数，默认 100000]
+"""
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from packaging.version import parse as parse_version
+from gits.lean_index import LeanPackage, is_valid_version
+
+COMPILERS = ["VS2019", "VS2022", "GCC12.3.0"]
+CHANNELS = ["stable", "common"]
+
+
+def generate_rows(count):
+    rows = []
+    for i in range(count):
+        name = f"package{i % 2000}"
+        version_str = f"{i % 7}.{i % 13}.{i % 50}"
+        compiler = COMPILERS[i % len(COMPILERS)]
+        channel = CHANNELS[i % len(CHANNELS)]
+        full_path = f"/srv/lean/ubuntu-22.04/{compiler}/{name}/{channel}/{name}@{version_str}.zip"
+        rows.append((name, version_str, compiler, channel, full_path, 1700000000.0 + i, 1024 * (i % 4096)))
+    return rows
+
+
+def build_dicts(rows):
+    packages = {}
+    for name, version_str, compiler, channel, full_path, mtime, size in rows:
+        packages.setdefault(name, []).append({
+            'version': parse_version(version_str),
+            'version_str': version_str,
+            'location': channel,
+            'compiler': compiler,
+            'full_path': full_path,
+            'time': datetime.fromtimestamp(mtime),
+            'size': size
+        })
+    return packages
+
+
+def build_records(rows):
+    packages = {}
+    for name, version_str, compiler, channel, full_path, mtime, size in rows:
+        if not is_valid_version(version_str): continue
+        packages.setdefault(name, []).append(
+            LeanPackage(name, version_str, compiler, full_path, mtime, location=channel, size=size))
+    return packages
+
+
+def measure(label, builder, rows, version_of):
+    tracemalloc.start()
+    start = time.perf_counter()
+    packages = builder(rows)
+    build_time = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # 模拟一次“每个包取最新版本”的解析，包含惰性解析版本号的开销
+    start = time.perf_counter()
+    for versions in packages.values():
+        max(versions, key=version_of)
+    resolve_time = time.perf_counter() - start
+
+    print(f"{label:<12} build {build_time * 1000:8.1f} ms   resolve {resolve_time * 1000:8.1f} ms   "
+          f"memory {current / 1024 / 1024:8.1f} MB")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rows = generate_rows(count)
+    print(f"{count} package entries")
+    measure("dict", build_dicts, rows, lambda v: v['version'])
+    measure("LeanPackage", build_records, rows, lambda v: v.version)
+
+
+if __name__ == "__main__":
+    main()
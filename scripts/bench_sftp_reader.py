@@ -0,0 +1,197 @@
+"""
+SFTP 读取方式的吞吐量对比：逐块同步读取 / paramiko sftp.get（每次回调都刷新进度）/ 流水线读取。
+
+在进程内启动一个 paramiko SFTP 服务器作为 lean 服务器的替身，客户端与服务器之间经过一个
+为每个方向注入 RTT/2 延迟的转发器，用来模拟 VPN 等高延迟链路。
+
+用法: python scripts/bench_sftp_reader.py [--size MB] [--rtt 毫秒] [--request-size KB] [--window N]
+"""
+import argparse
+import heapq
+import io
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import paramiko
+from utils.sftp import SFTP_REQUEST_SIZE, SFTP_WINDOW, pipelined_get
+
+USERNAME = "lean"
+PASSWORD = "lean"
+
+
+class _Server(paramiko.ServerInterface):
+    def check_auth_password(self, username, password):
+        if username == USERNAME and password == PASSWORD:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED if kind == "session" else paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+
+class _Handle(paramiko.SFTPHandle):
+    def stat(self):
+        return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+
+class _LocalSFTPServer(paramiko.SFTPServerInterface):
+    """只读的本地目录 SFTP 服务，路径直接使用本地绝对路径"""
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+        try:
+            handle = _Handle(flags)
+            handle.readfile = open(path, 'rb')
+            handle.filename = path
+            return handle
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+
+def _forward(source, target, delay):
+    """把 source 收到的数据延迟 delay 秒后转发给 target"""
+    pending = []
+    condition = threading.Condition()
+    closed = [False]
+
+    def reader():
+        while True:
+            try:
+                data = source.recv(65536)
+            except OSError:
+                data = b''
+            with condition:
+                if not data:
+                    closed[0] = True
+                else:
+                    heapq.heappush(pending, (time.monotonic() + delay, id(data), data))
+                condition.notify()
+            if not data:
+                return
+
+    def writer():
+        while True:
+            with condition:
+                while not pending and not closed[0]:
+                    condition.wait()
+                if not pending:
+                    break
+                due, _, data = pending[0]
+                wait = due - time.monotonic()
+                if wait > 0:
+                    condition.wait(wait)
+                    continue
+                heapq.heappop(pending)
+            try:
+                target.sendall(data)
+            except OSError:
+                break
+        try:
+            target.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+    for target_func in (reader, writer):
+        threading.Thread(target=target_func, daemon=True).start()
+
+
+def start_lean_standin(rtt):
+    """启动带延迟的 SFTP 替身，返回 (SFTPClient, 需要关闭的 Transport 列表)"""
+    client_sock, proxy_client_side = socket.socketpair()
+    proxy_server_side, server_sock = socket.socketpair()
+    _forward(proxy_client_side, proxy_server_side, rtt / 2)
+    _forward(proxy_server_side, proxy_client_side, rtt / 2)
+
+    server_transport = paramiko.Transport(server_sock)
+    server_transport.add_server_key(paramiko.RSAKey.generate(2048))
+    server_transport.set_subsystem_handler("sftp", paramiko.SFTPServer, _LocalSFTPServer)
+    # start_server 会一直阻塞到握手完成，需要与客户端并发进行
+    server_thread = threading.Thread(target=server_transport.start_server, kwargs={'server': _Server()}, daemon=True)
+    server_thread.start()
+
+    client_transport = paramiko.Transport(client_sock)
+    client_transport.connect(username=USERNAME, password=PASSWORD)
+    return paramiko.SFTPClient.from_transport(client_transport), [client_transport, server_transport]
+
+
+def sequential_read(sftp, remote, local):
+    """一次只有一个在途请求的读取方式"""
+    with sftp.open(remote, 'rb') as remote_file, open(local, 'wb') as local_file:
+        while True:
+            data = remote_file.read(SFTP_REQUEST_SIZE)
+            if not data:
+                break
+            local_file.write(data)
+
+
+def get_with_progress(sftp, remote, local):
+    """lean 原来的下载方式：sftp.get，每 32 KB 回调一次并打印进度条"""
+    total_size = sftp.stat(remote).st_size
+
+    def progress_bar(current, total):
+        percent = (current / total) * 100
+        block = int(50 * current // total)
+        print(f"\r[{'#' * block + '-' * (50 - block)}] {percent:.2f}%", end='')
+
+    with redirect_stdout(io.StringIO()):
+        sftp.get(remote, local, callback=lambda x, y: progress_bar(x, total_size))
+
+
+def measure(label, func, size):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<40} {elapsed:8.2f} s   {size / elapsed / 1024 / 1024:8.2f} MB/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=8, help='archive size in MB (default 8)')
+    parser.add_argument('--rtt', type=float, default=20, help='injected round-trip time in ms (default 20)')
+    parser.add_argument('--request-size', type=int, default=SFTP_REQUEST_SIZE // 1024, help='request size in KB')
+    parser.add_argument('--window', type=int, default=SFTP_WINDOW, help='outstanding read requests')
+    args = parser.parse_args()
+
+    size = args.size * 1024 * 1024
+    request_size = args.request_size * 1024
+    with tempfile.TemporaryDirectory() as work_dir:
+        remote = os.path.join(work_dir, "sdk@1.0.zip")
+        local = os.path.join(work_dir, "download.zip")
+        with open(remote, 'wb') as f:
+            f.write(os.urandom(size))
+
+        sftp, transports = start_lean_standin(args.rtt / 1000)
+        print(f"{args.size} MB archive, RTT {args.rtt:g} ms")
+        try:
+            measure("sequential read (1 request in flight)", lambda: sequential_read(sftp, remote, local), size)
+            measure("sftp.get + progress bar per callback", lambda: get_with_progress(sftp, remote, local), size)
+            measure(f"pipelined_get ({args.request_size} KB x {args.window})",
+                    lambda: pipelined_get(sftp, remote, local, callback=lambda x, y: None,
+                                          request_size=request_size, window=args.window), size)
+            with open(remote, 'rb') as a, open(local, 'rb') as b:
+                assert a.read() == b.read(), "pipelined_get produced a different file"
+        finally:
+            sftp.close()
+            for transport in transports:
+                transport.close()
+
+
+if __name__ == "__main__":
+    main()
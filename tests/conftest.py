@@ -0,0 +1,59 @@
+import hashlib
+import os
+import sys
+import zipfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gits import lean, lean_cache
+
+
+class DirectoryServer:
+    """测试用的 lean 服务器：直接读取本地目录，与 HTTP 后端一样不经过 SSH，下载时走完整的下载路径（不是本地文件系统后端）"""
+    is_direct = True
+
+    def stat(self, path):
+        return os.stat(path)
+
+    def open(self, path, mode='rb'):
+        return open(path, mode)
+
+
+@pytest.fixture
+def lean_root(tmp_path, monkeypatch):
+    """把 lean_local_path（以及其中的 .gis_cache）换到临时目录"""
+    root = tmp_path / "lean"
+    root.mkdir()
+    monkeypatch.setattr(lean, 'lean_local_path', str(root))
+    monkeypatch.setattr(lean_cache, 'lean_local_path', str(root))
+    return root
+
+
+@pytest.fixture
+def lean_config(monkeypatch):
+    """覆盖 gis 配置中的 lean 配置项：lean_config['lean_chunks'] = True"""
+    overrides = {}
+    show_config = lean.show_config
+    monkeypatch.setattr(lean, 'show_config', lambda conf=None: overrides[conf] if conf in overrides else show_config(conf))
+    return overrides
+
+
+@pytest.fixture
+def server_root(tmp_path):
+    root = tmp_path / "server"
+    (root / "GCC").mkdir(parents=True)
+    return root
+
+
+def write_zip(path, members):
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED) as archive:
+        for name, data in members.items():
+            archive.writestr(zipfile.ZipInfo(name, (2024, 1, 1, 0, 0, 0)), data)
+    return str(path)
+
+
+def file_sha256(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
@@ -0,0 +1,149 @@
+import argparse
+import os
+import socket
+import threading
+
+import pytest
+
+from conf import config
+from gits import agent, lean
+
+pytestmark = pytest.mark.skipif(not agent.is_supported(), reason="needs Unix domain sockets with SCM_RIGHTS")
+
+
+@pytest.fixture
+def agent_dir(tmp_path, monkeypatch):
+    path = tmp_path / "run"
+    path.mkdir(mode=0o700)
+    monkeypatch.setattr(agent, 'agent_dir', lambda: str(path))
+    monkeypatch.delenv(agent.NO_AGENT_ENV, raising=False)
+    return path
+
+
+def _null_fds():
+    return [os.open(os.devnull, os.O_RDWR) for _ in range(3)]
+
+
+def test_forward_refuses_socket_of_another_user(agent_dir, monkeypatch):
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(agent.socket_path())
+    listener.listen(1)
+    listener.setblocking(False)
+    uid = os.getuid()
+    monkeypatch.setattr(os, 'getuid', lambda: uid + 1)
+    try:
+        args = argparse.Namespace(command='lean', argument='search')
+        assert agent.forward(args, ['lean', 'search', 'zlib']) is None
+        with pytest.raises(BlockingIOError):
+            listener.accept()
+    finally:
+        listener.close()
+
+
+def test_nested_request_uses_caller_environment_and_keeps_caches(tmp_path, monkeypatch):
+    resets = []
+    monkeypatch.setattr(lean, 'reset_request_caches', lambda server_ttl=None: resets.append(server_ttl))
+    seen = []
+
+    def dispatch(argv):
+        seen.append((argv, os.getcwd(), os.environ.get('PATH'), os.environ.get('GIS_TEST_VALUE')))
+
+    server = agent.AgentServer(dispatch)
+    server._active_tokens.add('outer')
+    request = {'argv': ['import', 'zlib@1.2@GCC'], 'cwd': str(tmp_path), 'token': 'outer',
+               'env': {'PATH': '/caller/bin', 'GIS_TEST_VALUE': 'caller'}, 'version': config.VERSION}
+
+    client, conn = socket.socketpair()
+    with client:
+        fds = _null_fds()
+        agent._send_message(client, request, fds)
+        for fd in fds: os.close(fd)
+        thread = threading.Thread(target=server._handle_connection, args=(conn,))
+        thread.start()
+        assert agent._read_message(client) == {'exit': 0}
+        thread.join()
+
+    assert seen == [(['import', 'zlib@1.2@GCC'], str(tmp_path), '/caller/bin', 'caller')]
+    assert resets == []
+    assert os.environ.get('GIS_TEST_VALUE') is None
+
+    # 顶层请求开始时才重置请求级缓存
+    assert server._run_request(dict(request, token=None), _null_fds()) == 0
+    assert resets == [server.cache_ttl]
+
+
+def _fd_ids():
+    return [(os.fstat(fd).st_dev, os.fstat(fd).st_ino) for fd in (0, 1, 2)]
+
+
+def test_outer_request_restores_after_interrupted_nested_request(tmp_path, monkeypatch):
+    monkeypatch.setattr(lean, 'reset_request_caches', lambda server_ttl=None: None)
+    events = []
+    release = threading.Event()
+    threads = []
+
+    def dispatch(argv):
+        if argv[0] == 'import':
+            release.wait(5)
+            events.append('nested done')
+            return
+        # 外层命令以子进程方式调用 gis import，随后调用者断开、外层被中断，嵌套请求仍在执行
+        request = {'argv': ['import', 'zlib@1.2@GCC'], 'cwd': str(tmp_path), 'env': dict(os.environ),
+                   'token': os.environ[agent.TOKEN_ENV], 'version': config.VERSION}
+        client, conn = socket.socketpair()
+        fds = _null_fds()
+        agent._send_message(client, request, fds)
+        for fd in fds: os.close(fd)
+        thread = threading.Thread(target=server._handle_connection, args=(conn,))
+        thread.start()
+        threads.append((thread, client))
+        while not server._nested:
+            threading.Event().wait(0.01)
+        threading.Timer(0.2, release.set).start()
+        raise KeyboardInterrupt
+
+    server = agent.AgentServer(dispatch)
+    before = _fd_ids()
+    request = {'argv': ['lean', 'update'], 'cwd': str(tmp_path), 'env': dict(os.environ), 'token': None,
+               'version': config.VERSION}
+    assert server._run_request(request, _null_fds()) == 130
+    events.append('outer restored')
+    assert events == ['nested done', 'outer restored']
+    assert _fd_ids() == before
+    assert server._nested == 0 and not server._interruptible
+    for thread, client in threads:
+        thread.join()
+        assert agent._read_message(client) == {'exit': 0}
+        client.close()
+
+
+def test_interrupt_is_ignored_outside_running_command():
+    server = agent.AgentServer(lambda argv: None)
+    server._on_interrupt(None, None)
+    server._interruptible = True
+    with pytest.raises(KeyboardInterrupt):
+        server._on_interrupt(None, None)
+    server._on_interrupt(None, None)
+
+
+def test_busy_agent_lets_the_caller_run_the_command(tmp_path):
+    server = agent.AgentServer(lambda argv: None)
+    server._pending = 1
+    request = {'argv': ['lean', 'search', 'zlib'], 'cwd': str(tmp_path), 'env': {}, 'token': None,
+               'version': config.VERSION}
+    client, conn = socket.socketpair()
+    with client:
+        fds = _null_fds()
+        agent._send_message(client, request, fds)
+        for fd in fds: os.close(fd)
+        server._handle_connection(conn)
+        assert agent._read_message(client)['fallback'] is True
+    assert server._queue.empty()
+
+
+def test_nested_only_commands_are_forwarded_only_from_agent_requests(monkeypatch):
+    args = argparse.Namespace(command='delete')
+    monkeypatch.delenv(agent.TOKEN_ENV, raising=False)
+    assert not agent.should_forward(args)
+    monkeypatch.setenv(agent.TOKEN_ENV, 'token')
+    assert agent.should_forward(args)
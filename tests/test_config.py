@@ -0,0 +1,13 @@
+from gits import config
+
+
+def test_malformed_number_config_falls_back_to_default(monkeypatch, capsys):
+    values = {"lean_match_ttl": "ten minutes", "lean_scan_jobs": "0", "lean_search_ttl": ""}
+    monkeypatch.setattr(config, 'show_config', lambda conf=None: values.get(conf))
+    monkeypatch.setattr(config, '_WARNED_CONFIGS', set())
+
+    assert config.show_number_config("lean_match_ttl", 600, float) == 600
+    assert config.show_number_config("lean_match_ttl", 600, float) == 600
+    assert capsys.readouterr().out.count("Invalid value 'ten minutes' for lean_match_ttl") == 1
+    assert config.show_number_config("lean_scan_jobs", 4, minimum=1) == 1
+    assert config.show_number_config("lean_search_ttl", 600, float) == 600
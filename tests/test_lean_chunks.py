@@ -0,0 +1,62 @@
+import os
+
+from gits import lean, lean_chunks
+
+from conftest import DirectoryServer, file_sha256, write_zip
+
+
+def _publish(server_root, filename, members):
+    """在服务器目录中放入归档和 gis lean index 会发布的块列表"""
+    remote_path = write_zip(server_root / "GCC" / filename, members)
+    with open(remote_path, 'rb') as f:
+        data = f.read()
+    index = lean_chunks.build_chunk_index([data], 'zip', len(data), int(os.stat(remote_path).st_mtime))
+    with open(f"{remote_path}{lean_chunks.CHUNK_INDEX_SUFFIX}", 'wb') as f:
+        f.write(lean_chunks.dump_chunk_index(index))
+    return remote_path
+
+
+def test_new_version_reuses_chunks_of_installed_version(lean_root, server_root, lean_config, monkeypatch):
+    lean_config['lean_chunks'] = True
+    monkeypatch.setattr(lean_chunks, 'CHUNK_MIN_ARCHIVE', 0)
+    monkeypatch.setitem(lean._CHUNK_STATS, 'reused', 0)
+    monkeypatch.setitem(lean._CHUNK_STATS, 'fetched', 0)
+    members = {f"sdk/lib/lib{i}.so": os.urandom(128 * 1024) for i in range(16)}
+
+    old_path = _publish(server_root, "sdk@1.0.zip", members)
+    assert lean.download_package(DirectoryServer(), old_path, show_progress=False) == (2, "sdk@1.0@GCC")
+    assert lean._CHUNK_STATS['reused'] == 0
+
+    members["sdk/lib/lib3.so"] = os.urandom(128 * 1024)
+    new_path = _publish(server_root, "sdk@1.1.zip", members)
+    assert lean.download_package(DirectoryServer(), new_path, show_progress=False) == (2, "sdk@1.1@GCC")
+
+    new_size = os.path.getsize(new_path)
+    assert lean._CHUNK_STATS['reused'] > 0
+    assert lean._CHUNK_STATS['reused'] + lean._CHUNK_STATS['fetched'] == new_size
+    assert lean._CHUNK_STATS['fetched'] < new_size // 4
+    assert lean.load_package_digests()["sdk@1.1@GCC"]['sha256'] == file_sha256(new_path)
+    with open(lean_root / "sdk@1.1@GCC" / "lib" / "lib3.so", 'rb') as f:
+        assert f.read() == members["sdk/lib/lib3.so"]
+
+
+def test_chunks_of_packages_sharing_a_name_prefix_are_not_reused(lean_root, server_root, lean_config, monkeypatch):
+    lean_config['lean_chunks'] = True
+    monkeypatch.setattr(lean_chunks, 'CHUNK_MIN_ARCHIVE', 0)
+    monkeypatch.setitem(lean._CHUNK_STATS, 'reused', 0)
+    members = {f"lib/lib{i}.so": os.urandom(128 * 1024) for i in range(4)}
+
+    contrib_path = _publish(server_root, "opencv_contrib@4.0.zip", {f"opencv_contrib/{k}": v for k, v in members.items()})
+    assert lean.download_package(DirectoryServer(), contrib_path, show_progress=False) == (2, "opencv_contrib@4.0@GCC")
+    assert len(lean._load_local_chunks("opencv_contrib@4.1@GCC")) > 0
+    assert len(lean._load_local_chunks("opencv@4.0@GCC")) == 0
+
+    opencv_path = _publish(server_root, "opencv@4.0.zip", {f"opencv/{k}": v for k, v in members.items()})
+    assert lean.download_package(DirectoryServer(), opencv_path, show_progress=False) == (2, "opencv@4.0@GCC")
+    assert lean._CHUNK_STATS['reused'] == 0
+
+
+def test_chunk_records_are_skipped_without_kept_archives(lean_root, lean_config):
+    lean_config['lean_chunks'] = False
+    lean._record_local_chunks("sdk@1.0@GCC", "sdk@1.0.zip", {'size': 1, 'chunks': [[0, 1, "00"]]})
+    assert not os.path.exists(lean._local_chunk_record_path("sdk@1.0@GCC"))
@@ -0,0 +1,79 @@
+import pytest
+
+from gits import lean_concurrency
+from gits.lean_concurrency import AdaptiveConcurrency
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(lean_concurrency.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_limit_grows_while_throughput_improves(clock):
+    control = AdaptiveConcurrency(2, maximum=4)
+    slots = [control.acquire() for _ in range(2)]
+    clock[0] += AdaptiveConcurrency.SAMPLE_INTERVAL
+    control.progress(slots[0], 1000)
+    assert control.limit == 3
+
+    slots.append(control.acquire())
+    clock[0] += AdaptiveConcurrency.SAMPLE_INTERVAL
+    control.progress(slots[1], 2000)
+    assert control.limit == 4
+
+    # 吞吐没有提高（不到 GAIN_THRESHOLD），保持不变；到达上限后也不再增加
+    slots.append(control.acquire())
+    clock[0] += AdaptiveConcurrency.SAMPLE_INTERVAL
+    control.progress(slots[2], 2050)
+    assert control.limit == 4 and control.peak_limit == 4
+
+
+def test_limit_steps_back_when_throughput_drops(clock):
+    control = AdaptiveConcurrency(2, maximum=4)
+    slots = [control.acquire() for _ in range(2)]
+    clock[0] += AdaptiveConcurrency.SAMPLE_INTERVAL
+    control.progress(slots[0], 10000)
+    assert control.limit == 3
+    clock[0] += AdaptiveConcurrency.SAMPLE_INTERVAL
+    control.progress(slots[1], 1000)
+    assert control.limit == 2 and control.backoffs == 0
+
+
+def test_failures_halve_the_limit(clock):
+    control = AdaptiveConcurrency(8, maximum=8)
+    slot = control.acquire()
+    control.release(slot, ok=False)
+    assert control.limit == 8
+    clock[0] += AdaptiveConcurrency.SAMPLE_INTERVAL
+    control.record_failure()
+    assert control.limit == 4 and control.backoffs == 1
+
+    clock[0] += AdaptiveConcurrency.SAMPLE_INTERVAL
+    for _ in range(3):
+        control.record_failure()
+    assert control.limit == 2 and control.backoffs == 2
+
+
+def test_stalled_download_halves_the_limit_once(clock):
+    control = AdaptiveConcurrency(4, maximum=4)
+    stalled, active = control.acquire(), control.acquire()
+    clock[0] += AdaptiveConcurrency.STALL_SECONDS + 1
+    control.progress(active, 1000)
+    assert control.limit == 2 and stalled.stalled and control.backoffs == 1
+
+    # 同一个停滞的通道不会再次触发减半，之后照常加性增加
+    clock[0] += AdaptiveConcurrency.SAMPLE_INTERVAL
+    control.progress(active, 2000)
+    assert control.limit == 3 and control.backoffs == 1
+
+
+def test_fixed_concurrency_never_changes(clock):
+    control = AdaptiveConcurrency(3, minimum=3, maximum=3)
+    assert not control.adaptive
+    slots = [control.acquire() for _ in range(3)]
+    clock[0] += AdaptiveConcurrency.SAMPLE_INTERVAL
+    control.record_failure()
+    control.progress(slots[0], 1000)
+    assert control.limit == 3
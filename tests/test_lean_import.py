@@ -0,0 +1,36 @@
+import argparse
+
+from gits import lean
+
+
+class EmptyServer:
+    """没有 dep_tree 的 lean 服务器：列目录和打开文件都失败"""
+
+    def listdir_attr(self, path):
+        raise IOError(f"No such file: {path}")
+
+    def stat(self, path):
+        raise IOError(f"No such file: {path}")
+
+    def open(self, path, mode='rb'):
+        raise IOError(f"No such file: {path}")
+
+
+def test_import_dep_lean_imports_installed_packages(lean_root, server_root, tmp_path, monkeypatch):
+    (lean_root / "zlib@1.2@GCC").mkdir()
+    project = tmp_path / "project"
+    project.mkdir()
+    (project / "app.manifest").write_text("zlib==1.2\nmissing==0.1\n", encoding='utf-8')
+    monkeypatch.chdir(project)
+
+    monkeypatch.setattr(lean, '_CACHE_LOCAL_PACKAGES', None)
+    monkeypatch.setattr(lean, '_CACHE_MANIFEST_DEPS', {})
+    monkeypatch.setattr(lean, 'match_lean_remote', lambda: str(server_root))
+    monkeypatch.setattr(lean, 'get_sftp_session', lambda: EmptyServer())
+    commands = []
+    monkeypatch.setattr(lean.subprocess, 'run', lambda command, **kwargs: commands.append(command))
+
+    args = argparse.Namespace(manifest_filename="app.manifest", obj_name=None, spec=None, compiler=None)
+    lean.import_dep_lean(args)
+
+    assert commands == [['gis', 'import', 'zlib@1.2@GCC', '--to', 'cmake/app']]
@@ -0,0 +1,48 @@
+from packaging.version import Version
+
+from gits.lean_index import LeanPackage, PackageIndex, diff_snapshots
+
+
+def _package(name, version, compiler, channel):
+    return LeanPackage(name, version, compiler, f"/lean/{compiler}/{name}/{channel}/{name}@{version}.zip", 0,
+                       location=channel)
+
+
+def _index():
+    return PackageIndex({
+        "zlib": [_package("zlib", "1.10", "GCC", "stable"), _package("zlib", "1.9", "GCC", "stable"),
+                 _package("zlib", "1.11", "GCC", "common"), _package("zlib", "1.12", "VS2019", "stable")],
+        "png": [_package("png", "1.6", "VS2019", "common"), _package("png", "1.5", "VS2019", "common")],
+    })
+
+
+def test_find_exact_searches_the_given_compiler_then_all_compilers():
+    index = _index()
+    assert index.find_exact("zlib", Version("1.9"), "GCC").full_path == "/lean/GCC/zlib/stable/zlib@1.9.zip"
+    assert index.find_exact("zlib", Version("1.11"), "GCC").location == "common"
+    assert index.find_exact("zlib", Version("1.12"), "GCC") is None
+    assert index.find_exact("zlib", Version("1.12")).compiler == "VS2019"
+    assert index.find_exact("missing", Version("1.0")) is None
+
+
+def test_find_latest_prefers_stable_and_falls_back_to_common():
+    index = _index()
+    # 版本按 Version 比较（1.10 > 1.9），common 中更新的 1.11 不参与
+    assert index.find_latest("zlib", "GCC").version_str == "1.10"
+    assert index.find_latest("zlib").version_str == "1.12"
+    assert index.find_latest("png", "VS2019").version_str == "1.6"
+    assert index.find_latest("png", "GCC") is None
+    assert index.compilers("zlib") == ["GCC", "VS2019"]
+    assert "png" in index and len(index) == 2
+
+
+def test_diff_snapshots():
+    old = {"/a": ["a", "1.0", "GCC", "stable", 10, 100.0], "/b": ["b", "1.0", "GCC", "stable", 10, 100.0],
+           "/c": ["c", "1.0", "GCC", "stable", 10, 100.0]}
+    new = {"/a": ("a", "1.0", "GCC", "stable", 10, 100.0), "/b": ["b", "1.0", "GCC", "stable", 12, 200.0],
+           "/d": ["d", "2.0", "GCC", "common", 5, 300.0]}
+    added, removed, updated = diff_snapshots(old, new)
+    assert added == [new["/d"]]
+    assert removed == [old["/c"]]
+    assert updated == [(old["/b"], new["/b"])]
+    assert diff_snapshots(new, new) == ([], [], [])
@@ -0,0 +1,56 @@
+import os
+import threading
+import urllib.request
+
+from gits import lean, lean_peer
+
+from conftest import DirectoryServer, file_sha256, write_zip
+
+
+def _install(server_root, filename, members):
+    remote_path = write_zip(server_root / "GCC" / filename, members)
+    return remote_path, lean.download_package(DirectoryServer(), remote_path, show_progress=False)
+
+
+def test_archives_are_removed_unless_kept(lean_root, server_root, lean_config):
+    lean_config['lean_keep_archives'] = False
+    _install(server_root, "zlib@1.2.zip", {"zlib/VERSION": b"1.2"})
+    assert lean_peer.build_peer_index(str(lean_root), lean.load_package_digests())['packages'] == {}
+    assert not os.path.exists(lean.kept_archive_path("zlib@1.2@GCC", "zlib@1.2.zip"))
+    assert not os.path.exists(lean_root / "zlib@1.2.zip")
+
+
+def test_installed_archive_is_in_peer_index(lean_root, server_root, lean_config):
+    lean_config['lean_keep_archives'] = True
+    remote_path, (num, name) = _install(server_root, "zlib@1.2.zip", {"zlib/include/zlib.h": b"x" * 4096})
+    assert (num, name) == (2, "zlib@1.2@GCC")
+    assert os.path.isfile(lean_root / name / "include" / "zlib.h")
+
+    index = lean_peer.build_peer_index(str(lean_root), lean.load_package_digests())
+    record = index['packages'][name]
+    assert record['size'] == os.path.getsize(remote_path)
+    assert record['sha256'] == file_sha256(remote_path)
+
+    server = lean_peer.PeerServer(('127.0.0.1', 0), str(lean_root), lean.load_package_digests)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}{lean_peer.PEER_ARCHIVE_PREFIX}{record['archive']}"
+        with urllib.request.urlopen(url) as response:
+            body = response.read()
+    finally:
+        server.shutdown()
+        server.server_close()
+    with open(remote_path, 'rb') as f:
+        assert body == f.read()
+
+
+def test_only_recent_versions_are_kept(lean_root, server_root, lean_config):
+    lean_config['lean_keep_archives'] = True
+    for version in ("1.0", "1.1", "1.2"):
+        _install(server_root, f"zlib@{version}.zip", {"zlib/VERSION": version.encode()})
+
+    index = lean_peer.build_peer_index(str(lean_root), lean.load_package_digests())
+    assert sorted(index['packages']) == ["zlib@1.1@GCC", "zlib@1.2@GCC"]
+    kept = os.listdir(os.path.dirname(lean.kept_archive_path("zlib@1.0@GCC", "zlib@1.0.zip")))
+    assert sorted(kept) == ["zlib@1.1@GCC.zip", "zlib@1.2@GCC.zip"]
@@ -0,0 +1,78 @@
+import argparse
+import os
+from types import SimpleNamespace
+
+from gits import lean, lean_catalog, lean_transport
+
+from conftest import write_zip
+
+
+def _publish(server_root, compiler, name, version):
+    channel_dir = server_root / compiler / name / "stable"
+    channel_dir.mkdir(parents=True, exist_ok=True)
+    write_zip(channel_dir / f"{name}@{version}.zip", {f"{name}/VERSION": version.encode()})
+
+
+def test_cross_compiler_fallback_only_scans_compilers_with_the_package(lean_root, server_root, monkeypatch):
+    _publish(server_root, "GCC", "zlib", "1.2")
+    _publish(server_root, "VS2019", "onlyvs", "1.0")
+    _publish(server_root, "CLANG", "other", "2.0")
+    for cache in ('_CACHE_SERVER_PACKAGES', '_CACHE_SERVER_INDEX', '_CACHE_SERVER_COMPILERS'):
+        monkeypatch.setattr(lean, cache, {})
+    scanned = []
+    scan_shard = lean._scan_server_shard
+
+    def record_scan(lean_remote_path, compiler_dir, *args, **kwargs):
+        scanned.append(compiler_dir)
+        return scan_shard(lean_remote_path, compiler_dir, *args, **kwargs)
+
+    monkeypatch.setattr(lean, '_scan_server_shard', record_scan)
+    sftp, remote_path = lean_transport.LocalTransport(), str(server_root)
+
+    assert lean.resolve_server_package(sftp, remote_path, "zlib", None, "GCC").version_str == "1.2"
+    match = lean.resolve_server_package(sftp, remote_path, "onlyvs", None, "GCC")
+    assert (match.compiler, match.version_str) == ("VS2019", "1.0")
+    assert lean.resolve_server_package(sftp, remote_path, "missing", "1.0", "GCC") is None
+
+    assert lean.server_has_package(sftp, remote_path, "onlyvs", "GCC")
+    assert not lean.server_has_package(sftp, remote_path, "missing", "GCC")
+    assert sorted(set(scanned)) == ["GCC", "VS2019"]
+
+
+def test_stale_closure_falls_back_to_dep_files(lean_root, server_root, tmp_path, monkeypatch):
+    monkeypatch.setattr(lean, '_CACHE_MANIFEST_DEPS', {})
+    dep_tree = server_root / "dep_tree"
+    dep_tree.mkdir()
+    closure = lean_catalog.build_dep_closure({"app": ([("zlib", "1.2")], [])})
+    (dep_tree / lean_catalog.CLOSURE_FILENAME).write_bytes(lean_catalog.dump_catalog(closure))
+    os.utime(dep_tree / lean_catalog.CLOSURE_FILENAME, (1000, 1000))
+    # 生成闭包之后 app.dep 增加了一个依赖
+    (dep_tree / "app.dep").write_text("zlib==1.2\npng==1.6\n")
+    project = tmp_path / "project"
+    project.mkdir()
+    (project / "gis.manifest").write_text("app\n")
+
+    args = argparse.Namespace(target_manifests=["gis.manifest"])
+    requirements, _ = lean.get_lean_mainfest_packages(args, str(project), root_only=True,
+                                                      sftp=lean_transport.LocalTransport(),
+                                                      lean_remote_path=str(server_root))
+    assert {item['name'] for item in requirements} == {"app", "zlib", "png"}
+
+
+def test_warns_when_catalog_is_older_than_compiler_dirs(lean_root, server_root, monkeypatch, capsys):
+    _publish(server_root, "GCC", "zlib", "1.2")
+    for cache in ('_CACHE_SERVER_PACKAGES', '_CACHE_SERVER_INDEX'):
+        monkeypatch.setattr(lean, cache, {})
+    catalog = lean_catalog.build_catalog(str(server_root), {}, {})
+    (server_root / lean_catalog.CATALOG_FILENAME).write_bytes(lean_catalog.dump_catalog(catalog))
+    os.utime(server_root / lean_catalog.CATALOG_FILENAME, (1000, 1000))
+
+    assert lean.get_server_packages(lean_transport.LocalTransport(), str(server_root)) == {}
+    assert "GCC changed after gis-catalog.json" in capsys.readouterr().out
+
+
+def test_reuploaded_archive_with_same_digest_is_not_an_update():
+    target = SimpleNamespace(sha256="ab" * 32, mtime=2000)
+    local = SimpleNamespace(mtime=1000)
+    assert not lean._server_package_is_newer(target, "zlib@1.2@GCC", local, {"zlib@1.2@GCC": {'sha256': "ab" * 32}})
+    assert lean._server_package_is_newer(target, "zlib@1.2@GCC", local, {})
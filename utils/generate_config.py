@@ -15,7 +15,27 @@ default_config = {
         "lean_remote_user": "sia8",
         "lean_remote_pwd": "a8_win10_share",
         "lean_remote_path": r"C:\Users\sia8\zkcc\lean",
-        "lean_local_path": default_lean_path
+        "lean_local_path": default_lean_path,
+        "lean_remote_os_dir": "",
+        "lean_download_jobs": 4,
+        "lean_transport": "auto",
+        "lean_http_url": "",
+        "lean_peers": [],
+        "lean_keep_archives": False,
+        "lean_chunks": False,
+        "lean_chunk_index": False,
+        "lean_match_ttl": 600,
+        "lean_scan_jobs": 4,
+        "lean_search_ttl": 600,
+        "lean_sftp_request_size": 32768,
+        "lean_sftp_window": 64,
+        "lean_http_chunks": 4,
+        "lean_download_jobs_max": 8,
+        "lean_ssh_keepalive": 15,
+        "lean_reconnect_attempts": 5,
+        "lean_agent_idle_timeout": 1800,
+        "lean_agent_cache_ttl": 120,
+        "lean_serve_port": 8765
     },
 }
 
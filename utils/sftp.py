@@ -1,5 +1,13 @@
 import paramiko
 import os
+import time
+
+# 流水线读取参数：单个读请求的大小和同时在途的请求数（窗口）
+# 高延迟链路上吞吐量约为 窗口 * 请求大小 / 往返时间
+SFTP_REQUEST_SIZE = 32768
+SFTP_WINDOW = 64
+# 进度回调的最小间隔（秒）
+PROGRESS_INTERVAL = 0.2
 
 
 def sftp_upload(host, port, username, password, local, remote):
@@ -20,7 +28,71 @@ def sftp_download(host, port, username, password, local, remote):
     sftp = paramiko.SFTPClient.from_transport(sf)
     if os.path.isdir(local):  # 判断本地参数是目录还是文件
         for f in sftp.listdir(remote):  # 遍历远程目录
-            sftp.get(os.path.join(remote + f), os.path.join(local + f))  # 下载目录中文件
+            pipelined_get(sftp, os.path.join(remote + f), os.path.join(local + f))  # 下载目录中文件
     else:
-        sftp.get(remote, local)  # 下载文件
+        pipelined_get(sftp, remote, local)  # 下载文件
     sf.close()
+
+
+def throttle_progress(callback, interval=PROGRESS_INTERVAL):
+    """包装 callback(current, total)：最多每 interval 秒调用一次，传输完成时一定调用"""
+    last_call = [0.0]
+
+    def wrapper(current, total):
+        now = time.monotonic()
+        if current >= total or now - last_call[0] >= interval:
+            last_call[0] = now
+            callback(current, total)
+
+    return wrapper
+
+
+def iter_remote_read(remote_file, offset, length, request_size=SFTP_REQUEST_SIZE, window=SFTP_WINDOW):
+    """
+    从已打开的远程文件的 offset 开始按顺序读取 length 字节，逐块返回。
+    paramiko 的 SFTPFile 通过 readv 一次性排队全部读请求，最多 window 个同时在途，
+    不再是每 32 KB 一次往返；其他类文件对象退化为顺序 read。
+    """
+    chunks = []
+    position, end = offset, offset + length
+    while position < end:
+        size = min(request_size, end - position)
+        chunks.append((position, size))
+        position += size
+
+    if hasattr(remote_file, 'readv'):
+        # 默认最大请求是 32 KB，调大请求时需要同时调大，否则 readv 会重新拆分
+        remote_file.MAX_REQUEST_SIZE = max(request_size, remote_file.MAX_REQUEST_SIZE)
+        try:
+            blocks = remote_file.readv(chunks, window)
+        except TypeError:
+            # paramiko < 3.3 的 readv 不支持限制并发请求数
+            blocks = remote_file.readv(chunks)
+        for block in blocks:
+            if not block:
+                return
+            yield block
+        return
+
+    remote_file.seek(offset)
+    for _, size in chunks:
+        block = remote_file.read(size)
+        if not block:
+            return
+        yield block
+
+
+def pipelined_get(sftp, remote, local, callback=None, request_size=SFTP_REQUEST_SIZE, window=SFTP_WINDOW):
+    """sftp.get 的替代：流水线读取远程文件，进度回调限频；返回写入的字节数"""
+    total_size = sftp.stat(remote).st_size
+    progress = throttle_progress(callback) if callback else None
+    transferred = 0
+    with sftp.open(remote, 'rb') as remote_file, open(local, 'wb') as local_file:
+        for block in iter_remote_read(remote_file, 0, total_size, request_size, window):
+            local_file.write(block)
+            transferred += len(block)
+            if progress:
+                progress(transferred, total_size)
+    if transferred != total_size:
+        raise IOError(f"size mismatch, got {transferred} of {total_size} bytes")
+    return transferred